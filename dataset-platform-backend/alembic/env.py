@@ -34,6 +34,7 @@ try:
     import app.models.task  # noqa: F401
     import app.models.annotation  # noqa: F401
     import app.models.qc  # noqa: F401
+    import app.models.content_index  # noqa: F401
 except Exception:
     # Даже если autogenerate не нужен — миграции всё равно будут работать.
     pass
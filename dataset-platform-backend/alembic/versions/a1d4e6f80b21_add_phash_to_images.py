@@ -0,0 +1,26 @@
+"""add phash to images (idempotent)
+
+Revision ID: a1d4e6f80b21
+Revises: 3048769839f9
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "a1d4e6f80b21"
+down_revision = "3048769839f9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE images
+        ADD COLUMN IF NOT EXISTS phash VARCHAR(16);
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE images DROP COLUMN IF EXISTS phash;")
@@ -0,0 +1,26 @@
+"""add (image_id, updated_at desc, id desc) index to annotations (idempotent)
+
+Revision ID: a7d2e4c9b318
+Revises: f1c6d8e2a457
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "a7d2e4c9b318"
+down_revision = "f1c6d8e2a457"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_annotations_image_latest
+        ON annotations (image_id, updated_at DESC, id DESC);
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_annotations_image_latest;")
@@ -0,0 +1,48 @@
+"""add content_index table (idempotent)
+
+Revision ID: b4e1f7a9c302
+Revises: e8a4c2f6b915
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "b4e1f7a9c302"
+down_revision = "e8a4c2f6b915"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS content_index (
+            id SERIAL PRIMARY KEY,
+            sha256 VARCHAR(64) NOT NULL,
+            phash VARCHAR(16),
+            image_id INTEGER NOT NULL REFERENCES images (id),
+            request_id INTEGER NOT NULL REFERENCES requests (id),
+            image_count INTEGER NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            updated_at TIMESTAMP WITH TIME ZONE NOT NULL
+        );
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_content_index_id ON content_index (id);
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_content_index_sha256
+        ON content_index (sha256);
+        CREATE INDEX IF NOT EXISTS ix_content_index_phash ON content_index (phash);
+        CREATE INDEX IF NOT EXISTS ix_content_index_image_id
+        ON content_index (image_id);
+        CREATE INDEX IF NOT EXISTS ix_content_index_request_id
+        ON content_index (request_id);
+        CREATE INDEX IF NOT EXISTS ix_content_index_updated_at
+        ON content_index (updated_at);
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS content_index;")
@@ -0,0 +1,50 @@
+"""add delta/compact chain and input snapshot columns to exports (idempotent)
+
+Revision ID: b4e8f1a3c592
+Revises: a7d2e4c9b318
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "b4e8f1a3c592"
+down_revision = "a7d2e4c9b318"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE exports
+        ADD COLUMN IF NOT EXISTS kind VARCHAR(16) NOT NULL DEFAULT 'full',
+        ADD COLUMN IF NOT EXISTS base_export_id INTEGER REFERENCES exports (id),
+        ADD COLUMN IF NOT EXISTS rows INTEGER,
+        ADD COLUMN IF NOT EXISTS images_count INTEGER,
+        ADD COLUMN IF NOT EXISTS images_max_id INTEGER,
+        ADD COLUMN IF NOT EXISTS images_sha_sum VARCHAR(32),
+        ADD COLUMN IF NOT EXISTS annotations_watermark TIMESTAMP WITHOUT TIME ZONE,
+        ADD COLUMN IF NOT EXISTS qc_run_id INTEGER;
+
+        CREATE INDEX IF NOT EXISTS ix_exports_base_export_id
+        ON exports (base_export_id);
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        DROP INDEX IF EXISTS ix_exports_base_export_id;
+
+        ALTER TABLE exports
+        DROP COLUMN IF EXISTS qc_run_id,
+        DROP COLUMN IF EXISTS annotations_watermark,
+        DROP COLUMN IF EXISTS images_sha_sum,
+        DROP COLUMN IF EXISTS images_max_id,
+        DROP COLUMN IF EXISTS images_count,
+        DROP COLUMN IF EXISTS rows,
+        DROP COLUMN IF EXISTS base_export_id,
+        DROP COLUMN IF EXISTS kind;
+        """
+    )
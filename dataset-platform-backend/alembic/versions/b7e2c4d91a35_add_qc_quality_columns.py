@@ -0,0 +1,38 @@
+"""add images.quality, qc_results.scores, qc_runs.stats (idempotent)
+
+Revision ID: b7e2c4d91a35
+Revises: a1d4e6f80b21
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "b7e2c4d91a35"
+down_revision = "a1d4e6f80b21"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE images
+        ADD COLUMN IF NOT EXISTS quality JSON;
+
+        ALTER TABLE qc_results
+        ADD COLUMN IF NOT EXISTS scores JSON;
+
+        ALTER TABLE qc_runs
+        ADD COLUMN IF NOT EXISTS stats JSON;
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE qc_runs DROP COLUMN IF EXISTS stats;
+        ALTER TABLE qc_results DROP COLUMN IF EXISTS scores;
+        ALTER TABLE images DROP COLUMN IF EXISTS quality;
+        """
+    )
@@ -0,0 +1,41 @@
+"""add live progress columns to qc_runs (idempotent)
+
+Revision ID: c4f8a2e6b913
+Revises: b7e2c4d91a35
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "c4f8a2e6b913"
+down_revision = "b7e2c4d91a35"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE qc_runs
+        ADD COLUMN IF NOT EXISTS phase VARCHAR(32),
+        ADD COLUMN IF NOT EXISTS total_images INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS images_done INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS images_skipped INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS images_per_s DOUBLE PRECISION,
+        ADD COLUMN IF NOT EXISTS progress_at TIMESTAMPTZ;
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE qc_runs
+        DROP COLUMN IF EXISTS progress_at,
+        DROP COLUMN IF EXISTS images_per_s,
+        DROP COLUMN IF EXISTS images_skipped,
+        DROP COLUMN IF EXISTS images_done,
+        DROP COLUMN IF EXISTS total_images,
+        DROP COLUMN IF EXISTS phase;
+        """
+    )
@@ -0,0 +1,40 @@
+"""add qc_content_cache table (idempotent)
+
+Revision ID: c6a3d8e5f174
+Revises: b4e1f7a9c302
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "c6a3d8e5f174"
+down_revision = "b4e1f7a9c302"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS qc_content_cache (
+            id SERIAL PRIMARY KEY,
+            sha256 VARCHAR(64) NOT NULL,
+            component VARCHAR(32) NOT NULL,
+            version VARCHAR(128) NOT NULL,
+            value JSON NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            UNIQUE (sha256, component, version)
+        );
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_qc_content_cache_id ON qc_content_cache (id);
+        CREATE INDEX IF NOT EXISTS ix_qc_content_cache_sha256
+        ON qc_content_cache (sha256);
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS qc_content_cache;")
@@ -0,0 +1,35 @@
+"""add layout / params / files to exports (idempotent)
+
+Revision ID: c6f3a9d2e714
+Revises: b4e8f1a3c592
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "c6f3a9d2e714"
+down_revision = "b4e8f1a3c592"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE exports
+        ADD COLUMN IF NOT EXISTS layout VARCHAR(16) NOT NULL DEFAULT 'file',
+        ADD COLUMN IF NOT EXISTS params JSON,
+        ADD COLUMN IF NOT EXISTS files JSON;
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE exports
+        DROP COLUMN IF EXISTS files,
+        DROP COLUMN IF EXISTS params,
+        DROP COLUMN IF EXISTS layout;
+        """
+    )
@@ -0,0 +1,36 @@
+"""add input_digest to exports (idempotent)
+
+Revision ID: d3b9e5a1c847
+Revises: c6f3a9d2e714
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "d3b9e5a1c847"
+down_revision = "c6f3a9d2e714"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE exports
+        ADD COLUMN IF NOT EXISTS input_digest VARCHAR(64);
+
+        CREATE INDEX IF NOT EXISTS ix_exports_input_digest
+        ON exports (input_digest);
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        DROP INDEX IF EXISTS ix_exports_input_digest;
+
+        ALTER TABLE exports
+        DROP COLUMN IF EXISTS input_digest;
+        """
+    )
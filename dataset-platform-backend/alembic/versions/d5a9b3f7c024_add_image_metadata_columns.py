@@ -0,0 +1,43 @@
+"""add header metadata columns to images (idempotent)
+
+Revision ID: d5a9b3f7c024
+Revises: c4f8a2e6b913
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "d5a9b3f7c024"
+down_revision = "c4f8a2e6b913"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE images
+        ADD COLUMN IF NOT EXISTS width INTEGER,
+        ADD COLUMN IF NOT EXISTS height INTEGER,
+        ADD COLUMN IF NOT EXISTS image_format VARCHAR(16),
+        ADD COLUMN IF NOT EXISTS orientation SMALLINT,
+        ADD COLUMN IF NOT EXISTS meta_extracted_at TIMESTAMPTZ;
+
+        CREATE INDEX IF NOT EXISTS ix_images_meta_extracted_at
+        ON images (meta_extracted_at);
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        DROP INDEX IF EXISTS ix_images_meta_extracted_at;
+        ALTER TABLE images
+        DROP COLUMN IF EXISTS meta_extracted_at,
+        DROP COLUMN IF EXISTS orientation,
+        DROP COLUMN IF EXISTS image_format,
+        DROP COLUMN IF EXISTS height,
+        DROP COLUMN IF EXISTS width;
+        """
+    )
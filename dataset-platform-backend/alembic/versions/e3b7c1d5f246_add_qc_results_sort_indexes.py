@@ -0,0 +1,38 @@
+"""add composite sort indexes to qc_results (idempotent)
+
+Revision ID: e3b7c1d5f246
+Revises: d5a9b3f7c024
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "e3b7c1d5f246"
+down_revision = "d5a9b3f7c024"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_qc_results_run_dup
+        ON qc_results (qc_run_id, duplicate_score, id);
+
+        CREATE INDEX IF NOT EXISTS ix_qc_results_run_ai
+        ON qc_results (qc_run_id, ai_generated_score, id);
+
+        CREATE INDEX IF NOT EXISTS ix_qc_results_run_image
+        ON qc_results (qc_run_id, image_id);
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        DROP INDEX IF EXISTS ix_qc_results_run_image;
+        DROP INDEX IF EXISTS ix_qc_results_run_ai;
+        DROP INDEX IF EXISTS ix_qc_results_run_dup;
+        """
+    )
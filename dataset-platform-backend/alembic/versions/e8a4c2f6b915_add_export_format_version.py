@@ -0,0 +1,31 @@
+"""add format_version to exports (idempotent)
+
+Revision ID: e8a4c2f6b915
+Revises: d3b9e5a1c847
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "e8a4c2f6b915"
+down_revision = "d3b9e5a1c847"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE exports
+        ADD COLUMN IF NOT EXISTS format_version INTEGER;
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE exports
+        DROP COLUMN IF EXISTS format_version;
+        """
+    )
@@ -0,0 +1,37 @@
+"""add image set / config fingerprint to qc_runs (idempotent)
+
+Revision ID: f1c6d8e2a457
+Revises: e3b7c1d5f246
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "f1c6d8e2a457"
+down_revision = "e3b7c1d5f246"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE qc_runs
+        ADD COLUMN IF NOT EXISTS images_count INTEGER,
+        ADD COLUMN IF NOT EXISTS images_max_id INTEGER,
+        ADD COLUMN IF NOT EXISTS images_sha_sum VARCHAR(32),
+        ADD COLUMN IF NOT EXISTS config_digest VARCHAR(64);
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE qc_runs
+        DROP COLUMN IF EXISTS config_digest,
+        DROP COLUMN IF EXISTS images_sha_sum,
+        DROP COLUMN IF EXISTS images_max_id,
+        DROP COLUMN IF EXISTS images_count;
+        """
+    )
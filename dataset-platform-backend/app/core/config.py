@@ -72,6 +72,85 @@ class Settings(BaseSettings):
     s3_bucket_exports: str = "exports"
     s3_presign_expires_s: int = 600
 
+    # ---------- QC ----------
+    # максимальное расстояние Хэмминга (из 64 бит dHash) для near-duplicate
+    qc_phash_max_distance: int = 6
+    # fan-out: images на чанк и максимум параллельных цепочек чанков (QCRun.params)
+    qc_chunk_size: int = 1000
+    qc_parallelism: int = 4
+    # streaming чтение картинок (image_source): параллельные GET,
+    # лимит скачанных-но-не-обработанных байт и размер батча decoded images
+    qc_read_concurrency: int = 16
+    qc_read_max_bytes_in_flight: int = 256 * 1024 * 1024
+    qc_read_batch_size: int = 64
+    # детекторы качества по умолчанию (QCRun.params["detectors"] переопределяет)
+    qc_detectors: str = "blur,exposure,resolution"
+    # сторона квадрата (grayscale), к которому приводятся картинки для детекторов
+    qc_detector_side: int = 256
+    # ai_generated_score: "none" | "stub" | "onnx" (QCRun.params["ai_scorer"] переопределяет)
+    qc_ai_scorer: str = "none"
+    qc_ai_model_path: str = ""
+    qc_ai_input_size: int = 224
+    qc_ai_batch_size: int = 32
+    # intra-op потоки onnxruntime на один процесс воркера (prefork: x concurrency)
+    qc_ai_threads: int = 1
+    # для выхода (N, C): индекс класса "AI-generated"
+    qc_ai_positive_index: int = 1
+    # строк в одном RecordBatch при Arrow/Parquet-выдаче /qc/results (server-side cursor)
+    qc_results_arrow_batch_rows: int = 50000
+
+    # ---------- Фоновые задачи ----------
+    # как часто QC/export проверяют отмену между батчами (SELECT status по PK)
+    job_cancel_check_s: float = 1.0
+
+    # ---------- Export ----------
+    # заявки до стольких images экспортируются прямо в HTTP-запросе, больше — Celery
+    export_sync_max_images: int = 500
+    # строк в батче server-side cursor = row group parquet
+    export_batch_rows: int = 50000
+    # GET /export/stream (без S3): заявки до стольких images; больше — POST export
+    export_stream_max_images: int = 200000
+    # строк в батче/row group потока: столько строк API держит в памяти на ответ
+    export_stream_batch_rows: int = 10000
+    # размер part multipart upload (>= 5 MB): столько export держит в памяти
+    export_part_bytes: int = 16 * 1024 * 1024
+    # кодирование parquet по умолчанию (в API — codec, compression_level, ...)
+    export_parquet_codec: str = "zstd"
+    export_parquet_compression_level: int | None = None
+    export_parquet_dictionary: bool = True
+    # min/max по row group и page index
+    export_parquet_statistics: bool = True
+    # Bloom filters на image_id и sha256 (точечный поиск в Spark/DuckDB/Trino)
+    export_parquet_bloom_filter: bool = False
+    # layout=dataset: файл партиции закрывается, когда дорос до стольких байт
+    export_target_file_bytes: int = 256 * 1024 * 1024
+    # split (колонка split, partition_by=split): доли по умолчанию (в API — split_ratios)
+    export_split_ratios: dict[str, float] = {"train": 0.8, "val": 0.1, "test": 0.1}
+    # layout=webdataset: размер tar shard по умолчанию (в API — shard_mb)
+    export_shard_bytes: int = 1024 * 1024 * 1024
+    # параллельные GET картинок и сколько байт скачанного может ждать записи
+    export_fetch_concurrency: int = 16
+    export_fetch_max_bytes_in_flight: int = 256 * 1024 * 1024
+    # параллельные UploadPart shards (в памяти до 2x столько parts)
+    export_upload_concurrency: int = 4
+    # delta берёт annotations с updated_at > watermark - margin: updated_at ставит
+    # часы приложения до commit, annotation, закоммиченная после снимка, может быть
+    # старше его watermark. Больше самой долгой транзакции разметки + рассинхрон часов
+    export_delta_watermark_margin_s: int = 600
+    # retention (export_retention): done exports на заявку, которые держим
+    # (0 — без ограничения); старые дубли (тот же input_digest) удаляются всегда
+    export_retention_keep_last: int = 5
+    # моложе не удаляются: по их presigned URL могут ещё качать
+    export_retention_min_age_s: int = 3600
+
+    # ---------- Image metadata ingest ----------
+    # первый Range GET; если заголовок не поместился — удваиваем до max
+    image_meta_head_bytes: int = 64 * 1024
+    image_meta_max_bytes: int = 1024 * 1024
+    image_meta_batch_size: int = 200
+    # задержка задачи после confirm: подтверждения одной заливки собираются в батч
+    image_meta_countdown_s: int = 5
+
 
 settings = Settings()
 
@@ -91,5 +170,6 @@ def get_s3_client() -> S3Client:
         bucket_images=settings.s3_bucket_images,
         bucket_exports=settings.s3_bucket_exports,
         presign_expires_s=settings.s3_presign_expires_s,
+        max_pool_connections=max(10, settings.qc_read_concurrency * 2),
     )
     return S3Client(cfg)
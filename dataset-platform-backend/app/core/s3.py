@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
 from typing import Any, Optional
 from urllib.parse import urlparse, urlunparse
@@ -9,6 +11,16 @@ from botocore.config import Config as BotoConfig
 from botocore.exceptions import ClientError
 
 
+def parse_s3_uri(uri: str) -> tuple[str, str]:
+    """s3://bucket/key -> (bucket, key)"""
+    if not uri.startswith("s3://"):
+        raise ValueError(f"Not an s3:// uri: {uri}")
+    bucket, _, key = uri[len("s3://") :].partition("/")
+    if not bucket or not key:
+        raise ValueError(f"Invalid s3 uri: {uri}")
+    return bucket, key
+
+
 @dataclass(frozen=True)
 class S3Config:
     # INTERNAL: доступно из контейнеров (minio:9000 или host.docker.internal:9000)
@@ -23,6 +35,161 @@ class S3Config:
     bucket_images: str
     bucket_exports: str
     presign_expires_s: int = 600
+    # пул HTTP-соединений boto3 (default 10) — должен покрывать параллельные GET
+    max_pool_connections: int = 32
+
+
+class S3UploadPool:
+    """
+    Потоки для UploadPart, общие для нескольких S3MultipartWriter: parts уходят
+    в S3 параллельно, пока производитель пишет дальше. submit ждёт, если в
+    полёте уже max_in_flight parts, — память ~ max_in_flight * part_size.
+    """
+
+    def __init__(self, max_workers: int, max_in_flight: int | None = None) -> None:
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, max_workers), thread_name_prefix="s3-upload"
+        )
+        self._slots = threading.BoundedSemaphore(max(1, max_in_flight or max_workers))
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        self._slots.acquire()
+        try:
+            fut = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        fut.add_done_callback(lambda _: self._slots.release())
+        return fut
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "S3UploadPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+
+
+class S3MultipartWriter:
+    """
+    Write-only file-like поверх S3 multipart upload: копит part_size байт и
+    отправляет UploadPart, close() -> CompleteMultipartUpload. Память —
+    один part, независимо от размера объекта. Меньше одного part — обычный PUT.
+    Ошибка внутри with -> AbortMultipartUpload (недописанные parts не копятся).
+    С pool (S3UploadPool) UploadPart идут в фоне, close() дожидается их.
+    """
+
+    # минимум S3 для всех parts, кроме последнего
+    MIN_PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        key: str,
+        content_type: str,
+        part_size: int,
+        pool: S3UploadPool | None = None,
+    ) -> None:
+        self._client = client
+        self._pool = pool
+        self._pending: list[Future] = []
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type or "application/octet-stream"
+        self.part_size = max(self.MIN_PART_SIZE, int(part_size))
+        self._buf = bytearray()
+        self._upload_id: str | None = None
+        self._parts: list[dict[str, Any]] = []
+        self.bytes_written = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed S3MultipartWriter")
+        self._buf += data
+        self.bytes_written += len(data)
+        while len(self._buf) >= self.part_size:
+            self._upload_part(bytes(self._buf[: self.part_size]))
+            del self._buf[: self.part_size]
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def _upload_part(self, body: bytes) -> None:
+        if self._upload_id is None:
+            resp = self._client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, ContentType=self.content_type
+            )
+            self._upload_id = resp["UploadId"]
+        number = len(self._parts) + len(self._pending) + 1
+        if self._pool is not None:
+            self._pending.append(self._pool.submit(self._put_part, number, body))
+        else:
+            self._parts.append(self._put_part(number, body))
+
+    def _put_part(self, number: int, body: bytes) -> dict[str, Any]:
+        resp = self._client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=number,
+            Body=body,
+        )
+        return {"PartNumber": number, "ETag": resp["ETag"]}
+
+    def _collect_parts(self) -> None:
+        pending, self._pending = self._pending, []
+        self._parts += [f.result() for f in pending]
+        self._parts.sort(key=lambda p: p["PartNumber"])
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        if self._upload_id is None:
+            self._client.put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=bytes(self._buf),
+                ContentType=self.content_type,
+            )
+        else:
+            if self._buf:
+                self._upload_part(bytes(self._buf))
+            self._collect_parts()
+            self._client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": self._parts},
+            )
+        self._buf = bytearray()
+
+    def abort(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self._buf = bytearray()
+        # parts в полёте должны закончиться до Abort, иначе переживут его
+        wait(self._pending)
+        self._pending = []
+        if self._upload_id is not None:
+            self._client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+            )
+
+    def __enter__(self) -> "S3MultipartWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
 
 
 class S3Client:
@@ -41,6 +208,7 @@ class S3Client:
             config=BotoConfig(
                 signature_version="s3v4",
                 s3={"addressing_style": "path"},
+                max_pool_connections=self.cfg.max_pool_connections,
             ),
         )
 
@@ -84,7 +252,7 @@ class S3Client:
     def ensure_bucket_exports(self) -> None:
         self.ensure_bucket(self.cfg.bucket_exports)
 
-    # ---------- PUT/HEAD ----------
+    # ---------- PUT/GET/HEAD ----------
     def put_bytes(
         self, *, bucket: str, key: str, data: bytes, content_type: str
     ) -> None:
@@ -96,9 +264,79 @@ class S3Client:
             ContentType=content_type or "application/octet-stream",
         )
 
+    def open_multipart(
+        self,
+        *,
+        bucket: str,
+        key: str,
+        content_type: str,
+        part_size: int,
+        pool: S3UploadPool | None = None,
+    ) -> S3MultipartWriter:
+        """Потоковая запись объекта (см. S3MultipartWriter)."""
+        self.ensure_bucket(bucket)
+        return S3MultipartWriter(
+            self._client_internal, bucket, key, content_type, part_size, pool=pool
+        )
+
+    def delete_objects(self, *, bucket: str, keys: list[str]) -> None:
+        """DeleteObjects пачками по 1000 (лимит S3); отсутствующие ключи — не ошибка."""
+        for i in range(0, len(keys), 1000):
+            self._client_internal.delete_objects(
+                Bucket=bucket,
+                Delete={
+                    "Objects": [{"Key": k} for k in keys[i : i + 1000]],
+                    "Quiet": True,
+                },
+            )
+
+    def list_keys(self, *, bucket: str, prefix: str) -> list[str]:
+        """Все ключи под prefix (ListObjectsV2 постранично)."""
+        paginator = self._client_internal.get_paginator("list_objects_v2")
+        return [
+            obj["Key"]
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+            for obj in page.get("Contents", [])
+        ]
+
+    def get_bytes(self, *, bucket: str, key: str) -> bytes:
+        resp = self._client_internal.get_object(Bucket=bucket, Key=key)
+        return resp["Body"].read()
+
+    def get_stream(self, *, bucket: str, key: str) -> tuple[Any, int]:
+        """
+        Streaming GET: (StreamingBody, ContentLength).
+        Тело ещё не прочитано — читать body.read()/iter_chunks(), потом body.close().
+        """
+        resp = self._client_internal.get_object(Bucket=bucket, Key=key)
+        return resp["Body"], int(resp.get("ContentLength") or 0)
+
+    def get_range(self, *, bucket: str, key: str, start: int, length: int) -> bytes:
+        """Ranged GET: байты [start, start + length). Пустой объект -> b""."""
+        try:
+            resp = self._client_internal.get_object(
+                Bucket=bucket, Key=key, Range=f"bytes={start}-{start + length - 1}"
+            )
+        except ClientError as e:
+            code = str(e.response.get("Error", {}).get("Code", ""))
+            if code in ("416", "InvalidRange"):
+                return b""
+            raise
+        return resp["Body"].read()
+
     def head_object(self, *, bucket: str, key: str) -> dict[str, Any]:
         return self._client_internal.head_object(Bucket=bucket, Key=key)
 
+    def object_exists(self, bucket: str, key: str) -> bool:
+        try:
+            self.head_object(bucket=bucket, key=key)
+            return True
+        except ClientError as e:
+            code = str(e.response.get("Error", {}).get("Code", ""))
+            if code in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
     def head_images(self, key: str) -> dict[str, Any]:
         return self.head_object(bucket=self.cfg.bucket_images, key=key)
 
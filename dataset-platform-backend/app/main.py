@@ -10,7 +10,8 @@ from app.models.annotation import Annotation  # noqa: F401
 from app.models.task import Task, TaskImage  # noqa: F401
 from app.models.export import Export  # noqa: F401
 from app.models.image import Image  # noqa: F401
-from app.models.qc import QCRun, QCResult  # noqa: F401
+from app.models.qc import QCRun, QCResult, QCContentCache  # noqa: F401
+from app.models.content_index import ContentIndexEntry  # noqa: F401
 
 
 from app.routers.auth import router as auth_router
@@ -1,17 +1,20 @@
 # dataset-platform-backend/app/models/__init__.py
 
 from .annotation import Annotation
+from .content_index import ContentIndexEntry
 from app.models.export import (
     Export as Export,
 )  # Explicit re-export as Export  # Explicit re-export
-from .qc import QCRun, QCResult
+from .qc import QCContentCache, QCResult, QCRun
 from .request import Request
 from .task import Task, TaskImage
 from .user import User
 
 __all__ = [
     "Annotation",
+    "ContentIndexEntry",
     "Export",
+    "QCContentCache",
     "QCRun",
     "QCResult",
     "Request",
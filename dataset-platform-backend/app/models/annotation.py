@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 from typing import List
-from sqlalchemy import DateTime, ForeignKey, Integer, JSON
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, JSON
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db.session import Base
@@ -23,3 +23,12 @@ class Annotation(Base):
     updated_at: Mapped[datetime] = mapped_column(
         DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
     )
+
+
+# последняя annotation на image (DISTINCT ON в export_query) без сортировки
+Index(
+    "ix_annotations_image_latest",
+    Annotation.image_id,
+    Annotation.updated_at.desc(),
+    Annotation.id.desc(),
+)
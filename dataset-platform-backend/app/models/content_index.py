@@ -0,0 +1,35 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import DateTime, ForeignKey, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.session import Base
+
+
+class ContentIndexEntry(Base):
+    """
+    Глобальный (по всем заявкам) индекс контента: одна строка на sha256,
+    указывает на самый ранний image с этими байтами.
+    """
+
+    __tablename__ = "content_index"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    sha256: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    # dHash canonical image (заполняется после QC), для exact-phash поиска
+    phash: Mapped[str | None] = mapped_column(String(16), nullable=True, index=True)
+
+    image_id: Mapped[int] = mapped_column(ForeignKey("images.id"), index=True)
+    request_id: Mapped[int] = mapped_column(ForeignKey("requests.id"), index=True)
+    # сколько images (во всех заявках) с этим sha256; > 1 — контент встречался повторно
+    image_count: Mapped[int] = mapped_column(Integer, default=1)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+    # watermark для инкрементального обновления Bloom-фильтров в процессах
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        index=True,
+    )
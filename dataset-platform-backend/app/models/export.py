@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 
-from sqlalchemy import Integer, String, ForeignKey, DateTime, Text
+from sqlalchemy import JSON, Integer, String, ForeignKey, DateTime, Text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db.session import Base
@@ -14,11 +14,45 @@ class Export(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     request_id: Mapped[int] = mapped_column(ForeignKey("requests.id"), index=True)
 
+    # queued / running / done / failed / cancelled; expired — объекты удалены
+    # retention (export_retention), строка осталась для истории
     status: Mapped[str] = mapped_column(String, default="queued", index=True)
+    # full — весь датасет; delta — только изменённые с base_export_id строки;
+    # compact — full, свёрнутый из цепочки base + deltas (base_export_id — её голова)
+    kind: Mapped[str] = mapped_column(String(16), default="full", server_default="full")
+    base_export_id: Mapped[int | None] = mapped_column(
+        ForeignKey("exports.id"), nullable=True, index=True
+    )
+    # file — один parquet; dataset — Hive-partitioned файлы под префиксом;
+    # webdataset — tar shards с картинками + index.parquet под префиксом
+    # (storage_path оканчивается на "/", список файлов — в files)
+    layout: Mapped[str] = mapped_column(
+        String(16), default="file", server_default="file"
+    )
+    # опции экспорта из API (partition_by, target_file_bytes, shard_bytes, ...)
+    params: Mapped[dict] = mapped_column(JSON, default=dict)
+    # export_engine.EXPORT_FORMAT_VERSION, которой записаны файлы (NULL — 1)
+    format_version: Mapped[int | None] = mapped_column(Integer, nullable=True)
     celery_task_id: Mapped[str | None] = mapped_column(String, nullable=True)
     storage_path: Mapped[str | None] = mapped_column(String, nullable=True)
 
     error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    rows: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    files: Mapped[list | None] = mapped_column(JSON, nullable=True)
+
+    # снимок входа на момент экспорта — от него считается следующая delta
+    images_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    images_max_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    images_sha_sum: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    annotations_watermark: Mapped[datetime | None] = mapped_column(
+        DateTime, nullable=True
+    )
+    qc_run_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # ExportSnapshot.digest: sha256 входа + опций; done export с тем же digest
+    # переиспользуется вместо сборки (NULL — не переиспользуется: compact, старые)
+    input_digest: Mapped[str | None] = mapped_column(
+        String(64), nullable=True, index=True
+    )
 
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
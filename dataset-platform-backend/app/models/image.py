@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import String, Integer, ForeignKey, DateTime
+from sqlalchemy import JSON, String, Integer, ForeignKey, DateTime, SmallInteger
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db.session import Base
@@ -18,6 +18,21 @@ class Image(Base):
     )
     storage_path: Mapped[str] = mapped_column(String(500))
     sha256: Mapped[str] = mapped_column(String(64), index=True)
+    # dHash (64 бита, hex). Считается в QC, nullable пока не посчитан.
+    phash: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    # сырые метрики детекторов качества: {name: {"v": version, ...}}
+    quality: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+
+    # метаданные из заголовка файла (ingest по Range GET, см. worker/image_meta.py)
+    width: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    height: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    image_format: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    # EXIF Orientation (1..8), None — нет EXIF/тега
+    orientation: Mapped[int | None] = mapped_column(SmallInteger, nullable=True)
+    # когда разбирали заголовок; None — ещё в очереди (width=None после — не разобрался)
+    meta_extracted_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True, index=True
+    )
 
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
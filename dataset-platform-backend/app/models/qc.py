@@ -1,6 +1,8 @@
 from datetime import datetime, timezone
 
 from sqlalchemy import (
+    Index,
+    UniqueConstraint,
     Integer,
     String,
     ForeignKey,
@@ -25,11 +27,34 @@ class QCRun(Base):
     # FIX: правильный дефолт
     status: Mapped[str] = mapped_column(
         String(32), default="queued", index=True
-    )  # queued/running/done/failed
+    )  # queued/running/done/failed/cancelled
 
     params: Mapped[dict] = mapped_column(JSON, default=dict)
+    # метрики выполнения: {"timings": {stage: seconds}, "images": n, ...}
+    stats: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+
+    # live progress (обновляется воркерами по батчам, /qc/status читает как есть)
+    phase: Mapped[str | None] = mapped_column(
+        String(32), nullable=True
+    )  # prepare/scan/merge/done
+    total_images: Mapped[int] = mapped_column(Integer, default=0)
+    # готово, включая images_skipped (не нужно качать: кэш/reuse/точные дубли)
+    images_done: Mapped[int] = mapped_column(Integer, default=0)
+    images_skipped: Mapped[int] = mapped_column(Integer, default=0)
+    # скорость scan-стадии по wall clock (все воркеры вместе) — для ETA
+    images_per_s: Mapped[float | None] = mapped_column(Float, nullable=True)
+    progress_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
     error: Mapped[str | None] = mapped_column(String(500), nullable=True)
 
+    # отпечаток набора images и конфигурации на старте run (см. qc_fingerprint):
+    # совпали с последним done — POST /qc/run его и вернёт
+    images_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    images_max_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    images_sha_sum: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    config_digest: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
     # OPTIONAL but recommended: created_at отдельно, чтобы started_at был именно "когда реально стартовали"
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
@@ -47,6 +72,12 @@ class QCRun(Base):
 
 class QCResult(Base):
     __tablename__ = "qc_results"
+    # keyset-пагинация /qc/results: (run, sort key, id)
+    __table_args__ = (
+        Index("ix_qc_results_run_dup", "qc_run_id", "duplicate_score", "id"),
+        Index("ix_qc_results_run_ai", "qc_run_id", "ai_generated_score", "id"),
+        Index("ix_qc_results_run_image", "qc_run_id", "image_id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     qc_run_id: Mapped[int] = mapped_column(ForeignKey("qc_runs.id"), index=True)
@@ -58,6 +89,29 @@ class QCResult(Base):
 
     ai_generated_score: Mapped[float] = mapped_column(Float, default=0.0)
     flags: Mapped[dict] = mapped_column(JSON, default=dict)
+    # score 0..1 по каждому детектору качества: {"blur": 0.7, ...}
+    scores: Mapped[dict] = mapped_column(JSON, default=dict)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+
+
+class QCContentCache(Base):
+    """
+    Кэш content-only выходов QC по sha256: dHash, сырые метрики детекторов,
+    ai score. Одинаковые байты в разных заявках не декодируются повторно.
+    component — "phash" / имя детектора / "ai", version — версия алгоритма/модели.
+    """
+
+    __tablename__ = "qc_content_cache"
+    __table_args__ = (UniqueConstraint("sha256", "component", "version"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    sha256: Mapped[str] = mapped_column(String(64), index=True)
+    component: Mapped[str] = mapped_column(String(32))
+    version: Mapped[str] = mapped_column(String(128))
+    value: Mapped[dict] = mapped_column(JSON, default=dict)
 
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
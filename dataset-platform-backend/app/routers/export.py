@@ -1,23 +1,34 @@
 from __future__ import annotations
 
-import io
-import json
 from datetime import datetime, timezone
+from typing import Literal
 
-import pyarrow as pa
-import pyarrow.parquet as pq
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import RedirectResponse
-from sqlalchemy import distinct, func
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi import Request as HTTPRequest
+from fastapi.responses import RedirectResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
+from app.core.arrow_io import MEDIA_TYPES, iter_encoded, negotiate, until_disconnected
 from app.core.config import get_s3_client, settings
 from app.core.deps import get_current_user, get_db
-from app.models.annotation import Annotation
+from app.db.session import SessionLocal
 from app.models.export import Export
-from app.models.image import Image
-from app.models.qc import QCRun, QCResult
 from app.models.request import Request
+from app.worker.cancel import ACTIVE_STATUSES, request_cancel
+from app.worker.celery_app import celery_app
+from app.worker.export_delta import export_chain, manifest
+from app.worker.export_engine import (
+    EXPORT_FORMAT_VERSION,
+    EXPORT_SCHEMA,
+    ExportSnapshot,
+    ParquetOptions,
+    check_labeled,
+    iter_export_batches,
+    take_snapshot,
+)
+from app.worker.export_retention import EXPIRED
+from app.worker.export_split import SplitOptions, parse_ratios
+from app.worker.jobs import compact_export_job, export_job
 
 router = APIRouter(tags=["export"])
 
@@ -49,143 +60,333 @@ def _parse_s3_uri(uri: str) -> tuple[str, str]:
     return bucket, key
 
 
-@router.post("/requests/{request_id}/export/parquet")
-def export_parquet(
-    request_id: int,
-    db: Session = Depends(get_db),
-    user=Depends(get_current_user),
-):
-    req = db.get(Request, request_id)
+def _export_out(ex: Export, **extra) -> dict:
+    return {
+        "ok": ex.status != "failed",
+        "request_id": int(ex.request_id),
+        "export_id": int(ex.id),
+        "kind": ex.kind,
+        "base_export_id": ex.base_export_id,
+        "layout": ex.layout,
+        "params": ex.params,
+        "status": ex.status,
+        "storage_path": ex.storage_path,
+        "rows": ex.rows,
+        "celery_task_id": ex.celery_task_id,
+        "error": ex.error,
+        **extra,
+    }
+
+
+def _lock_request(db: Session, request_id: int, user) -> Request:
+    # FOR UPDATE по заявке: параллельные POST не создадут два export
+    req = db.get(Request, request_id, with_for_update=True)
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
     _require_request_access(req, user)
+    return req
 
-    total_images = (
-        db.query(func.count(Image.id)).filter(Image.request_id == request_id).scalar()
-        or 0
-    )
-    if int(total_images) == 0:
-        raise HTTPException(status_code=409, detail="No images to export")
 
-    labeled_images = (
-        db.query(func.count(distinct(Annotation.image_id)))
-        .join(Image, Image.id == Annotation.image_id)
-        .filter(Image.request_id == request_id)
-        .scalar()
-        or 0
+def _active_export(db: Session, request_id: int) -> Export | None:
+    return (
+        db.query(Export)
+        .filter(Export.request_id == request_id, Export.status.in_(ACTIVE_STATUSES))
+        .order_by(Export.id.desc())
+        .first()
     )
-    if int(labeled_images) < int(total_images):
-        raise HTTPException(
-            status_code=409,
-            detail=f"Not all images labeled ({int(labeled_images)}/{int(total_images)})",
-        )
 
-    images = (
-        db.query(Image)
-        .filter(Image.request_id == request_id)
-        .order_by(Image.id.asc())
-        .all()
-    )
 
-    # Последняя annotation по каждому image_id
-    anns = (
-        db.query(Annotation)
-        .join(Image, Image.id == Annotation.image_id)
-        .filter(Image.request_id == request_id)
-        .order_by(Annotation.image_id.asc(), Annotation.updated_at.desc())
-        .all()
-    )
-    ann_map: dict[int, Annotation] = {}
-    for a in anns:
-        if a.image_id not in ann_map:
-            ann_map[a.image_id] = a
-
-    # QC из последнего run
-    last_run = (
-        db.query(QCRun)
-        .filter(QCRun.request_id == request_id)
-        .order_by(QCRun.id.desc())
+def _latest_done_export(db: Session, request_id: int) -> Export | None:
+    """Последний готовый единый parquet — база для delta/compact."""
+    return (
+        db.query(Export)
+        .filter(
+            Export.request_id == request_id,
+            Export.status == "done",
+            Export.layout == "file",
+        )
+        .order_by(Export.id.desc())
         .first()
     )
-    qc_map: dict[int, QCResult] = {}
-    if last_run:
-        qc_rows = (
-            db.query(QCResult)
-            .filter(QCResult.qc_run_id == last_run.id)  # <-- универсально
-            .all()
-        )
-        for r in qc_rows:
-            qc_map[r.image_id] = r
-
-    out_rows = []
-    for img in images:
-        a = ann_map.get(img.id)
-        qc = qc_map.get(img.id)
-
-        labels_list = a.labels if a and a.labels else []
-
-        # Если у тебя QCResult хранит JSON в поле result, то замени на:
-        # dup = (qc.result or {}).get("duplicate_score")
-        # ai = (qc.result or {}).get("ai_generated_score")
-        # flags = (qc.result or {}).get("flags")
-        dup = qc.duplicate_score if qc else None
-        ai = qc.ai_generated_score if qc else None
-        flags = qc.flags if qc else None
-
-        out_rows.append(
-            {
-                "request_id": int(request_id),
-                "image_id": int(img.id),
-                "file_name": img.file_name,
-                "storage_path": img.storage_path,
-                "sha256": img.sha256,
-                "labels": labels_list,
-                "labels_json": json.dumps(labels_list, ensure_ascii=False),
-                "annotation_updated_at": (a.updated_at.isoformat() if a else None),
-                "duplicate_score": dup,
-                "ai_generated_score": ai,
-                "qc_flags": flags,
-                "qc_flags_json": json.dumps(flags, ensure_ascii=False)
-                if flags is not None
-                else None,
-            }
+
+
+def _dispatch(db: Session, ex: Export, images: int, job, task_name: str) -> dict:
+    """
+    Мелкие заявки (<= settings.export_sync_max_images) — job прямо здесь,
+    остальные — Celery-задача task_name.
+    """
+    if images <= settings.export_sync_max_images:
+        # быстрый путь: та же задача, но в этом процессе
+        job(ex.id)
+        db.refresh(ex)
+        return _export_out(ex)
+
+    try:
+        async_res = celery_app.send_task(task_name, args=[ex.id])
+    except Exception as e:
+        ex.status = "failed"
+        ex.error = f"Failed to enqueue Celery task: {e}"
+        ex.finished_at = _now_utc()
+        db.commit()
+        raise HTTPException(
+            status_code=503,
+            detail={
+                "message": "Failed to enqueue export job (Celery/Redis problem)",
+                "error": str(e),
+            },
         )
 
-    table = pa.Table.from_pylist(out_rows)
+    ex.celery_task_id = async_res.id
+    db.commit()
+    return _export_out(ex)
 
-    buf = io.BytesIO()
-    pq.write_table(table, buf)
-    buf.seek(0)
 
-    ts = _now_utc().strftime("%Y%m%d_%H%M%S_%f")
-    object_key = f"requests/{request_id}/export_{ts}.parquet"
+@router.post("/requests/{request_id}/export/parquet")
+def export_parquet(
+    request_id: int,
+    mode: Literal["full", "delta"] = "full",
+    layout: Literal["file", "dataset", "webdataset"] = "file",
+    partition_by: Literal["label", "split"] = "label",
+    target_file_mb: int | None = Query(default=None, ge=1),
+    split: bool = False,
+    split_ratios: str | None = None,
+    split_seed: str | None = None,
+    split_key: Literal["sha256", "image_id"] | None = None,
+    stratify: bool = False,
+    max_per_class: int | None = Query(default=None, ge=1),
+    sample_fraction: float | None = Query(default=None, gt=0.0, le=1.0),
+    shard_mb: int | None = Query(default=None, ge=1),
+    codec: Literal["zstd", "snappy", "lz4", "gzip", "none"] | None = None,
+    compression_level: int | None = None,
+    row_group_rows: int | None = Query(default=None, ge=1000),
+    dictionary: bool | None = None,
+    statistics: bool | None = None,
+    bloom_filter: bool | None = None,
+    force: bool = False,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """
+    Сборка parquet делается задачей export.build_parquet (Celery): ответ сразу,
+    Export в queued, дальше — /export/status. Мелкие заявки
+    (<= settings.export_sync_max_images) собираются прямо здесь.
+    Пока есть queued/running export заявки — возвращается он, новый не создаётся.
+
+    mode=delta: только images, изменившиеся (разметка, QC, новые) после
+    последнего done export; его файл + deltas описывает ?view=manifest.
+
+    layout=dataset: Hive-partitioned файлы по partition_by (label | split)
+    размером ~target_file_mb под префиксом + _metadata (только mode=full).
+    rows — число images; при partition_by=label multi-label строка лежит в
+    партиции каждой метки, строк в файлах — written_rows в ?view=manifest.
+
+    layout=webdataset: tar shards ~shard_mb с байтами images и .json на sample
+    + index.parquet со смещениями (только mode=full).
+
+    split (колонка split; partition_by=split — партиции по ней; только
+    mode=full): детерминированный hash от split_key (sha256 | image_id) с
+    split_seed, доли split_ratios ("train=0.8,val=0.1,test=0.1", по умолчанию
+    settings.export_split_ratios). Дубли QC всегда в одном split. stratify —
+    точные доли в каждом классе (наборе меток). max_per_class / sample_fraction —
+    детерминированная выборка images (по классу / доля), можно и без split.
+
+    Кодирование parquet (file / dataset; не задано — settings.export_parquet_*):
+    codec (zstd | snappy | lz4 | gzip | none) и compression_level,
+    row_group_rows, dictionary encoding, statistics (min/max + page index),
+    bloom_filter на image_id и sha256 (нужен pyarrow с bloom_filter_options,
+    иначе 400).
+
+    Вход (images, annotations, последний QC run) и опции не менялись с done
+    export — он и возвращается (reused=true), без новой сборки; force — собрать.
+    """
+    if layout != "file" and mode != "full":
+        raise HTTPException(
+            status_code=400, detail=f"layout={layout} supports only mode=full"
+        )
+    params: dict = {}
+    if layout == "dataset":
+        params["partition_by"] = partition_by
+        if target_file_mb is not None:
+            params["target_file_bytes"] = target_file_mb * 1024 * 1024
+    selection = {
+        "split": split or None,
+        "split_seed": split_seed or None,
+        "split_key": split_key,
+        "stratify": stratify or None,
+        "max_per_class": max_per_class,
+        "sample_fraction": sample_fraction,
+    }
+    params.update({k: v for k, v in selection.items() if v is not None})
+    try:
+        if split_ratios:
+            params["split_ratios"] = parse_ratios(split_ratios)
+        split_options = SplitOptions.from_params(params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if split_options is not None and mode != "full":
+        raise HTTPException(
+            status_code=400, detail="split / sampling options support only mode=full"
+        )
+    if layout == "webdataset" and shard_mb is not None:
+        params["shard_bytes"] = shard_mb * 1024 * 1024
+    if layout != "webdataset":
+        encoding = {
+            "codec": codec,
+            "compression_level": compression_level,
+            "row_group_rows": row_group_rows,
+            "dictionary": dictionary,
+            "statistics": statistics,
+            "bloom_filter": bloom_filter,
+        }
+        params.update({k: v for k, v in encoding.items() if v is not None})
+        try:
+            ParquetOptions.from_params(params)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    _lock_request(db, request_id, user)
+
+    active = _active_export(db, request_id)
+    if active:
+        db.commit()
+        return _export_out(active, deduplicated=True)
+
+    snapshot = take_snapshot(db, request_id)
+    total_images = snapshot.images.count
+    if total_images == 0:
+        raise HTTPException(status_code=409, detail="No images to export")
 
-    s3 = get_s3_client()
-    bucket = settings.s3_bucket_exports  # <-- ВАЖНО: snake_case
+    error = check_labeled(db, request_id)
+    if error:
+        raise HTTPException(status_code=409, detail=error)
+
+    base, base_id = None, None
+    if mode == "delta":
+        base = _latest_done_export(db, request_id)
+        if not base:
+            raise HTTPException(
+                status_code=409, detail="No done export to build a delta on"
+            )
+        base_id = base.id
+
+    if not force:
+        digest = snapshot.digest(mode, layout, params, base_id)
+        reused = (
+            db.query(Export)
+            .filter(
+                Export.request_id == request_id,
+                Export.status == "done",
+                Export.input_digest == digest,
+            )
+            .order_by(Export.id.desc())
+            .first()
+        )
+        if reused:
+            db.commit()
+            return _export_out(
+                reused, reused=True, reason="Inputs and options unchanged"
+            )
+        # delta без изменений пуста: base и так отражает текущий вход
+        if base is not None and base.input_digest == snapshot.digest(
+            base.kind, base.layout, base.params, base.base_export_id
+        ):
+            db.commit()
+            return _export_out(base, reused=True, reason="No changes since this export")
 
-    s3.put_bytes(
-        bucket=bucket,
-        key=object_key,
-        data=buf.read(),
-        content_type="application/vnd.apache.parquet",
+    ex = Export(
+        request_id=request_id,
+        status="queued",
+        kind=mode,
+        base_export_id=base_id,
+        layout=layout,
+        params=params,
+        created_at=_now_utc(),
     )
+    db.add(ex)
+    db.commit()
+    db.refresh(ex)
+    return _dispatch(db, ex, total_images, export_job, "export.build_parquet")
+
+
+@router.post("/requests/{request_id}/export/compact")
+def export_compact(
+    request_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """
+    Свернуть последний done export (delta) с его base и предыдущими deltas
+    в новый полный parquet (kind=compact, задача export.compact).
+    """
+    _lock_request(db, request_id, user)
+
+    active = _active_export(db, request_id)
+    if active:
+        db.commit()
+        return _export_out(active, deduplicated=True)
+
+    head = _latest_done_export(db, request_id)
+    if not head or head.kind != "delta":
+        raise HTTPException(
+            status_code=409, detail="Nothing to compact: latest export is not a delta"
+        )
 
     ex = Export(
         request_id=request_id,
-        status="done",
-        storage_path=f"s3://{bucket}/{object_key}",
+        status="queued",
+        kind="compact",
+        base_export_id=head.id,
+        created_at=_now_utc(),
     )
     db.add(ex)
     db.commit()
     db.refresh(ex)
+    return _dispatch(
+        db, ex, int(head.images_count or 0), compact_export_job, "export.compact"
+    )
+
+
+@router.post("/requests/{request_id}/export/cancel")
+def export_cancel(
+    request_id: int,
+    export_id: int | None = None,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """Отменить queued/running export (по умолчанию — последний активный)."""
+    req = db.get(Request, request_id)
+    if not req:
+        raise HTTPException(status_code=404, detail="Request not found")
+    _require_request_access(req, user)
+
+    q = db.query(Export).filter(Export.request_id == request_id)
+    if export_id is not None:
+        ex = q.filter(Export.id == export_id).first()
+    else:
+        ex = (
+            q.filter(Export.status.in_(ACTIVE_STATUSES))
+            .order_by(Export.id.desc())
+            .first()
+        )
+    if not ex:
+        raise HTTPException(status_code=404, detail="No active export")
 
+    if not request_cancel(db, Export, ex.id, f"Cancelled by {user.role}"):
+        db.rollback()
+        db.refresh(ex)
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "message": "Export is not active",
+                "export_id": int(ex.id),
+                "status": ex.status,
+            },
+        )
+    db.commit()
     return {
-        "ok": True,
         "request_id": int(request_id),
         "export_id": int(ex.id),
-        "status": ex.status,
-        "storage_path": ex.storage_path,
-        "rows": len(out_rows),
+        "status": "cancelled",
     }
 
 
@@ -213,39 +414,216 @@ def export_status(
         "request_id": int(request_id),
         "status": ex.status,
         "export_id": int(ex.id),
+        "kind": ex.kind,
+        "base_export_id": ex.base_export_id,
+        "layout": ex.layout,
+        "rows": ex.rows,
         "storage_path": ex.storage_path,
         "error": getattr(ex, "error", None),
         "created_at": getattr(ex, "created_at", None),
     }
 
 
+def _dataset_manifest(s3, ex: Export) -> dict:
+    """Файлы export под префиксом (dataset / webdataset) с presigned URL."""
+    bucket, prefix = _parse_s3_uri(ex.storage_path)
+    files = [
+        {
+            **f,
+            "storage_path": f"s3://{bucket}/{prefix}{f['path']}",
+            "url": s3.presign_get(bucket=bucket, key=f"{prefix}{f['path']}"),
+        }
+        for f in ex.files or []
+    ]
+    out = {
+        "request_id": int(ex.request_id),
+        "export_id": int(ex.id),
+        "layout": ex.layout,
+        "storage_path": ex.storage_path,
+        "rows": ex.rows,
+        "files": files,
+    }
+    if ex.layout == "webdataset":
+        out["index_url"] = s3.presign_get(bucket=bucket, key=f"{prefix}index.parquet")
+    else:
+        out["partitioning"] = "hive"
+        out["written_rows"] = sum(f.get("rows", 0) for f in ex.files or [])
+        out["partition_by"] = (ex.params or {}).get("partition_by")
+        out["metadata_url"] = s3.presign_get(bucket=bucket, key=f"{prefix}_metadata")
+    return out
+
+
 @router.get("/requests/{request_id}/export/download")
 def export_download(
     request_id: int,
+    export_id: int | None = None,
+    view: Literal["file", "manifest"] = "file",
     db: Session = Depends(get_db),
     user=Depends(get_current_user),
 ):
+    """
+    view=file — redirect на parquet (для delta — на её compact, если он есть).
+    view=manifest — JSON: base + deltas по порядку с presigned URL каждого файла.
+    По умолчанию — последний done export заявки (для view=file — layout=file):
+    его же возвращает reuse при повторной сборке, даже если после него были
+    failed / cancelled exports или exports другого layout.
+    """
     req = db.get(Request, request_id)
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
     _require_request_access(req, user)
 
-    ex = (
-        db.query(Export)
-        .filter(Export.request_id == request_id)
-        .order_by(Export.id.desc())
-        .first()
-    )
+    q = db.query(Export).filter(Export.request_id == request_id)
+    if export_id is not None:
+        ex = q.filter(Export.id == export_id).first()
+    else:
+        latest = q.filter(Export.status == "done")
+        if view == "file":
+            latest = latest.filter(Export.layout == "file")
+        ex = latest.order_by(Export.id.desc()).first()
     if not ex or not ex.storage_path:
         raise HTTPException(status_code=404, detail="Export not found")
 
+    if ex.status == EXPIRED:
+        raise HTTPException(
+            status_code=410, detail="Export files were removed by retention"
+        )
     if ex.status != "done":
         raise HTTPException(
             status_code=409, detail=f"Export is not ready (status={ex.status})"
         )
 
-    bucket, key = _parse_s3_uri(ex.storage_path)
-
     s3 = get_s3_client()
+    if ex.layout != "file":
+        if view != "manifest":
+            raise HTTPException(
+                status_code=409,
+                detail={
+                    "message": f"Export is a multi-file {ex.layout}: "
+                    "download ?view=manifest for its files",
+                    "export_id": int(ex.id),
+                },
+            )
+        return _dataset_manifest(s3, ex)
+
+    if view == "manifest":
+        out = manifest(export_chain(db, ex))
+        for f in out["files"]:
+            bucket, key = _parse_s3_uri(f["storage_path"])
+            f["url"] = s3.presign_get(bucket=bucket, key=key)
+        return out
+
+    if ex.kind == "delta":
+        compacted = (
+            q.filter(
+                Export.kind == "compact",
+                Export.base_export_id == ex.id,
+                Export.status == "done",
+            )
+            .order_by(Export.id.desc())
+            .first()
+        )
+        if not compacted:
+            raise HTTPException(
+                status_code=409,
+                detail={
+                    "message": "Export is a delta: compact it "
+                    "(POST /export/compact) or download ?view=manifest",
+                    "export_id": int(ex.id),
+                },
+            )
+        ex = compacted
+
+    bucket, key = _parse_s3_uri(ex.storage_path)
     url = s3.presign_get(bucket=bucket, key=key)
     return RedirectResponse(url, status_code=307)
+
+
+def _stream_export(
+    request_id: int, snapshot: ExportSnapshot, fmt: str, options: ParquetOptions
+):
+    """
+    Server-side cursor -> RecordBatch -> куски parquet/arrow. Своя сессия:
+    генератор отрабатывает уже после выхода из зависимостей запроса.
+    """
+    db = SessionLocal()
+    try:
+        batches = iter_export_batches(
+            db, request_id, batch_rows=options.row_group_rows, snapshot=snapshot
+        )
+        yield from iter_encoded(batches, EXPORT_SCHEMA, fmt, options.writer_kwargs())
+    finally:
+        db.close()
+
+
+@router.get("/requests/{request_id}/export/stream")
+def export_stream(
+    request_id: int,
+    http_request: HTTPRequest,
+    fmt: Literal["parquet", "arrow"] | None = Query(default=None, alias="format"),
+    codec: Literal["zstd", "snappy", "lz4", "gzip", "none"] | None = None,
+    compression_level: int | None = None,
+    row_group_rows: int | None = Query(
+        default=None, ge=1000, le=settings.export_batch_rows
+    ),
+    accept: str | None = Header(default=None),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """
+    Текущие строки экспорта (как mode=full layout=file) прямо в ответ: без
+    Export, Celery и S3. Для разовых выгрузок небольших заявок
+    (<= settings.export_stream_max_images, больше — 413 и POST /export/parquet).
+
+    Accept: application/vnd.apache.parquet (по умолчанию) |
+    application/vnd.apache.arrow.stream, или ?format=parquet|arrow.
+    Батч server-side cursor'а = row group (row_group_rows, по умолчанию
+    settings.export_stream_batch_rows): в памяти API один батч на ответ.
+    Клиент отключился — чтение прекращается, cursor закрывается.
+    """
+    req = db.get(Request, request_id)
+    if not req:
+        raise HTTPException(status_code=404, detail="Request not found")
+    _require_request_access(req, user)
+
+    fmt = negotiate(accept, fmt)
+    if fmt == "json":
+        fmt = "parquet"
+    params = {
+        "codec": codec,
+        "compression_level": compression_level,
+        "row_group_rows": row_group_rows or settings.export_stream_batch_rows,
+    }
+    try:
+        options = ParquetOptions.from_params(params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    snapshot = take_snapshot(db, request_id)
+    total_images = snapshot.images.count
+    if total_images > settings.export_stream_max_images:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Request has {total_images} images, streaming is limited to "
+            f"{settings.export_stream_max_images}: use POST /export/parquet",
+        )
+    error = check_labeled(db, request_id)
+    if error:
+        raise HTTPException(status_code=409, detail=error)
+    # соединение запроса не держим, пока идёт поток (у потока своя сессия)
+    db.close()
+
+    ext = "parquet" if fmt == "parquet" else "arrows"
+    return StreamingResponse(
+        until_disconnected(
+            _stream_export(request_id, snapshot, fmt, options), http_request
+        ),
+        media_type=MEDIA_TYPES[fmt],
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="request_{request_id}_export.{ext}"'
+            ),
+            "X-Export-Rows": str(total_images),
+            "X-Export-Format-Version": str(EXPORT_FORMAT_VERSION),
+        },
+    )
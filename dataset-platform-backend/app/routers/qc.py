@@ -1,16 +1,27 @@
 from __future__ import annotations
 
+import base64
+import json
 from datetime import datetime, timezone
+from typing import Literal
 
-from fastapi import APIRouter, Depends, HTTPException
+import pyarrow as pa
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import Text, cast, func, or_, select, tuple_
 
+from app.core.arrow_io import MEDIA_TYPES, iter_encoded, negotiate, rows_to_batch
+from app.core.config import settings
 from app.core.deps import get_db, get_current_user
+from app.db.session import SessionLocal
 from app.models.request import Request
-from app.models.image import Image
 from app.models.qc import QCRun, QCResult
 from app.worker.celery_app import celery_app
+from app.worker.ai_scorer import resolve_scorer_name
+from app.worker.cancel import ACTIVE_STATUSES, request_cancel
+from app.worker.detectors import DETECTORS, resolve_detectors
+from app.worker.qc_fingerprint import config_digest, image_set_fingerprint
 
 router = APIRouter(tags=["qc"])
 
@@ -22,6 +33,12 @@ def _now():
 @router.post("/requests/{request_id}/qc/run")
 def qc_run(
     request_id: int,
+    incremental: bool = False,
+    chunk_size: int | None = Query(default=None, ge=1),
+    parallelism: int | None = Query(default=None, ge=1),
+    detectors: list[str] | None = Query(default=None),
+    ai_scorer: str | None = None,
+    force: bool = False,
     db: Session = Depends(get_db),
     user=Depends(get_current_user),
 ):
@@ -33,15 +50,72 @@ def qc_run(
         if user.role == "customer" and req.customer_id != user.id:
             raise HTTPException(status_code=403, detail="Forbidden")
 
-        # защита от дублей: если уже есть queued/running — не создаём новый
+        # sanity: есть ли uploads (count — часть отпечатка, один агрегатный запрос)
+        fingerprint = image_set_fingerprint(db, request_id)
+        if fingerprint.count == 0:
+            raise HTTPException(status_code=400, detail="No uploads for this request")
+
+        # incremental: переиспользовать результаты прошлого done run, считать только новые images
+        params: dict = {"mode": "incremental"} if incremental else {}
+        # fan-out по Celery workers: размер чанка и число параллельных цепочек
+        if chunk_size is not None:
+            params["chunk_size"] = chunk_size
+        if parallelism is not None:
+            params["parallelism"] = parallelism
+        # детекторы качества (blur/exposure/resolution); не задано — settings.qc_detectors
+        if detectors is not None:
+            try:
+                params["detectors"] = resolve_detectors(detectors)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        # скорер ai_generated_score: none/stub/onnx; не задано — settings.qc_ai_scorer
+        if ai_scorer is not None:
+            try:
+                params["ai_scorer"] = resolve_scorer_name(ai_scorer) or "none"
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        # тот же набор images и та же конфигурация, что у последнего run, и он
+        # done — пересчёт ничего не даст, отдаём его (force — всё равно пересчитать).
+        # Только самый новый run: status/results читают его, а за failed/cancelled
+        # run'ом старый done клиенту уже не виден
+        if not force:
+            last_run = (
+                db.query(QCRun)
+                .filter(QCRun.request_id == request_id)
+                .order_by(QCRun.id.desc())
+                .first()
+            )
+            if (
+                last_run
+                and last_run.status == "done"
+                and last_run.config_digest == config_digest(params)
+                and fingerprint.matches(last_run)
+            ):
+                return {
+                    "qc_run_id": last_run.id,
+                    "request_id": request_id,
+                    "status": last_run.status,
+                    "celery_task_id": last_run.celery_task_id,
+                    "skipped": True,
+                    "reason": "Images and QC config unchanged since this run",
+                }
+
+        # защита от дублей: если уже есть queued/running — не создаём новый.
+        # queued ещё ничего не посчитал — его вытесняет новый run
         active = (
             db.query(QCRun)
-            .filter(
-                QCRun.request_id == request_id, QCRun.status.in_(["queued", "running"])
-            )
+            .filter(QCRun.request_id == request_id, QCRun.status.in_(ACTIVE_STATUSES))
             .order_by(QCRun.id.desc())
             .first()
         )
+        if (
+            active
+            and active.status == "queued"
+            and request_cancel(db, QCRun, active.id, "Superseded by a newer QC run")
+        ):
+            db.commit()
+            active = None
         if active:
             raise HTTPException(
                 status_code=409,
@@ -53,20 +127,10 @@ def qc_run(
                 },
             )
 
-        # sanity: есть ли uploads
-        count_images = (
-            db.query(func.count(Image.id))
-            .filter(Image.request_id == request_id)
-            .scalar()
-            or 0
-        )
-        if int(count_images) == 0:
-            raise HTTPException(status_code=400, detail="No uploads for this request")
-
         run = QCRun(
             request_id=request_id,
             status="queued",
-            params={},
+            params=params,
             created_at=_now(),
         )
         db.add(run)
@@ -108,6 +172,51 @@ def qc_run(
         )
 
 
+@router.post("/requests/{request_id}/qc/cancel")
+def qc_cancel(
+    request_id: int,
+    qc_run_id: int | None = None,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """
+    Отменить queued/running run (по умолчанию — последний активный).
+    Воркер увидит отмену на следующем батче и освободит слот.
+    """
+    req = db.get(Request, request_id)
+    if not req:
+        raise HTTPException(status_code=404, detail="Request not found")
+
+    if user.role == "customer" and req.customer_id != user.id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    q = db.query(QCRun).filter(QCRun.request_id == request_id)
+    if qc_run_id is not None:
+        run = q.filter(QCRun.id == qc_run_id).first()
+    else:
+        run = (
+            q.filter(QCRun.status.in_(ACTIVE_STATUSES))
+            .order_by(QCRun.id.desc())
+            .first()
+        )
+    if not run:
+        raise HTTPException(status_code=404, detail="No active QC run")
+
+    if not request_cancel(db, QCRun, run.id, f"Cancelled by {user.role}"):
+        db.rollback()
+        db.refresh(run)
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "message": "QC run is not active",
+                "qc_run_id": run.id,
+                "status": run.status,
+            },
+        )
+    db.commit()
+    return {"qc_run_id": run.id, "request_id": request_id, "status": "cancelled"}
+
+
 @router.get("/requests/{request_id}/qc/status")
 def qc_status(
     request_id: int,
@@ -130,34 +239,35 @@ def qc_status(
     if not run:
         return {"request_id": request_id, "status": "no_runs"}
 
-    total_images = (
-        db.query(func.count(Image.id)).filter(Image.request_id == request_id).scalar()
-        or 0
-    )
-    processed = (
-        db.query(func.count(QCResult.id)).filter(QCResult.qc_run_id == run.id).scalar()
-        or 0
-    )
+    # O(1): счётчики прогресса ведут воркеры в самой строке qc_runs
+    total = int(run.total_images or 0)
+    done = int(run.images_done or 0)
+    rate = run.images_per_s
+    eta_s = None
+    if run.status == "running" and rate and rate > 0 and total > done:
+        eta_s = round((total - done) / rate, 1)
 
     return {
         "qc_run_id": run.id,
         "request_id": request_id,
         "status": run.status,
+        "phase": run.phase,
         "error": run.error,
-        "total_images": int(total_images),
-        "processed_images": int(processed),
+        "total_images": total,
+        "processed_images": done,
+        "progress": round(done / total, 4) if total else None,
+        "images_per_s": round(rate, 2) if rate else None,
+        "eta_s": eta_s,
+        "progress_at": run.progress_at,
         "celery_task_id": run.celery_task_id,
         "started_at": run.started_at,
         "finished_at": run.finished_at,
+        # timings по стадиям, throughput (images/s на воркер), параметры скорера
+        "stats": run.stats,
     }
 
 
-@router.get("/requests/{request_id}/qc/results")
-def qc_results(
-    request_id: int,
-    db: Session = Depends(get_db),
-    user=Depends(get_current_user),
-):
+def _latest_done_run(db: Session, request_id: int, user) -> QCRun | None:
     req = db.get(Request, request_id)
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
@@ -172,11 +282,218 @@ def qc_results(
         .first()
     )
     if not run or run.status != "done":
+        return None
+    return run
+
+
+def _has_flag(key: str):
+    # flags — json, не jsonb: ключ есть <=> "->" не NULL
+    return QCResult.flags.op("->")(key).isnot(None)
+
+
+def _encode_cursor(value, row_id: int) -> str:
+    raw = json.dumps([value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, row_id = json.loads(raw)
+        if not isinstance(row_id, int) or not isinstance(value, (int, float)):
+            raise ValueError(cursor)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=400, detail={"message": "Invalid cursor", "cursor": cursor}
+        )
+    return value, row_id
+
+
+# ключи flags, которые считает summary (детекторы + дубли/битые)
+_SUMMARY_FLAGS = (
+    "DUPLICATE",
+    "NEAR_DUPLICATE",
+    "CROSS_REQUEST_DUPLICATE",
+    "UNREADABLE",
+    *(d.flag for d in DETECTORS.values()),
+)
+
+
+# Arrow/Parquet-выдача: только нужные колонки, JSON отдаём текстом как есть из БД
+_ARROW_COLUMNS = (
+    QCResult.id,
+    QCResult.qc_run_id,
+    QCResult.request_id,
+    QCResult.image_id,
+    QCResult.duplicate_score,
+    QCResult.duplicate_of_image_id,
+    QCResult.ai_generated_score,
+    cast(QCResult.flags, Text).label("flags"),
+    cast(QCResult.scores, Text).label("scores"),
+    QCResult.created_at,
+)
+QC_RESULTS_ARROW_SCHEMA = pa.schema(
+    [
+        ("id", pa.int64()),
+        ("qc_run_id", pa.int64()),
+        ("request_id", pa.int64()),
+        ("image_id", pa.int64()),
+        ("duplicate_score", pa.float64()),
+        ("duplicate_of_image_id", pa.int64()),
+        ("ai_generated_score", pa.float64()),
+        # JSON-текст (json.loads / pyarrow.compute при необходимости)
+        ("flags", pa.string()),
+        ("scores", pa.string()),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+    ]
+)
+
+
+def _stream_batches(stmt):
+    """
+    Server-side cursor (yield_per) -> RecordBatch-и. Своя сессия: генератор
+    отрабатывает уже после выхода из зависимостей запроса.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            stmt.execution_options(yield_per=settings.qc_results_arrow_batch_rows)
+        )
+        for part in result.partitions():
+            yield rows_to_batch(part, QC_RESULTS_ARROW_SCHEMA)
+    finally:
+        db.close()
+
+
+@router.get("/requests/{request_id}/qc/results")
+def qc_results(
+    request_id: int,
+    response: Response,
+    dup_thr: float = Query(default=0.85, ge=0.0, le=1.0),
+    ai_thr: float = Query(default=0.8, ge=0.0, le=1.0),
+    only_flagged: bool = False,
+    only_duplicates: bool = False,
+    only_ai: bool = False,
+    flag: list[str] | None = Query(default=None),
+    sort: Literal["id", "duplicate_score", "ai_generated_score", "image_id"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    limit: int | None = Query(default=None, ge=1, le=10000),
+    cursor: str | None = None,
+    fmt: Literal["json", "arrow", "parquet"] | None = Query(
+        default=None, alias="format"
+    ),
+    accept: str | None = Header(default=None),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """
+    Результаты последнего done run: фильтры/сортировка/limit в SQL.
+    Пагинация keyset: (sort, id) последней строки -> X-Next-Cursor.
+    Accept: application/vnd.apache.arrow.stream | application/vnd.apache.parquet
+    (или ?format=arrow|parquet) — колоночный поток вместо JSON.
+    """
+    fmt = negotiate(accept, fmt)
+    columnar = fmt != "json"
+
+    run = _latest_done_run(db, request_id, user)
+    if run is None:
+        if columnar:
+            return StreamingResponse(
+                iter_encoded([], QC_RESULTS_ARROW_SCHEMA, fmt),
+                media_type=MEDIA_TYPES[fmt],
+            )
         return []
 
-    return (
-        db.query(QCResult)
-        .filter(QCResult.request_id == request_id, QCResult.qc_run_id == run.id)
-        .order_by(QCResult.id.asc())
-        .all()
-    )
+    is_dup = QCResult.duplicate_score >= dup_thr
+    is_ai = QCResult.ai_generated_score >= ai_thr
+
+    stmt = select(*_ARROW_COLUMNS) if columnar else select(QCResult)
+    stmt = stmt.where(QCResult.request_id == request_id, QCResult.qc_run_id == run.id)
+    if only_flagged:
+        stmt = stmt.where(or_(is_dup, is_ai))
+    if only_duplicates:
+        stmt = stmt.where(is_dup)
+    if only_ai:
+        stmt = stmt.where(is_ai)
+    if flag:
+        stmt = stmt.where(or_(*(_has_flag(f) for f in flag)))
+
+    key = getattr(QCResult, sort)
+    if cursor:
+        value, row_id = _decode_cursor(cursor)
+        after = tuple_(key, QCResult.id)
+        stmt = stmt.where(
+            after < tuple_(value, row_id)
+            if order == "desc"
+            else after > tuple_(value, row_id)
+        )
+    if order == "desc":
+        stmt = stmt.order_by(key.desc(), QCResult.id.desc())
+    else:
+        stmt = stmt.order_by(key.asc(), QCResult.id.asc())
+    if limit:
+        stmt = stmt.limit(limit)
+
+    if columnar and not limit:
+        return StreamingResponse(
+            iter_encoded(_stream_batches(stmt), QC_RESULTS_ARROW_SCHEMA, fmt),
+            media_type=MEDIA_TYPES[fmt],
+        )
+
+    if columnar:
+        rows = db.execute(stmt).all()
+    else:
+        rows = list(db.execute(stmt).scalars())
+
+    headers = {}
+    if limit and len(rows) == limit:
+        last = rows[-1]
+        headers["X-Next-Cursor"] = _encode_cursor(getattr(last, sort), last.id)
+    if columnar:
+        batch = rows_to_batch(rows, QC_RESULTS_ARROW_SCHEMA)
+        return StreamingResponse(
+            iter_encoded([batch], QC_RESULTS_ARROW_SCHEMA, fmt),
+            media_type=MEDIA_TYPES[fmt],
+            headers=headers,
+        )
+    response.headers.update(headers)
+    return rows
+
+
+@router.get("/requests/{request_id}/qc/results/summary")
+def qc_results_summary(
+    request_id: int,
+    dup_thr: float = Query(default=0.85, ge=0.0, le=1.0),
+    ai_thr: float = Query(default=0.8, ge=0.0, le=1.0),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """Счётчики последнего done run одним агрегатным запросом."""
+    run = _latest_done_run(db, request_id, user)
+    if run is None:
+        return {"request_id": request_id, "qc_run_id": None, "total": 0}
+
+    is_dup = QCResult.duplicate_score >= dup_thr
+    is_ai = QCResult.ai_generated_score >= ai_thr
+    row = db.execute(
+        select(
+            func.count().label("total"),
+            func.count().filter(or_(is_dup, is_ai)).label("flagged"),
+            func.count().filter(is_dup).label("duplicates"),
+            func.count().filter(is_ai).label("ai_generated"),
+            *(func.count().filter(_has_flag(f)).label(f) for f in _SUMMARY_FLAGS),
+        ).where(QCResult.request_id == request_id, QCResult.qc_run_id == run.id)
+    ).one()
+
+    counts = row._asdict()
+    return {
+        "request_id": request_id,
+        "qc_run_id": run.id,
+        "dup_thr": dup_thr,
+        "ai_thr": ai_thr,
+        "total": counts["total"],
+        "flagged": counts["flagged"],
+        "duplicates": counts["duplicates"],
+        "ai_generated": counts["ai_generated"],
+        "flags": {f: counts[f] for f in _SUMMARY_FLAGS},
+    }
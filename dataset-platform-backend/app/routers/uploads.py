@@ -1,8 +1,11 @@
 from __future__ import annotations
 import hashlib
+import logging
+from functools import lru_cache
 from typing import List
 from datetime import datetime
 from pathlib import Path
+import redis
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 from sqlalchemy.orm import Session
 
@@ -11,6 +14,8 @@ from app.core.deps import get_db, get_current_user
 from app.models.image import Image
 from app.models.request import Request
 from app.schemas.uploads import ImageOut
+from app.worker.celery_app import BROKER, celery_app
+from app.worker.content_index import register_images
 from app.schemas.uploads import (
     ConfirmUploadIn,
     ConfirmUploadOut,
@@ -19,6 +24,38 @@ from app.schemas.uploads import (
 )
 
 router = APIRouter(tags=["uploads"])
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def _redis() -> redis.Redis:
+    # брокер завис — confirm не ждёт дольше пары секунд
+    return redis.Redis.from_url(BROKER, socket_connect_timeout=2, socket_timeout=2)
+
+
+def _enqueue_metadata(request_id: int) -> None:
+    """
+    Метаданные из заголовков — в фоне (images.extract_metadata), confirm не ждёт.
+    Одна задача на заявку за countdown: первый confirm ставит ключ SET NX с TTL
+    countdown и отправляет задачу, остальные confirm'ы этой заливки её ждут —
+    задача стартует не раньше, чем истечёт ключ, и заберёт их images батчем.
+    Брокер недоступен — не валим upload. Backfill не запускается сам: images
+    останутся без метаданных, пока их не заберёт задача следующего confirm этой
+    заявки или пока backfill не запустят вручную
+    (python -m app.worker.image_meta backfill --request-id N).
+    """
+    countdown = settings.image_meta_countdown_s
+    try:
+        first = _redis().set(
+            f"images:extract_metadata:{request_id}", 1, nx=True, ex=max(countdown, 1)
+        )
+        if not first:
+            return
+        celery_app.send_task(
+            "images.extract_metadata", args=[request_id], countdown=countdown
+        )
+    except Exception:
+        logger.exception("Failed to enqueue images.extract_metadata for %s", request_id)
 
 
 def _require_request_access(req: Request, user) -> None:
@@ -99,8 +136,12 @@ def confirm_upload(
         sha256=payload.sha256,
     )
     db.add(img)
+    db.flush()
+    # глобальный индекс контента (дубли между заявками) — в той же транзакции
+    register_images(db, [img])
     db.commit()
     db.refresh(img)
+    _enqueue_metadata(img.request_id)
 
     return ConfirmUploadOut(
         image_id=img.id,
@@ -165,9 +206,13 @@ def upload_files_mvp(
         db.add(img)
         created.append(img)
 
+    db.flush()
+    register_images(db, created)
     db.commit()
     for img in created:
         db.refresh(img)
+    if created:
+        _enqueue_metadata(request_id)
 
     return created
 
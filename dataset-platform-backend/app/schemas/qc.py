@@ -25,6 +25,7 @@ class QCResultOut(BaseModel):
     duplicate_of_image_id: int | None
     ai_generated_score: float
     flags: dict
+    scores: dict | None = None
     created_at: datetime
 
     class Config:
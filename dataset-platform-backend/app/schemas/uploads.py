@@ -10,6 +10,10 @@ class ImageOut(BaseModel):
     content_type: str
     storage_path: str
     sha256: str
+    width: int | None = None
+    height: int | None = None
+    image_format: str | None = None
+    orientation: int | None = None
     created_at: datetime
 
     class Config:
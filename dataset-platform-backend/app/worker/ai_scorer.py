@@ -0,0 +1,153 @@
+"""
+Скореры ai_generated_score для QC (батчевый CPU inference).
+
+Scorer получает батч decoded images, сам делает preprocess в NCHW float32
+и возвращает score 0..1 на картинку. Результат кэшируется в
+images.quality["ai"] = {"v": scorer.version, "score": ...}.
+
+- "onnx" — локальная модель (settings.qc_ai_model_path), onnxruntime на CPU,
+  intra-op потоки = settings.qc_ai_threads. onnxruntime — опциональная
+  зависимость, нужна только воркерам с этим скорером;
+- "stub" — детерминированная заглушка (хэш preprocessed пикселей), для тестов
+  и проверки пайплайна без модели.
+
+Выбор: QCRun.params["ai_scorer"], иначе settings.qc_ai_scorer ("none" — не считать).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from abc import ABC, abstractmethod
+from collections.abc import Sequence
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image as PILImage
+
+from app.core.config import settings
+
+# нормализация ImageNet — стандарт для CNN/ViT классификаторов
+_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32).reshape(1, 3, 1, 1)
+_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32).reshape(1, 3, 1, 1)
+
+
+class Scorer(ABC):
+    name: str = ""
+    # попадает в images.quality["ai"]["v"]: сменилась модель — пересчитываем
+    version: str = ""
+
+    def __init__(self, input_size: int | None = None, batch_size: int | None = None):
+        self.input_size = input_size or settings.qc_ai_input_size
+        self.batch_size = max(1, batch_size or settings.qc_ai_batch_size)
+
+    def preprocess(self, images: Sequence[PILImage.Image]) -> np.ndarray:
+        """PIL images -> (N, 3, S, S) float32, RGB, ImageNet-нормализация."""
+        side = self.input_size
+        out = np.empty((len(images), side, side, 3), dtype=np.uint8)
+        for i, img in enumerate(images):
+            rgb = img.convert("RGB").resize(
+                (side, side), PILImage.Resampling.BILINEAR, reducing_gap=2.0
+            )
+            out[i] = np.asarray(rgb)
+        x = out.transpose(0, 3, 1, 2).astype(np.float32) / 255.0
+        return (x - _MEAN) / _STD
+
+    @abstractmethod
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """(N, 3, S, S) -> (N,) score 0..1."""
+
+    def score(self, batch: np.ndarray) -> np.ndarray:
+        """predict() кусками по batch_size (размер батча модели != батча чтения)."""
+        parts = [
+            self.predict(batch[i : i + self.batch_size])
+            for i in range(0, len(batch), self.batch_size)
+        ]
+        if not parts:
+            return np.empty((0,), dtype=np.float32)
+        return np.clip(np.concatenate(parts).astype(np.float32), 0.0, 1.0)
+
+
+class StubScorer(Scorer):
+    """Детерминированная заглушка: score = blake2b(пиксели) -> [0, 1)."""
+
+    name = "stub"
+    version = "stub:1"
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        out = np.empty((len(batch),), dtype=np.float32)
+        for i, x in enumerate(batch):
+            digest = hashlib.blake2b(x.tobytes(), digest_size=8).digest()
+            out[i] = int.from_bytes(digest, "little") / 2**64
+        return out
+
+
+class OnnxScorer(Scorer):
+    """
+    ONNX-классификатор на CPU. Ожидается вход (N, 3, S, S) float32 и выход
+    (N,) / (N, 1) — вероятность, либо (N, C) — берём колонку qc_ai_positive_index.
+    """
+
+    name = "onnx"
+
+    def __init__(
+        self,
+        model_path: str | None = None,
+        threads: int | None = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError(
+                "onnxruntime is not installed (pip install onnxruntime)"
+            ) from e
+
+        path = model_path or settings.qc_ai_model_path
+        if not path or not os.path.exists(path):
+            raise RuntimeError(f"ONNX model not found: {path!r}")
+
+        so = ort.SessionOptions()
+        so.intra_op_num_threads = max(1, threads or settings.qc_ai_threads)
+        # один батч за раз — межоператорный параллелизм только мешает
+        so.inter_op_num_threads = 1
+        so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        self._session = ort.InferenceSession(
+            path, sess_options=so, providers=["CPUExecutionProvider"]
+        )
+        self._input = self._session.get_inputs()[0].name
+        self.threads = so.intra_op_num_threads
+
+        with open(path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()[:12]
+        self.version = f"onnx:{os.path.basename(path)}:{digest}"
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        (out,) = self._session.run(None, {self._input: batch})[:1]
+        out = np.asarray(out, dtype=np.float32)
+        if out.ndim == 2 and out.shape[1] > 1:
+            return out[:, settings.qc_ai_positive_index]
+        return out.reshape(len(batch))
+
+
+SCORERS: dict[str, type[Scorer]] = {
+    StubScorer.name: StubScorer,
+    OnnxScorer.name: OnnxScorer,
+}
+
+
+def resolve_scorer_name(name: str | None) -> str | None:
+    """QCRun.params["ai_scorer"] -> имя скорера или None (выключено)."""
+    name = (name if name is not None else settings.qc_ai_scorer).strip().lower()
+    if name in ("", "none", "off"):
+        return None
+    if name not in SCORERS:
+        raise ValueError(f"Unknown ai scorer: {name!r}")
+    return name
+
+
+@lru_cache
+def get_scorer(name: str) -> Scorer:
+    """Один экземпляр на процесс воркера (ONNX session грузится один раз)."""
+    return SCORERS[name]()
@@ -0,0 +1,70 @@
+"""
+Кооперативная отмена фоновых задач (QCRun, Export).
+
+API ставит status = "cancelled" условным UPDATE (только queued/running) —
+отдельного флага нет, статус и есть токен. Задача проверяет его между батчами
+через CancelToken.check(): не чаще раза в settings.job_cancel_check_s, один
+SELECT status по PK. Увидела отмену -> JobCancelled, задача откатывает
+транзакцию и выходит, освобождая слот воркера.
+
+Финальный переход в done делается после check(lock=True): строка под
+FOR UPDATE до коммита, поэтому отмена не может "проскочить" между проверкой
+и записью done — она либо успела (done не пишем), либо видит уже done.
+"""
+
+from __future__ import annotations
+
+import time
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+CANCELLED = "cancelled"
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class CancelToken:
+    def __init__(
+        self, db: Session, model, obj_id: int, interval_s: float | None = None
+    ) -> None:
+        self.db = db
+        self.model = model
+        self.obj_id = obj_id
+        self.interval_s = (
+            settings.job_cancel_check_s if interval_s is None else interval_s
+        )
+        self._checked_at = 0.0
+
+    def cancelled(self, force: bool = False, lock: bool = False) -> bool:
+        now = time.monotonic()
+        if not (force or lock) and now - self._checked_at < self.interval_s:
+            return False
+        self._checked_at = now
+        stmt = select(self.model.status).where(self.model.id == self.obj_id)
+        if lock:
+            stmt = stmt.with_for_update()
+        return self.db.execute(stmt).scalar() == CANCELLED
+
+    def check(self, force: bool = False, lock: bool = False) -> None:
+        if self.cancelled(force=force, lock=lock):
+            raise JobCancelled(f"{self.model.__tablename__} {self.obj_id} cancelled")
+
+
+def request_cancel(db: Session, model, obj_id: int, reason: str) -> bool:
+    """
+    queued/running -> cancelled. False — задача уже завершилась (или отменена).
+    Коммит на вызывающем.
+    """
+    res = db.execute(
+        update(model)
+        .where(model.id == obj_id, model.status.in_(ACTIVE_STATUSES))
+        .values(status=CANCELLED, error=reason[:500], finished_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    return bool(res.rowcount)
@@ -3,6 +3,10 @@ from celery import Celery
 
 BROKER = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
 BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/1")
+# Redis отдаёт неподтверждённую (acks_late) задачу другому worker'у через
+# visibility_timeout: он должен быть больше самой долгой задачи (export
+# большой заявки, qc.run_chunk), иначе она запустится второй раз параллельно
+VISIBILITY_TIMEOUT_S = int(os.getenv("CELERY_VISIBILITY_TIMEOUT_S", 12 * 3600))
 
 celery_app = Celery(
     "dataset_platform_worker",
@@ -16,4 +20,8 @@ celery_app.conf.update(
     timezone="UTC",
     enable_utc=True,
     worker_hijack_root_logger=False,
+    # QC fan-out: чанки длинные, не резервируем их пачкой на одном worker
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    broker_transport_options={"visibility_timeout": VISIBILITY_TIMEOUT_S},
 )
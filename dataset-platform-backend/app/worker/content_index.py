@@ -0,0 +1,257 @@
+"""
+Глобальный индекс контента (content_index) для поиска дублей между заявками.
+
+- Ключ — sha256 (точные копии), дополнительно exact-match по dHash.
+- Перед БД стоит in-memory Bloom-фильтр повторяющегося контента: уникальные
+  ключи до Postgres не доходят. Фильтр обновляется инкрементально по updated_at.
+- Индекс пополняется на каждом upload confirm (register_images),
+  phash дописывается после QC (sync_phashes).
+
+Полная пересборка:
+    python -m app.worker.content_index rebuild
+"""
+
+from __future__ import annotations
+
+import argparse
+import threading
+from collections.abc import Iterable
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.bloom import BloomFilter
+from app.models.content_index import ContentIndexEntry
+from app.models.image import Image
+
+# запас на транзакции, закоммиченные позже своего updated_at
+_REFRESH_OVERLAP = timedelta(seconds=60)
+_LOOKUP_BATCH = 1000
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def register_images(db: Session, images: Iterable[Image]) -> None:
+    """
+    Добавить images в индекс: первый image с данным sha256 становится canonical,
+    для уже известного sha256 увеличивается image_count.
+    images должны иметь id (после flush). Коммит — на вызывающей стороне.
+    """
+    now = _now()
+    rows: dict[str, dict] = {}
+    for img in sorted(images, key=lambda i: i.id):
+        if not img.sha256:
+            continue
+        row = rows.get(img.sha256)
+        if row:
+            # один INSERT не может обновить одну строку дважды — схлопываем тут
+            row["image_count"] += 1
+            continue
+        rows[img.sha256] = {
+            "sha256": img.sha256,
+            "phash": img.phash,
+            "image_id": img.id,
+            "request_id": img.request_id,
+            "image_count": 1,
+            "created_at": now,
+            "updated_at": now,
+        }
+    if not rows:
+        return
+
+    stmt = pg_insert(ContentIndexEntry).values(list(rows.values()))
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["sha256"],
+            set_={
+                "image_count": ContentIndexEntry.image_count
+                + stmt.excluded.image_count,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+    )
+
+
+def sync_phashes(db: Session, request_id: int) -> int:
+    """Дописать phash в индекс для canonical images заявки (после QC)."""
+    res = db.execute(
+        update(ContentIndexEntry)
+        .where(
+            ContentIndexEntry.image_id == Image.id,
+            ContentIndexEntry.phash.is_(None),
+            Image.request_id == request_id,
+            Image.phash.is_not(None),
+        )
+        .values(phash=Image.phash, updated_at=_now())
+        .execution_options(synchronize_session=False)
+    )
+    return int(res.rowcount or 0)
+
+
+def rebuild(db: Session) -> int:
+    """Пересобрать индекс целиком из images (самый ранний image на каждый sha256)."""
+    db.execute(delete(ContentIndexEntry))
+    now = _now()
+    src = (
+        select(
+            Image.sha256,
+            Image.phash,
+            Image.id,
+            Image.request_id,
+            func.count().over(partition_by=Image.sha256),
+            literal(now, ContentIndexEntry.created_at.type),
+            literal(now, ContentIndexEntry.updated_at.type),
+        )
+        .where(Image.sha256.is_not(None), Image.sha256 != "")
+        .distinct(Image.sha256)
+        .order_by(Image.sha256, Image.id.asc())
+    )
+    db.execute(
+        pg_insert(ContentIndexEntry).from_select(
+            [
+                "sha256",
+                "phash",
+                "image_id",
+                "request_id",
+                "image_count",
+                "created_at",
+                "updated_at",
+            ],
+            src,
+        )
+    )
+    return int(db.execute(select(func.count(ContentIndexEntry.id))).scalar() or 0)
+
+
+class ContentIndex:
+    """
+    Bloom-фильтры перед таблицей content_index. Один экземпляр на процесс
+    (get_content_index), refresh() перед использованием.
+
+    В фильтры попадает только *повторяющийся* контент, иначе собственные
+    images заявки (они тоже в индексе) давали бы positive на каждый lookup:
+    - sha256 с image_count > 1;
+    - phash, встреченный у двух и более записей (seen -> shared).
+    """
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.01) -> None:
+        self._min_capacity = capacity
+        self._error_rate = error_rate
+        self._lock = threading.Lock()
+        self._watermark: datetime | None = None
+        self._new_filters(capacity)
+        self.stats = {"lookups": 0, "bloom_negative": 0, "db_lookups": 0, "hits": 0}
+
+    def _new_filters(self, capacity: int) -> None:
+        self._sha_shared = BloomFilter(capacity, self._error_rate)
+        self._phash_seen = BloomFilter(capacity, self._error_rate)
+        self._phash_shared = BloomFilter(capacity, self._error_rate)
+
+    def _reset(self, db: Session) -> None:
+        total = db.execute(select(func.count(ContentIndexEntry.id))).scalar() or 0
+        self._new_filters(max(self._min_capacity, 2 * int(total)))
+        self._watermark = None
+
+    def refresh(self, db: Session) -> None:
+        """Догрузить в фильтры записи, изменённые с прошлого refresh."""
+        with self._lock:
+            if self._watermark is None or self._phash_seen.is_full:
+                self._reset(db)
+
+            stmt = select(
+                ContentIndexEntry.sha256,
+                ContentIndexEntry.phash,
+                ContentIndexEntry.image_count,
+                ContentIndexEntry.updated_at,
+            )
+            if self._watermark is not None:
+                stmt = stmt.where(
+                    ContentIndexEntry.updated_at >= self._watermark - _REFRESH_OVERLAP
+                )
+
+            watermark = self._watermark
+            for sha, phash, image_count, updated_at in db.execute(
+                stmt.execution_options(yield_per=10_000)
+            ):
+                if (image_count or 1) > 1:
+                    self._sha_shared.add(sha)
+                if phash:
+                    # повторная загрузка той же записи (overlap) даст лишь false positive
+                    if phash in self._phash_seen:
+                        self._phash_shared.add(phash)
+                    else:
+                        self._phash_seen.add(phash)
+                if updated_at and (watermark is None or updated_at > watermark):
+                    watermark = updated_at
+            self._watermark = watermark or _now()
+
+    def _lookup(
+        self, db: Session, column, bloom: BloomFilter, keys: Iterable[str]
+    ) -> dict[str, tuple[int, int]]:
+        keys = {k for k in keys if k}
+        self.stats["lookups"] += len(keys)
+        maybe = [k for k in keys if k in bloom]
+        self.stats["bloom_negative"] += len(keys) - len(maybe)
+
+        found: dict[str, tuple[int, int]] = {}
+        for i in range(0, len(maybe), _LOOKUP_BATCH):
+            batch = maybe[i : i + _LOOKUP_BATCH]
+            self.stats["db_lookups"] += len(batch)
+            rows = db.execute(
+                select(column, ContentIndexEntry.image_id, ContentIndexEntry.request_id)
+                .where(column.in_(batch))
+                .order_by(ContentIndexEntry.image_id.asc())
+            )
+            for key, image_id, request_id in rows:
+                # при нескольких совпадениях (phash) — самый ранний image
+                found.setdefault(key, (int(image_id), int(request_id)))
+        self.stats["hits"] += len(found)
+        return found
+
+    def lookup_sha256(
+        self, db: Session, shas: Iterable[str]
+    ) -> dict[str, tuple[int, int]]:
+        """sha256 -> (image_id, request_id) canonical image."""
+        return self._lookup(db, ContentIndexEntry.sha256, self._sha_shared, shas)
+
+    def lookup_phash(
+        self, db: Session, phashes: Iterable[str]
+    ) -> dict[str, tuple[int, int]]:
+        """phash (exact match) -> (image_id, request_id) самого раннего image."""
+        return self._lookup(db, ContentIndexEntry.phash, self._phash_shared, phashes)
+
+
+_index: ContentIndex | None = None
+
+
+def get_content_index() -> ContentIndex:
+    global _index
+    if _index is None:
+        _index = ContentIndex()
+    return _index
+
+
+def main() -> None:
+    import app.models  # noqa: F401  (регистрация всех моделей для FK)
+    from app.db.session import SessionLocal
+
+    ap = argparse.ArgumentParser(description="Global content index maintenance")
+    ap.add_argument("command", choices=["rebuild"])
+    args = ap.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            n = rebuild(db)
+            db.commit()
+            print(f"content_index rebuilt: {n} entries")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Детекторы качества картинок для QC (плагины).
+
+Детектор работает в два шага:
+- measure(batch) — векторно (NumPy) по батчу decoded images считает сырые метрики,
+  они кэшируются в images.quality[name] вместе с version детектора;
+- judge(metrics, options) — метрики + пороги run -> (score 0..1, flag | None).
+  score = 0.5 ровно на пороге, flag ставится при score >= 0.5.
+
+Набор детекторов и пороги выбираются в QCRun.params["detectors"]:
+    ["blur", "exposure"]                  — дефолтные пороги
+    {"blur": {"min_var": 60}, "resolution": {"min_side": 512}}
+
+Новый детектор: подкласс Detector + @register.
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+from PIL import Image as PILImage
+
+from app.core.config import settings
+
+
+@dataclass
+class ImageBatch:
+    """Батч в виде массивов: gray (N, S, S) uint8 и sizes (N, 2) = (width, height)."""
+
+    gray: np.ndarray
+    sizes: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+
+def make_batch(images: Sequence[PILImage.Image], side: int | None = None) -> ImageBatch:
+    """
+    PIL images -> ImageBatch. Все картинки приводятся к одному квадрату side x side
+    (grayscale), чтобы метрики считались одним NumPy-выражением на весь батч
+    и не зависели от исходного разрешения.
+    """
+    side = side or settings.qc_detector_side
+    gray = np.empty((len(images), side, side), dtype=np.uint8)
+    sizes = np.empty((len(images), 2), dtype=np.int64)
+    for i, img in enumerate(images):
+        sizes[i] = img.size
+        g = img.convert("L").resize(
+            (side, side), PILImage.Resampling.BILINEAR, reducing_gap=2.0
+        )
+        gray[i] = np.asarray(g)
+    return ImageBatch(gray=gray, sizes=sizes)
+
+
+def _ramp(value: float, threshold: float) -> float:
+    """0 -> 0.0, threshold -> 0.5, 2*threshold -> 1.0 (clip)."""
+    if threshold <= 0:
+        return 1.0 if value > 0 else 0.0
+    return float(min(1.0, max(0.0, value / (2.0 * threshold))))
+
+
+class Detector(ABC):
+    name: str = ""
+    # увеличить при изменении measure(): закэшированные метрики пересчитаются
+    version: int = 1
+    # ключ в QCResult.flags
+    flag: str = ""
+    defaults: dict[str, Any] = {}
+
+    @abstractmethod
+    def measure(self, batch: ImageBatch) -> list[dict[str, float]]:
+        """Сырые метрики, по одному dict на картинку батча."""
+
+    @abstractmethod
+    def judge(
+        self, metrics: dict[str, Any], options: dict[str, Any]
+    ) -> tuple[float, Any]:
+        """(score 0..1, flag | None) по метрикам и порогам run."""
+
+
+DETECTORS: dict[str, Detector] = {}
+
+
+def register(cls: type[Detector]) -> type[Detector]:
+    DETECTORS[cls.name] = cls()
+    return cls
+
+
+@register
+class BlurDetector(Detector):
+    """Дисперсия Лапласиана: мало резких переходов -> размыто."""
+
+    name = "blur"
+    flag = "BLURRY"
+    defaults = {"min_var": 50.0}
+
+    def measure(self, batch: ImageBatch) -> list[dict[str, float]]:
+        x = batch.gray.astype(np.float32)
+        lap = (
+            x[:, :-2, 1:-1]
+            + x[:, 2:, 1:-1]
+            + x[:, 1:-1, :-2]
+            + x[:, 1:-1, 2:]
+            - 4.0 * x[:, 1:-1, 1:-1]
+        )
+        var = lap.var(axis=(1, 2))
+        return [{"lap_var": round(float(v), 3)} for v in var]
+
+    def judge(self, metrics, options):
+        min_var = float(options.get("min_var", self.defaults["min_var"]))
+        lap_var = float(metrics["lap_var"])
+        score = 1.0 - _ramp(lap_var, min_var)
+        return score, (True if lap_var < min_var else None)
+
+
+@register
+class ExposureDetector(Detector):
+    """Гистограмма яркости: доля почти чёрных / почти белых пикселей."""
+
+    name = "exposure"
+    flag = "BAD_EXPOSURE"
+    defaults = {"max_dark": 0.6, "max_bright": 0.6}
+    DARK_LEVEL = 16
+    BRIGHT_LEVEL = 239
+
+    def measure(self, batch: ImageBatch) -> list[dict[str, float]]:
+        n = len(batch)
+        if n == 0:
+            return []
+        # 256-бинная гистограмма для всех картинок одним bincount (смещение по i)
+        flat = batch.gray.reshape(n, -1).astype(np.int64)
+        flat += (np.arange(n, dtype=np.int64) * 256)[:, None]
+        hist = np.bincount(flat.ravel(), minlength=256 * n).reshape(n, 256)
+        total = hist.sum(axis=1).astype(np.float64)
+
+        dark = hist[:, : self.DARK_LEVEL + 1].sum(axis=1) / total
+        bright = hist[:, self.BRIGHT_LEVEL :].sum(axis=1) / total
+        mean = hist @ np.arange(256, dtype=np.float64) / total
+        return [
+            {
+                "dark": round(float(d), 4),
+                "bright": round(float(b), 4),
+                "mean": round(float(m), 2),
+            }
+            for d, b, m in zip(dark, bright, mean, strict=True)
+        ]
+
+    def judge(self, metrics, options):
+        max_dark = float(options.get("max_dark", self.defaults["max_dark"]))
+        max_bright = float(options.get("max_bright", self.defaults["max_bright"]))
+        dark, bright = float(metrics["dark"]), float(metrics["bright"])
+        score = max(_ramp(dark, max_dark), _ramp(bright, max_bright))
+        if dark >= max_dark:
+            return score, "underexposed"
+        if bright >= max_bright:
+            return score, "overexposed"
+        return score, None
+
+
+@register
+class ResolutionDetector(Detector):
+    """Слишком маленькая картинка или экстремальное соотношение сторон."""
+
+    name = "resolution"
+    flag = "BAD_RESOLUTION"
+    defaults = {"min_side": 224, "max_aspect": 4.0}
+
+    def measure(self, batch: ImageBatch) -> list[dict[str, float]]:
+        return [{"width": int(w), "height": int(h)} for w, h in batch.sizes]
+
+    def judge(self, metrics, options):
+        min_side = float(options.get("min_side", self.defaults["min_side"]))
+        max_aspect = float(options.get("max_aspect", self.defaults["max_aspect"]))
+        w, h = int(metrics["width"]), int(metrics["height"])
+        short, long = min(w, h), max(w, h)
+        aspect = long / short if short > 0 else float("inf")
+
+        small_score = 1.0 - _ramp(short, min_side)
+        aspect_score = _ramp(aspect - 1.0, max_aspect - 1.0)
+        score = max(small_score, aspect_score)
+        if short < min_side:
+            return score, "too_small"
+        if aspect > max_aspect:
+            return score, "bad_aspect"
+        return score, None
+
+
+def resolve_detectors(spec: Any) -> dict[str, dict[str, Any]]:
+    """
+    QCRun.params["detectors"] -> {name: options}.
+    None -> settings.qc_detectors. Неизвестное имя -> ValueError.
+    """
+    if spec is None:
+        spec = [s.strip() for s in settings.qc_detectors.split(",") if s.strip()]
+    if isinstance(spec, (list, tuple)):
+        spec = {name: {} for name in spec}
+    if not isinstance(spec, dict):
+        raise ValueError(f"Invalid detectors spec: {spec!r}")
+
+    unknown = sorted(set(spec) - set(DETECTORS))
+    if unknown:
+        raise ValueError(f"Unknown detectors: {unknown}")
+    return {name: dict(opts or {}) for name, opts in spec.items()}
+
+
+def needs_measure(quality: dict | None, names: Sequence[str]) -> list[str]:
+    """Детекторы, для которых в images.quality нет метрик актуальной версии."""
+    quality = quality or {}
+    return [
+        name
+        for name in names
+        if (quality.get(name) or {}).get("v") != DETECTORS[name].version
+    ]
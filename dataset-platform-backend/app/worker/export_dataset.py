@@ -0,0 +1,263 @@
+"""
+layout=dataset: Hive-partitioned parquet dataset под префиксом export.
+
+    requests/{id}/exports/dataset_{ts}_{export_id}/
+        label=cat/part-00000.parquet
+        label=cat/part-00001.parquet
+        label=dog/part-00000.parquet
+        _common_metadata            # схема
+        _metadata                   # схема + row groups всех файлов (с путями)
+
+partition_by:
+    label — строка попадает в партицию каждой своей метки (multi-label
+            размножается), без меток — __HIVE_DEFAULT_PARTITION__.
+            rows — число images (входных строк), строк в файлах (files[].rows)
+            может быть больше;
+    split — train/val/test по колонке split (считается в SQL, export_split:
+            дубли QC в одной партиции, опционально stratify / выборка).
+Колонки партиции в файлах нет — она в пути (как у pyarrow.dataset.write_dataset;
+для split колонка из файлов убрана).
+pyarrow.dataset.dataset(prefix, partitioning="hive") / parquet_dataset(_metadata)
+отбрасывает ненужные партиции по пути, не открывая файлы.
+
+Каждая партиция — свой ParquetWriter поверх S3MultipartWriter; файл
+закрывается на target_file_bytes и следующий пишется как part-N+1.
+Строки копятся по партициям до row group (ParquetOptions.row_group_rows), всего
+в буферах — не больше двух батчей.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+from collections.abc import Iterator
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from app.core.config import settings
+from app.core.s3 import S3Client
+from app.worker.cancel import CancelToken
+from app.worker.export_engine import (
+    EXPORT_SCHEMA,
+    PARQUET_CONTENT_TYPE,
+    ParquetOptions,
+)
+
+PARTITION_KEYS = ("label", "split")
+DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def _partition_dir(key: str, value: str | None) -> str:
+    # значение в пути percent-encoded: pyarrow hive partitioning декодирует (uri)
+    return f"{key}={quote(value, safe='') if value is not None else DEFAULT_PARTITION}"
+
+
+def _group_by_label(batch: pa.RecordBatch) -> Iterator[tuple[str | None, pa.Array]]:
+    labels = batch.column("labels")
+    parents = pc.list_parent_indices(labels)
+    # labels — list<dictionary>: сравниваем по строкам
+    flat = pc.list_flatten(labels).cast(pa.string())
+    for value in pc.unique(flat).to_pylist():
+        mask = pc.equal(flat, value) if value is not None else pc.is_null(flat)
+        yield value, pc.unique(pc.filter(parents, mask))
+    # без меток (labels null или []) — одна строка в партиции по умолчанию
+    counts = pc.fill_null(pc.list_value_length(labels), 0)
+    empty = pc.indices_nonzero(pc.equal(counts, 0))
+    if len(empty):
+        yield None, empty
+
+
+def _group_by_split(batch: pa.RecordBatch) -> Iterator[tuple[str, pa.Array]]:
+    splits = batch.column("split").cast(pa.string())
+    for value in pc.unique(splits).to_pylist():
+        mask = pc.equal(splits, value) if value is not None else pc.is_null(splits)
+        yield value, pc.indices_nonzero(mask)
+
+
+class _PartitionFiles:
+    """Файлы одной партиции: part-00000.parquet, ... по target_file_bytes."""
+
+    def __init__(self, dataset: DatasetWriter, directory: str) -> None:
+        self.dataset = dataset
+        self.directory = directory
+        self.pending: list[pa.Table] = []
+        self.pending_rows = 0
+        self._n = 0
+        self._out = None
+        self._writer: pq.ParquetWriter | None = None
+        self._path = ""
+        self._rows = 0
+        self._meta: list[pq.FileMetaData] = []
+
+    def add(self, table: pa.Table) -> None:
+        self.pending.append(table)
+        self.pending_rows += table.num_rows
+
+    def flush(self) -> None:
+        if not self.pending_rows:
+            return
+        table = pa.concat_tables(self.pending)
+        self.pending, self.pending_rows = [], 0
+        if self._writer is None:
+            self._open()
+        self._writer.write_table(table)
+        self._rows += table.num_rows
+        if self._out.bytes_written >= self.dataset.target_file_bytes:
+            self.close()
+
+    def _open(self) -> None:
+        ds = self.dataset
+        self._path = f"{self.directory}/part-{self._n:05d}.parquet"
+        self._n += 1
+        self._out = ds.s3.open_multipart(
+            bucket=ds.bucket,
+            key=f"{ds.prefix}{self._path}",
+            content_type=PARQUET_CONTENT_TYPE,
+            part_size=ds.part_size,
+        )
+        self._meta = []
+        self._writer = pq.ParquetWriter(
+            pa.PythonFile(self._out, mode="w"),
+            ds.schema,
+            metadata_collector=self._meta,
+            **ds.parquet.writer_kwargs(),
+        )
+        self._rows = 0
+
+    def close(self) -> None:
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._out.close()
+        meta = self._meta[0]
+        meta.set_file_path(self._path)
+        self.dataset.file_meta.append(meta)
+        self.dataset.files.append(
+            {"path": self._path, "rows": self._rows, "bytes": self._out.bytes_written}
+        )
+        self._writer = self._out = None
+
+    def abort(self) -> None:
+        # footer — в буфер отменяемого upload, а не из __del__ в закрытый
+        if self._writer is not None:
+            with contextlib.suppress(Exception):
+                self._writer.close()
+        if self._out is not None:
+            self._out.abort()
+        self._writer = self._out = None
+
+
+class DatasetWriter:
+    """Hive-partitioned dataset в S3 под prefix (оканчивается на "/")."""
+
+    def __init__(
+        self,
+        s3: S3Client,
+        bucket: str,
+        prefix: str,
+        partition_by: str,
+        *,
+        target_file_bytes: int | None = None,
+        part_size: int | None = None,
+        row_group_rows: int | None = None,
+        parquet: ParquetOptions | None = None,
+    ) -> None:
+        if partition_by not in PARTITION_KEYS:
+            raise ValueError(f"Unsupported partition_by: {partition_by!r}")
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.partition_by = partition_by
+        self.target_file_bytes = target_file_bytes or settings.export_target_file_bytes
+        self.part_size = part_size or settings.export_part_bytes
+        self.parquet = parquet or ParquetOptions.from_params(None)
+        self.row_group_rows = row_group_rows or self.parquet.row_group_rows
+        # схема файлов: колонка партиции split — в пути, не в файле
+        self.schema = (
+            EXPORT_SCHEMA.remove(EXPORT_SCHEMA.get_field_index("split"))
+            if partition_by == "split"
+            else EXPORT_SCHEMA
+        )
+        self.files: list[dict] = []
+        self.file_meta: list[pq.FileMetaData] = []
+        self._meta_keys: list[str] = []
+        # rows — входные строки (images); копии multi-label — только в files[].rows
+        self.rows = 0
+        self._partitions: dict[str | None, _PartitionFiles] = {}
+
+    def _groups(self, batch: pa.RecordBatch):
+        if self.partition_by == "label":
+            return _group_by_label(batch)
+        return _group_by_split(batch)
+
+    def write_batch(self, batch: pa.RecordBatch) -> None:
+        table = pa.Table.from_batches([batch]).select(self.schema.names)
+        for value, indices in self._groups(batch):
+            part = self._partitions.get(value)
+            if part is None:
+                part = _PartitionFiles(self, _partition_dir(self.partition_by, value))
+                self._partitions[value] = part
+            part.add(table.take(indices))
+            if part.pending_rows >= self.row_group_rows:
+                part.flush()
+        if sum(p.pending_rows for p in self._partitions.values()) > (
+            2 * self.row_group_rows
+        ):
+            for part in self._partitions.values():
+                part.flush()
+        self.rows += batch.num_rows
+
+    def close(self) -> None:
+        """Дописать хвосты, закрыть файлы, положить _common_metadata и _metadata."""
+        for part in self._partitions.values():
+            part.flush()
+            part.close()
+        self._put_metadata("_common_metadata", None)
+        self._put_metadata("_metadata", self.file_meta)
+
+    def _put_metadata(self, name: str, file_meta: list | None) -> None:
+        buf = io.BytesIO()
+        if file_meta:
+            meta = file_meta[0]
+            for other in file_meta[1:]:
+                meta.append_row_groups(other)
+            meta.write_metadata_file(buf)
+        else:
+            pq.write_metadata(self.schema, buf)
+        key = f"{self.prefix}{name}"
+        self._meta_keys.append(key)
+        self.s3.put_bytes(
+            bucket=self.bucket,
+            key=key,
+            data=buf.getvalue(),
+            content_type=PARQUET_CONTENT_TYPE,
+        )
+
+    def abort(self) -> None:
+        """Открытые uploads — abort, уже записанные файлы и _metadata — удалить."""
+        for part in self._partitions.values():
+            part.abort()
+        keys = [f"{self.prefix}{f['path']}" for f in self.files] + self._meta_keys
+        if keys:
+            self.s3.delete_objects(bucket=self.bucket, keys=keys)
+
+
+def write_dataset(
+    batches: Iterator[pa.RecordBatch],
+    writer: DatasetWriter,
+    token: CancelToken | None = None,
+) -> int:
+    """Батчи -> партиции; при ошибке/отмене частичный dataset удаляется."""
+    try:
+        for batch in batches:
+            writer.write_batch(batch)
+        if token is not None:
+            token.check(force=True)
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.rows
@@ -0,0 +1,167 @@
+"""
+Цепочки экспортов: base (full / compact) + deltas.
+
+delta хранит только строки, изменившиеся после предыдущего export цепочки
+(base_export_id), поэтому правило чтения одно: файлы по порядку, по image_id
+побеждает последний. Удалённых строк в delta нет: если с предыдущего снимка
+images удаляли или меняли (отпечаток images с id <= images_max_id не совпал),
+export_job вместо delta пишет full.
+
+compact сворачивает цепочку в новый base: base читается по row group,
+строки, перекрытые deltas, отбрасываются, строки deltas вставляются на место
+по image_id. В памяти — один row group base и сами deltas (они маленькие,
+иначе delta не нужна).
+"""
+
+from __future__ import annotations
+
+import tempfile
+from collections.abc import Iterator
+from contextlib import ExitStack
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.s3 import S3Client, parse_s3_uri
+from app.models.export import Export
+from app.worker.cancel import CancelToken
+from app.worker.export_engine import EXPORT_FORMAT_VERSION, EXPORT_SCHEMA
+from app.worker.export_split import SplitOptions
+from app.worker.qc_fingerprint import image_set_fingerprint
+
+BASE_KINDS = ("full", "compact")
+
+
+def export_chain(db: Session, head: Export) -> list[Export]:
+    """[base, delta_1, ..., head]: от head по base_export_id до full/compact."""
+    chain = [head]
+    while chain[-1].kind not in BASE_KINDS:
+        parent = db.get(Export, chain[-1].base_export_id)
+        if parent is None:
+            raise RuntimeError(f"Export {chain[-1].id}: base export is missing")
+        chain.append(parent)
+    return chain[::-1]
+
+
+def same_format(ex: Export) -> bool:
+    """Файлы export записаны текущей схемой (иначе с новыми их не смешать)."""
+    return (ex.format_version or 1) == EXPORT_FORMAT_VERSION
+
+
+def delta_base_ok(db: Session, request_id: int, base: Export | None) -> bool:
+    """
+    Можно ли строить delta от base: он готов, записан текущей схемой,
+    без split / выборки строк (их результат зависит от всего набора)
+    и его images с тех пор не менялись.
+    """
+    if base is None or base.status != "done" or not base.storage_path:
+        return False
+    if not same_format(base):
+        return False
+    if SplitOptions.from_params(base.params) is not None:
+        return False
+    if base.images_max_id is None:
+        return False
+    fp = image_set_fingerprint(db, request_id, up_to_id=base.images_max_id)
+    return fp.matches(base)
+
+
+def manifest(chain: list[Export]) -> dict:
+    """Описание цепочки для клиента; presigned URL добавляет роутер."""
+    head = chain[-1]
+    return {
+        "request_id": int(head.request_id),
+        "export_id": int(head.id),
+        "merge": "read files in order; for each image_id the last file wins",
+        "files": [
+            {
+                "export_id": int(ex.id),
+                "kind": ex.kind,
+                "storage_path": ex.storage_path,
+                "rows": ex.rows,
+                "created_at": ex.created_at,
+            }
+            for ex in chain
+        ],
+    }
+
+
+def _open_parquet(s3: S3Client, uri: str, stack: ExitStack) -> pq.ParquetFile:
+    """Объект S3 -> временный файл (parquet читается с seek) -> ParquetFile."""
+    bucket, key = parse_s3_uri(uri)
+    tmp = stack.enter_context(tempfile.TemporaryFile())
+    body, _ = s3.get_stream(bucket=bucket, key=key)
+    try:
+        for chunk in body.iter_chunks(chunk_size=1 << 20):
+            tmp.write(chunk)
+    finally:
+        body.close()
+    tmp.seek(0)
+    return pq.ParquetFile(tmp)
+
+
+def _row_groups(pf: pq.ParquetFile) -> Iterator[pa.Table]:
+    """
+    Файл по row group. read() / iter_batches() с батчем через границу row group
+    не собирают list<dictionary> (ArrowNotImplementedError: chunked array).
+    """
+    for i in range(pf.num_row_groups):
+        yield pf.read_row_group(i).cast(EXPORT_SCHEMA)
+
+
+def _overlay(s3: S3Client, deltas: list[Export], stack: ExitStack) -> pa.Table:
+    """Все deltas в одну таблицу: одна строка на image_id (последняя), по image_id."""
+    table = EXPORT_SCHEMA.empty_table()
+    for ex in deltas:
+        pf = _open_parquet(s3, ex.storage_path, stack)
+        delta = pa.concat_tables([EXPORT_SCHEMA.empty_table(), *_row_groups(pf)])
+        keep = pc.invert(pc.is_in(table["image_id"], value_set=delta["image_id"]))
+        table = pa.concat_tables([table.filter(keep), delta])
+    return table.sort_by("image_id").combine_chunks()
+
+
+def iter_compacted_batches(
+    s3: S3Client,
+    chain: list[Export],
+    batch_rows: int | None = None,
+    token: CancelToken | None = None,
+) -> Iterator[pa.RecordBatch]:
+    """base + deltas цепочки -> RecordBatch-и полного экспорта в порядке image_id."""
+    with ExitStack() as stack:
+        overlay = _overlay(s3, chain[1:], stack)
+        base = _open_parquet(s3, chain[0].storage_path, stack)
+        ov_ids = overlay["image_id"].to_numpy()
+        pos = 0
+        batches = (
+            batch
+            for group in _row_groups(base)
+            for batch in group.to_batches(
+                max_chunksize=batch_rows or settings.export_batch_rows
+            )
+        )
+        for batch in batches:
+            if token is not None:
+                token.check()
+            if not batch.num_rows:
+                continue
+            # deltas c image_id до конца этого батча встают внутрь него
+            end = int(
+                np.searchsorted(ov_ids, pc.max(batch["image_id"]).as_py(), "right")
+            )
+            kept = batch.filter(
+                pc.invert(pc.is_in(batch["image_id"], value_set=overlay["image_id"]))
+            )
+            merged = pa.concat_tables(
+                [
+                    pa.Table.from_batches([kept], EXPORT_SCHEMA),
+                    overlay.slice(pos, end - pos),
+                ]
+            )
+            pos = end
+            yield from merged.sort_by("image_id").combine_chunks().to_batches()
+        if pos < overlay.num_rows:
+            yield from overlay.slice(pos).to_batches()
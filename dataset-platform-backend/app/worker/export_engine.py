@@ -0,0 +1,378 @@
+"""
+Export engine: parquet заявки с фиксированной памятью.
+
+Строки (image + последняя annotation + QC, см. export_query) читаются
+server-side cursor'ом батчами по settings.export_batch_rows.
+Батч -> RecordBatch по EXPORT_SCHEMA -> row group ParquetWriter -> sink
+(S3MultipartWriter: parts уходят в S3 по мере записи). В памяти одновременно
+один батч строк и один part, независимо от размера заявки.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import inspect
+import json
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import distinct, func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.annotation import Annotation
+from app.models.export import Export
+from app.models.image import Image
+from app.worker.cancel import CancelToken
+from app.worker.export_query import (
+    annotations_state,
+    export_rows_stmt,
+    latest_qc_run_id,
+)
+from app.worker.export_split import SplitOptions
+from app.worker.qc_fingerprint import ImageSetFingerprint, image_set_fingerprint
+
+PARQUET_CONTENT_TYPE = "application/vnd.apache.parquet"
+
+# версия содержимого экспорта (схема, формат файлов): входит в input_digest и
+# Export.format_version; delta/compact не смешивают файлы разных версий.
+# Поднимать при изменении вывода — старые exports перестанут переиспользоваться
+EXPORT_FORMAT_VERSION = 3
+
+# повторяющиеся строки (метки, флаги) — словарь + int32-индексы в памяти и
+# dictionary encoding в parquet
+_DICT_STRING = pa.dictionary(pa.int32(), pa.string())
+
+# схема фиксирована: батчи пишутся в один файл и не могут выводить типы сами
+EXPORT_SCHEMA = pa.schema(
+    [
+        ("request_id", pa.int64()),
+        ("image_id", pa.int64()),
+        ("file_name", pa.string()),
+        ("storage_path", pa.string()),
+        ("sha256", pa.string()),
+        ("labels", pa.list_(_DICT_STRING)),
+        ("annotation_updated_at", pa.timestamp("us", tz="UTC")),
+        ("duplicate_score", pa.float64()),
+        ("duplicate_of_image_id", pa.int64()),
+        ("ai_generated_score", pa.float64()),
+        # имена флагов QC (DUPLICATE, BLURRY, ...); значения — в колонках ниже
+        ("qc_flags", pa.list_(_DICT_STRING)),
+        # NEAR_DUPLICATE
+        ("phash_distance", pa.int32()),
+        # BAD_EXPOSURE: underexposed / overexposed
+        ("exposure_issue", _DICT_STRING),
+        # BAD_RESOLUTION: too_small / bad_aspect
+        ("resolution_issue", _DICT_STRING),
+        (
+            "cross_request_duplicate",
+            pa.struct(
+                [
+                    ("image_id", pa.int64()),
+                    ("request_id", pa.int64()),
+                    ("match", _DICT_STRING),
+                ]
+            ),
+        ),
+        # score 0..1 по детектору качества
+        ("quality_scores", pa.map_(_DICT_STRING, pa.float64())),
+        # train / val / ... (export_split); null — split не запрошен
+        ("split", _DICT_STRING),
+    ]
+)
+
+# flags QCResult: значение флага -> своя типизированная колонка
+_FLAG_VALUE_COLUMNS = {
+    "BAD_EXPOSURE": "exposure_issue",
+    "BAD_RESOLUTION": "resolution_issue",
+    "CROSS_REQUEST_DUPLICATE": "cross_request_duplicate",
+}
+
+PARQUET_CODECS = ("zstd", "snappy", "lz4", "gzip", "none")
+# кодеки с уровнем сжатия: допустимый диапазон
+_CODEC_LEVELS = {"zstd": (1, 22), "gzip": (1, 9)}
+# колонки точечного поиска: Bloom filter при bloom_filter=True
+BLOOM_FILTER_COLUMNS = ("image_id", "sha256")
+# листья parquet arrow-dictionary колонок: pyarrow пишет их только dictionary
+# encoding'ом, dictionary=False отключает его для остальных колонок
+_DICTIONARY_LEAVES = [
+    "labels.list.element",
+    "qc_flags.list.element",
+    "exposure_issue",
+    "resolution_issue",
+    "cross_request_duplicate.match",
+    "quality_scores.key_value.key",
+    "split",
+]
+# bloom_filter_options у ParquetWriter есть только в новых pyarrow (в 15-23 нет);
+# без них bloom_filter=true — 400, а не TypeError в export job
+PARQUET_BLOOM_FILTERS = (
+    "bloom_filter_options" in inspect.signature(pq.ParquetWriter.__init__).parameters
+)
+# ключи Export.params, влияющие на запись parquet
+PARQUET_PARAM_KEYS = (
+    "codec",
+    "compression_level",
+    "row_group_rows",
+    "dictionary",
+    "statistics",
+    "bloom_filter",
+)
+
+
+@dataclass(frozen=True)
+class ParquetOptions:
+    """Кодирование parquet экспорта; не заданное в Export.params — из settings."""
+
+    codec: str
+    compression_level: int | None
+    row_group_rows: int
+    dictionary: bool
+    statistics: bool
+    bloom_filter: bool
+
+    @classmethod
+    def from_params(cls, params: dict | None) -> ParquetOptions:
+        params = params or {}
+
+        def opt(key: str, default):
+            value = params.get(key)
+            return default if value is None else value
+
+        codec = opt("codec", settings.export_parquet_codec)
+        # уровень из settings — только к кодеку по умолчанию
+        level = params.get("compression_level")
+        if level is None and codec == settings.export_parquet_codec:
+            level = settings.export_parquet_compression_level
+        options = cls(
+            codec=codec,
+            compression_level=level,
+            row_group_rows=int(opt("row_group_rows", settings.export_batch_rows)),
+            dictionary=bool(opt("dictionary", settings.export_parquet_dictionary)),
+            statistics=bool(opt("statistics", settings.export_parquet_statistics)),
+            bloom_filter=bool(
+                opt("bloom_filter", settings.export_parquet_bloom_filter)
+            ),
+        )
+        options.validate()
+        return options
+
+    def validate(self) -> None:
+        if self.codec not in PARQUET_CODECS:
+            raise ValueError(f"Unsupported codec: {self.codec!r}")
+        if self.compression_level is not None:
+            lo_hi = _CODEC_LEVELS.get(self.codec)
+            if lo_hi is None:
+                raise ValueError(f"codec={self.codec} has no compression level")
+            if not lo_hi[0] <= self.compression_level <= lo_hi[1]:
+                raise ValueError(
+                    f"compression_level for {self.codec} must be in {list(lo_hi)}"
+                )
+        if self.row_group_rows < 1:
+            raise ValueError("row_group_rows must be >= 1")
+        if self.bloom_filter and not PARQUET_BLOOM_FILTERS:
+            raise ValueError(
+                f"bloom_filter is not supported by the installed pyarrow {pa.__version__}"
+            )
+
+    def writer_kwargs(self) -> dict:
+        """Аргументы pq.ParquetWriter."""
+        kwargs: dict = {
+            "compression": None if self.codec == "none" else self.codec,
+            "compression_level": self.compression_level,
+            "use_dictionary": True if self.dictionary else _DICTIONARY_LEAVES,
+            "write_statistics": self.statistics,
+            # page index: min/max по страницам — точечный image_id без всей row group
+            "write_page_index": self.statistics,
+        }
+        if self.bloom_filter:
+            # фильтр на column chunk: ndv — строк в row group, fpp 5%
+            kwargs["bloom_filter_options"] = {
+                col: {"ndv": self.row_group_rows, "fpp": 0.05}
+                for col in BLOOM_FILTER_COLUMNS
+            }
+        return kwargs
+
+
+@dataclass(frozen=True)
+class ExportSnapshot:
+    """Состояние входа экспорта; снимается до чтения строк."""
+
+    images: ImageSetFingerprint
+    annotations_watermark: datetime | None
+    qc_run_id: int | None
+    annotations_count: int = 0
+
+    def apply(self, exp: Export) -> None:
+        self.images.apply(exp)
+        exp.annotations_watermark = self.annotations_watermark
+        exp.qc_run_id = self.qc_run_id
+
+    def digest(
+        self,
+        kind: str,
+        layout: str,
+        params: dict | None,
+        base_export_id: int | None = None,
+    ) -> str:
+        """
+        sha256 входа + опций: совпал с done export — его файл(ы) и есть результат.
+        compact и full дают одно содержимое; delta зависит ещё и от base.
+        """
+        state = {
+            "v": EXPORT_FORMAT_VERSION,
+            "images": [
+                self.images.count,
+                self.images.max_image_id,
+                self.images.sha_sum,
+            ],
+            "annotations": [
+                self.annotations_count,
+                self.annotations_watermark.isoformat()
+                if self.annotations_watermark
+                else None,
+            ],
+            "qc_run_id": self.qc_run_id,
+            "kind": "delta" if kind == "delta" else "full",
+            "base_export_id": base_export_id if kind == "delta" else None,
+            "layout": layout,
+            "params": params or {},
+        }
+        raw = json.dumps(state, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def take_snapshot(db: Session, request_id: int) -> ExportSnapshot:
+    count, watermark = annotations_state(db, request_id)
+    return ExportSnapshot(
+        images=image_set_fingerprint(db, request_id),
+        annotations_watermark=watermark,
+        qc_run_id=latest_qc_run_id(db, request_id),
+        annotations_count=count,
+    )
+
+
+def check_labeled(db: Session, request_id: int) -> str | None:
+    """Текст ошибки, если images нет или размечены не все; None — можно экспортировать."""
+    total = (
+        db.execute(
+            select(func.count(Image.id)).where(Image.request_id == request_id)
+        ).scalar()
+        or 0
+    )
+    if not total:
+        return "No images"
+
+    labeled = (
+        db.execute(
+            select(func.count(distinct(Annotation.image_id)))
+            .join(Image, Image.id == Annotation.image_id)
+            .where(Image.request_id == request_id)
+        ).scalar()
+        or 0
+    )
+    if labeled >= total:
+        return None
+
+    missing = list(
+        db.execute(
+            select(Image.id)
+            .where(
+                Image.request_id == request_id,
+                ~select(Annotation.id).where(Annotation.image_id == Image.id).exists(),
+            )
+            .order_by(Image.id.asc())
+            .limit(21)
+        ).scalars()
+    )
+    return f"Not all images labeled. Missing image_ids: {missing[:20]}" + (
+        " ..." if len(missing) > 20 else ""
+    )
+
+
+def iter_export_batches(
+    db: Session,
+    request_id: int,
+    batch_rows: int | None = None,
+    token: CancelToken | None = None,
+    snapshot: ExportSnapshot | None = None,
+    since: Export | None = None,
+    split: SplitOptions | None = None,
+) -> Iterator[pa.RecordBatch]:
+    """
+    RecordBatch-и по EXPORT_SCHEMA в порядке image_id.
+    since — delta: только строки, изменившиеся после этого export.
+    split — колонка split и выборка строк (export_split).
+    """
+    qc_run_id = snapshot.qc_run_id if snapshot else latest_qc_run_id(db, request_id)
+    stmt = export_rows_stmt(request_id, qc_run_id, since=since, split=split)
+    stmt = stmt.execution_options(yield_per=batch_rows or settings.export_batch_rows)
+    for part in db.execute(stmt).partitions():
+        if token is not None:
+            token.check()
+        cols: dict[str, list] = {name: [] for name in EXPORT_SCHEMA.names}
+        for (
+            image_id,
+            file_name,
+            storage_path,
+            sha256,
+            labels,
+            updated_at,
+            dup,
+            dup_of,
+            ai,
+            flags,
+            scores,
+            split_name,
+        ) in part:
+            cols["request_id"].append(request_id)
+            cols["image_id"].append(image_id)
+            cols["file_name"].append(file_name)
+            cols["storage_path"].append(storage_path)
+            cols["sha256"].append(sha256)
+            cols["labels"].append(labels)
+            # annotations.updated_at — naive UTC (datetime.utcnow)
+            cols["annotation_updated_at"].append(updated_at)
+            cols["duplicate_score"].append(dup)
+            cols["duplicate_of_image_id"].append(dup_of)
+            cols["ai_generated_score"].append(ai)
+            _append_flags(cols, flags)
+            cols["quality_scores"].append(scores)
+            cols["split"].append(split_name)
+        yield pa.RecordBatch.from_pydict(cols, schema=EXPORT_SCHEMA)
+
+
+def _append_flags(cols: dict[str, list], flags: dict | None) -> None:
+    """QCResult.flags -> qc_flags (имена) + типизированные колонки значений."""
+    if flags is None:
+        # QC по image не было: null, а не "флагов нет"
+        for column in ("qc_flags", "phash_distance", *_FLAG_VALUE_COLUMNS.values()):
+            cols[column].append(None)
+        return
+    # флаги — ключи в верхнем регистре; phash_distance — значение NEAR_DUPLICATE
+    names = sorted(k for k, v in flags.items() if k.isupper() and v)
+    cols["qc_flags"].append(names)
+    cols["phash_distance"].append(flags.get("phash_distance"))
+    for flag, column in _FLAG_VALUE_COLUMNS.items():
+        value = flags.get(flag)
+        cols[column].append(value if value not in (None, True, False) else None)
+
+
+def write_parquet(
+    batches: Iterator[pa.RecordBatch],
+    sink,
+    options: ParquetOptions | None = None,
+) -> int:
+    """Батчи -> parquet в sink (file-like, seek не нужен). Возвращает число строк."""
+    options = options or ParquetOptions.from_params(None)
+    rows = 0
+    with pq.ParquetWriter(
+        pa.PythonFile(sink, mode="w"), EXPORT_SCHEMA, **options.writer_kwargs()
+    ) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
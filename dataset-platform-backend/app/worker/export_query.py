@@ -0,0 +1,166 @@
+"""
+Строки экспорта одним SQL-запросом: image + последняя annotation + QC.
+
+Последняя annotation на image выбирается в БД — DISTINCT ON (image_id) по
+(updated_at DESC, id DESC), индекс ix_annotations_image_latest отдаёт строки
+уже в этом порядке. Python получает ровно одну строку на image, сколько бы
+версий разметки (несколько labeler'ов, переразметка) ни было в annotations.
+
+Результат — column-tuples в порядке EXPORT_ROW_COLUMNS, без ORM-объектов;
+его читают все пути экспорта (export_job, GET /export/stream).
+
+Delta (since=<Export>): только images, изменившиеся после снимка since —
+новые (id > images_max_id), с annotation новее annotations_watermark и
+с QC-результатом, отличным от результата в since.qc_run_id. Watermark
+берётся с запасом (settings.export_delta_watermark_margin_s): updated_at
+ставит приложение до commit, и annotation, закоммиченная после снимка, может
+оказаться старше watermark. Строки из запаса попадают в delta повторно —
+это безопасно, при чтении цепочки побеждает последний файл.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import Select, String, and_, cast, func, null, or_, select, true
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session, aliased
+
+from app.core.config import settings
+from app.models.annotation import Annotation
+from app.models.export import Export
+from app.models.image import Image
+from app.models.qc import QCResult, QCRun
+from app.worker.export_split import SplitOptions, split_assignment
+
+EXPORT_ROW_COLUMNS = (
+    "image_id",
+    "file_name",
+    "storage_path",
+    "sha256",
+    "labels",
+    "annotation_updated_at",
+    "duplicate_score",
+    "duplicate_of_image_id",
+    "ai_generated_score",
+    "qc_flags",
+    "quality_scores",
+    "split",
+)
+
+
+def latest_qc_run_id(db: Session, request_id: int) -> int | None:
+    """Последний завершённый QC run (результаты running / failed — неполные)."""
+    return db.execute(
+        select(QCRun.id)
+        .where(QCRun.request_id == request_id, QCRun.status == "done")
+        .order_by(QCRun.id.desc())
+        .limit(1)
+    ).scalar()
+
+
+def latest_annotations(request_id: int):
+    """Подзапрос (image_id, labels, updated_at): одна, самая свежая, строка на image."""
+    return (
+        select(Annotation.image_id, Annotation.labels, Annotation.updated_at)
+        .join(Image, Image.id == Annotation.image_id)
+        .where(Image.request_id == request_id)
+        .distinct(Annotation.image_id)
+        .order_by(
+            Annotation.image_id.asc(),
+            Annotation.updated_at.desc(),
+            Annotation.id.desc(),
+        )
+        .subquery("latest_ann")
+    )
+
+
+def annotations_state(db: Session, request_id: int) -> tuple[int, datetime | None]:
+    """
+    (count, max(updated_at)) annotations заявки. max — граница следующей delta;
+    вместе с count — отпечаток разметки (новая/изменённая annotation сдвигает
+    max, удалённая — count).
+    """
+    count, watermark = db.execute(
+        select(func.count(Annotation.id), func.max(Annotation.updated_at))
+        .join(Image, Image.id == Annotation.image_id)
+        .where(Image.request_id == request_id)
+    ).one()
+    return int(count), watermark
+
+
+def _changed_since(stmt: Select, since: Export, qc_run_id: int | None) -> Select:
+    new_images = (
+        Image.id > since.images_max_id if since.images_max_id is not None else true()
+    )
+    relabeled = select(Annotation.id).where(Annotation.image_id == Image.id)
+    if since.annotations_watermark is not None:
+        margin = timedelta(seconds=settings.export_delta_watermark_margin_s)
+        relabeled = relabeled.where(
+            Annotation.updated_at > since.annotations_watermark - margin
+        )
+    relabeled = relabeled.exists()
+    conditions = [new_images, relabeled]
+    if qc_run_id != since.qc_run_id:
+        # QC перезапускали: строка изменилась, если её результат не совпал со
+        # старым (нет в обоих run'ах — не изменилась)
+        old = aliased(QCResult)
+        stmt = stmt.outerjoin(
+            old, and_(old.qc_run_id == since.qc_run_id, old.image_id == Image.id)
+        )
+        conditions += [
+            QCResult.duplicate_score.is_distinct_from(old.duplicate_score),
+            QCResult.duplicate_of_image_id.is_distinct_from(old.duplicate_of_image_id),
+            QCResult.ai_generated_score.is_distinct_from(old.ai_generated_score),
+            cast(QCResult.flags, JSONB).is_distinct_from(cast(old.flags, JSONB)),
+            cast(QCResult.scores, JSONB).is_distinct_from(cast(old.scores, JSONB)),
+        ]
+    return stmt.where(or_(*conditions))
+
+
+def export_rows_stmt(
+    request_id: int,
+    qc_run_id: int | None,
+    since: Export | None = None,
+    split: SplitOptions | None = None,
+) -> Select:
+    """
+    SELECT по EXPORT_ROW_COLUMNS в порядке image_id. Без annotation / QC —
+    NULL в соответствующих колонках (LEFT JOIN). since — только delta.
+    split — колонка split и выборка строк (export_split); без него split NULL.
+    """
+    ann = latest_annotations(request_id)
+    assigned = (
+        split_assignment(request_id, qc_run_id, split, latest_annotations(request_id))
+        if split
+        else None
+    )
+    stmt = (
+        select(
+            Image.id,
+            Image.file_name,
+            Image.storage_path,
+            Image.sha256,
+            ann.c.labels,
+            ann.c.updated_at,
+            QCResult.duplicate_score,
+            QCResult.duplicate_of_image_id,
+            QCResult.ai_generated_score,
+            QCResult.flags,
+            QCResult.scores,
+            assigned.c.split if assigned is not None else cast(null(), String),
+        )
+        .outerjoin(ann, ann.c.image_id == Image.id)
+        .outerjoin(
+            QCResult,
+            and_(QCResult.qc_run_id == qc_run_id, QCResult.image_id == Image.id),
+        )
+        .where(Image.request_id == request_id)
+        .order_by(Image.id.asc())
+    )
+    if assigned is not None:
+        # строки, не прошедшие выборку, в split_assignment отсутствуют
+        stmt = stmt.join(assigned, assigned.c.image_id == Image.id)
+    if since is not None:
+        stmt = _changed_since(stmt, since, qc_run_id)
+    return stmt
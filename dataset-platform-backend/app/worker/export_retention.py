@@ -0,0 +1,147 @@
+"""
+Retention бакета exports: done exports, которые больше не нужны, -> expired.
+
+Объекты export удаляются из S3, строка Export остаётся (status=expired,
+storage_path/files — для истории); reuse и delta её больше не видят.
+На заявку держим:
+- самый новый done export каждого input_digest (старые копии того же
+  содержимого — дубли, например после force);
+- из них — settings.export_retention_keep_last самых новых (0 — все);
+- всё моложе settings.export_retention_min_age_s;
+- base'ы цепочек оставленных deltas (без них delta не прочитать) и
+  цепочки, которые сейчас читают queued/running delta и compact.
+
+Запускается после каждого done export (по его заявке), задачей
+export.retention и вручную:
+    python -m app.worker.export_retention                  # все заявки
+    python -m app.worker.export_retention --request-id 12 --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.s3 import S3Client, parse_s3_uri
+from app.models.export import Export
+from app.worker.cancel import ACTIVE_STATUSES
+
+EXPIRED = "expired"
+
+
+def plan_expired(
+    exports: list[Export],
+    keep_last: int | None = None,
+    min_age_s: int | None = None,
+    now: datetime | None = None,
+    pinned: set[int] | frozenset[int] = frozenset(),
+) -> list[Export]:
+    """
+    done exports одной заявки -> те, что можно удалить (по убыванию id).
+    pinned — id, которые держим с их цепочками (base активных exports).
+    """
+    keep_last = settings.export_retention_keep_last if keep_last is None else keep_last
+    min_age = timedelta(
+        seconds=settings.export_retention_min_age_s if min_age_s is None else min_age_s
+    )
+    now = now or datetime.now(timezone.utc)
+    by_id = {ex.id: ex for ex in exports}
+
+    keep: set[int] = set()
+    seen_digests: set[str] = set()
+    distinct = 0
+    for ex in sorted(exports, key=lambda e: e.id, reverse=True):
+        created = ex.created_at
+        if created is not None and created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        young = created is not None and now - created < min_age
+        duplicate = ex.input_digest is not None and ex.input_digest in seen_digests
+        if ex.input_digest is not None:
+            seen_digests.add(ex.input_digest)
+        if not duplicate:
+            distinct += 1
+        if young or (not duplicate and (not keep_last or distinct <= keep_last)):
+            keep.add(ex.id)
+
+    keep |= pinned & by_id.keys()
+    # delta читается только вместе с base и предыдущими deltas цепочки
+    for ex_id in list(keep):
+        ex = by_id[ex_id]
+        while ex.kind == "delta" and ex.base_export_id in by_id:
+            ex = by_id[ex.base_export_id]
+            keep.add(ex.id)
+
+    return [
+        ex
+        for ex in sorted(exports, key=lambda e: e.id, reverse=True)
+        if ex.id not in keep
+    ]
+
+
+def export_keys(s3: S3Client, ex: Export) -> tuple[str, list[str]]:
+    """(bucket, ключи объектов export): файл или всё под префиксом."""
+    bucket, key = parse_s3_uri(ex.storage_path)
+    if key.endswith("/"):
+        return bucket, s3.list_keys(bucket=bucket, prefix=key)
+    return bucket, [key]
+
+
+def apply_retention(
+    db: Session,
+    s3: S3Client,
+    request_id: int | None = None,
+    dry_run: bool = False,
+) -> list[int]:
+    """Удалить объекты лишних exports (заявки или всех), -> их id."""
+    stmt = select(Export).where(Export.status.in_(("done", *ACTIVE_STATUSES)))
+    if request_id is not None:
+        stmt = stmt.where(Export.request_id == request_id)
+    by_request: dict[int, list[Export]] = {}
+    pinned: set[int] = set()
+    for ex in db.execute(stmt).scalars():
+        if ex.status == "done":
+            by_request.setdefault(ex.request_id, []).append(ex)
+        elif ex.base_export_id is not None:
+            pinned.add(ex.base_export_id)
+
+    expired: list[int] = []
+    for exports in by_request.values():
+        for ex in plan_expired(exports, pinned=pinned):
+            expired.append(ex.id)
+            if dry_run:
+                continue
+            if ex.storage_path:
+                bucket, keys = export_keys(s3, ex)
+                if keys:
+                    s3.delete_objects(bucket=bucket, keys=keys)
+            # по одному: упали на середине — удалённые уже помечены
+            ex.status = EXPIRED
+            db.commit()
+    return expired
+
+
+def main() -> None:
+    import app.models  # noqa: F401  (регистрация всех моделей для FK)
+    from app.core.config import get_s3_client
+    from app.db.session import SessionLocal
+
+    ap = argparse.ArgumentParser(description="Exports bucket retention")
+    ap.add_argument("--request-id", type=int)
+    ap.add_argument("--dry-run", action="store_true", help="только показать")
+    args = ap.parse_args()
+
+    db = SessionLocal()
+    try:
+        ids = apply_retention(db, get_s3_client(), args.request_id, args.dry_run)
+        verb = "would expire" if args.dry_run else "expired"
+        print(f"exports: {verb} {len(ids)}: {ids}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
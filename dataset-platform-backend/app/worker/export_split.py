@@ -0,0 +1,312 @@
+"""
+Детерминированный split train/val/test и выборка строк для экспорта.
+
+Ключ — sha256 содержимого image, у image без sha256 — его id (при
+split_key=image_id — всегда id). Доля = первые 8 байт sha256(seed:key) как
+число в [0, 1), split — по накопленным долям ratios. Тот же файл при повторном
+экспорте и в другой заявке попадает в тот же split; одинаковые файлы (точные
+дубли) — всегда в один.
+
+Считается в SQL одним подзапросом к строкам экспорта (split_assignment):
+- группа дублей: images, связанные QC duplicate_of_image_id (точные и near,
+  цепочки транзитивно — рекурсивный CTE от корня), делится как одно целое:
+  ключ, метки и split группы — её корня (самого раннего image);
+- stratify: внутри каждого класса (набор меток корня, "cat|dog") группы
+  упорядочены по доле и режутся по рангу — доли train/val/test точные в каждом
+  классе (с точностью до группы). Ранг зависит от всего набора: при новых
+  images split соседей может сдвинуться (без stratify split строки от других
+  строк не зависит);
+- sample_fraction / max_per_class: группы с долей sha256(seed:sample:key) ниже
+  fraction / первые по ней, пока в классе не набрано max_per_class images
+  (группа дублей не делится — класс может выйти за cap на её размер).
+  Выборка не зависит от split: меньший sample_fraction — подмножество большего.
+
+hash_fraction / pick_split — то же на Python (клиенты; совпадение с SQL —
+tests/test_export_split_sql.py).
+"""
+
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Numeric,
+    String,
+    and_,
+    case,
+    cast,
+    func,
+    literal,
+    literal_column,
+    null,
+    or_,
+    select,
+)
+from sqlalchemy.dialects.postgresql import BIT, aggregate_order_by
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.models.image import Image
+from app.models.qc import QCResult
+
+SPLIT_KEYS = ("sha256", "image_id")
+# ключи Export.params, влияющие на split / выборку строк
+SPLIT_PARAM_KEYS = (
+    "split",
+    "split_ratios",
+    "split_seed",
+    "split_key",
+    "stratify",
+    "max_per_class",
+    "sample_fraction",
+)
+
+_TWO_64 = literal_column("18446744073709551616::numeric")
+
+
+def split_key(image_id: int, sha256: str | None) -> str:
+    return sha256 or f"id:{image_id}"
+
+
+def hash_fraction(key: str, seed: str = "") -> float:
+    digest = hashlib.sha256(f"{seed}:{key}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64
+
+
+def normalize_ratios(ratios: dict[str, float] | None) -> dict[str, float]:
+    """Доли > 0 в заданном порядке, в сумме 1."""
+    ratios = {k: float(v) for k, v in (ratios or settings.export_split_ratios).items()}
+    if not ratios or any(v < 0 for v in ratios.values()) or sum(ratios.values()) <= 0:
+        raise ValueError(f"Invalid split ratios: {ratios}")
+    total = sum(ratios.values())
+    return {k: v / total for k, v in ratios.items() if v > 0}
+
+
+def parse_ratios(value: str) -> dict[str, float]:
+    """ "train=0.8,val=0.1,test=0.1" -> dict (для query-параметра)."""
+    ratios: dict[str, float] = {}
+    for item in value.split(","):
+        name, _, share = item.partition("=")
+        try:
+            ratios[name.strip()] = float(share)
+        except ValueError:
+            raise ValueError(
+                f"Invalid split ratios: {value!r} (expected name=share,...)"
+            ) from None
+    return normalize_ratios(ratios)
+
+
+def pick_split(fraction: float, ratios: dict[str, float]) -> str:
+    acc = 0.0
+    for name, share in ratios.items():
+        acc += share
+        if fraction < acc:
+            return name
+    return name  # fraction ~ 1.0 при накопленной погрешности
+
+
+def hash_split(key: str, ratios: dict[str, float], seed: str = "") -> str:
+    """ratios — уже нормализованные (normalize_ratios)."""
+    return pick_split(hash_fraction(key, seed), ratios)
+
+
+@dataclass(frozen=True)
+class SplitOptions:
+    """
+    Split / выборка строк экспорта из Export.params. ratios=None — колонка
+    split пустая (только выборка).
+    """
+
+    ratios: dict[str, float] | None
+    seed: str = ""
+    key: str = "sha256"
+    stratify: bool = False
+    max_per_class: int | None = None
+    sample_fraction: float | None = None
+
+    @classmethod
+    def from_params(cls, params: dict | None) -> SplitOptions | None:
+        """None — params не просят ни split, ни выборки."""
+        params = params or {}
+        split = bool(params.get("split")) or params.get("partition_by") == "split"
+        sample = params.get("sample_fraction")
+        cap = params.get("max_per_class")
+        if not split and sample is None and cap is None:
+            if params.get("stratify"):
+                raise ValueError("stratify requires split")
+            return None
+        options = cls(
+            ratios=normalize_ratios(params.get("split_ratios")) if split else None,
+            seed=params.get("split_seed") or "",
+            key=params.get("split_key") or "sha256",
+            stratify=bool(params.get("stratify")),
+            max_per_class=None if cap is None else int(cap),
+            sample_fraction=None if sample is None else float(sample),
+        )
+        options.validate()
+        return options
+
+    def validate(self) -> None:
+        if self.key not in SPLIT_KEYS:
+            raise ValueError(f"Unsupported split_key: {self.key!r}")
+        if self.stratify and self.ratios is None:
+            raise ValueError("stratify requires split")
+        if self.max_per_class is not None and self.max_per_class < 1:
+            raise ValueError("max_per_class must be >= 1")
+        if self.sample_fraction is not None and not 0 < self.sample_fraction <= 1:
+            raise ValueError("sample_fraction must be in (0, 1]")
+
+
+def _hash_fraction_sql(key, seed: str):
+    """hash_fraction в SQL: numeric в [0, 1)."""
+    digest = func.sha256(
+        func.convert_to(literal(f"{seed}:", String).concat(key), "UTF8")
+    )
+    head = literal("x", String).concat(func.encode(func.substring(digest, 1, 8), "hex"))
+    signed = cast(cast(head, BIT(64)), BigInteger)
+    # bit(64)::bigint — со знаком, доля — от беззнакового
+    unsigned = cast(signed, Numeric) + case((signed < 0, _TWO_64), else_=0)
+    return unsigned / _TWO_64
+
+
+def _pick_split_sql(fraction, ratios: dict[str, float]):
+    whens, acc = [], 0.0
+    names = list(ratios)
+    for name in names[:-1]:
+        acc += ratios[name]
+        whens.append((fraction < literal(acc, Numeric), name))
+    return case(*whens, else_=names[-1]) if whens else literal(names[-1], String)
+
+
+def duplicate_groups(request_id: int, qc_run_id: int | None):
+    """
+    CTE (image_id, root_id): корень группы дублей QC для каждого image заявки.
+    duplicate_of_image_id указывает на более ранний image, цепочки (near-дубль
+    near-дубля) сходятся к корню; ссылка вне заявки — image сам себе корень.
+    """
+    target = aliased(Image)
+    roots = (
+        select(Image.id.label("image_id"), Image.id.label("root_id"))
+        .outerjoin(
+            QCResult,
+            and_(QCResult.qc_run_id == qc_run_id, QCResult.image_id == Image.id),
+        )
+        .where(
+            Image.request_id == request_id,
+            or_(
+                QCResult.duplicate_of_image_id.is_(None),
+                ~select(target.id)
+                .where(
+                    target.id == QCResult.duplicate_of_image_id,
+                    target.request_id == request_id,
+                )
+                .exists(),
+            ),
+        )
+        .cte("dup_groups", recursive=True)
+    )
+    child = aliased(QCResult)
+    return roots.union(
+        select(child.image_id, roots.c.root_id)
+        .join(roots, child.duplicate_of_image_id == roots.c.image_id)
+        .where(child.qc_run_id == qc_run_id)
+    )
+
+
+def _label_set(labels):
+    """
+    Класс для stratify / max_per_class: метки через "|" по алфавиту.
+    labels не массив (default annotation — {}, null) — класс "".
+    """
+    array = case(
+        (func.json_typeof(labels) == "array", labels),
+        else_=cast(literal("[]"), JSON),
+    )
+    elem = func.json_array_elements_text(array).table_valued("value")
+    agg = func.string_agg(elem.c.value, aggregate_order_by(literal("|"), elem.c.value))
+    return func.coalesce(
+        select(agg).select_from(elem).scalar_subquery(), literal("", String)
+    )
+
+
+def split_assignment(
+    request_id: int, qc_run_id: int | None, options: SplitOptions, labels
+):
+    """
+    Подзапрос (image_id, split): только images, прошедшие выборку.
+    labels — подзапрос последних annotations (export_query.latest_annotations).
+    """
+    members = duplicate_groups(request_id, qc_run_id)
+    sizes = (
+        select(members.c.root_id, func.count().label("size"))
+        .group_by(members.c.root_id)
+        .subquery("dup_sizes")
+    )
+    root = aliased(Image)
+    key = (
+        literal("id:", String).concat(cast(root.id, String))
+        if options.key == "image_id"
+        else func.coalesce(
+            root.sha256, literal("id:", String).concat(cast(root.id, String))
+        )
+    )
+    classed = options.stratify or options.max_per_class is not None
+    groups = (
+        select(
+            sizes.c.root_id,
+            sizes.c.size,
+            _hash_fraction_sql(key, options.seed).label("fraction"),
+            _hash_fraction_sql(key, f"{options.seed}:sample").label("pick"),
+            (_label_set(labels.c.labels) if classed else literal("", String)).label(
+                "stratum"
+            ),
+        )
+        .join(root, root.id == sizes.c.root_id)
+        .outerjoin(labels, labels.c.image_id == root.id)
+    )
+    groups = groups.subquery("split_groups")
+    if options.sample_fraction is not None:
+        groups = (
+            select(groups)
+            .where(groups.c.pick < literal(options.sample_fraction, Numeric))
+            .subquery("split_sampled")
+        )
+    if options.max_per_class is not None:
+        # images класса до этой группы включительно, по порядку выборки
+        taken = func.sum(groups.c.size).over(
+            partition_by=groups.c.stratum,
+            order_by=(groups.c.pick, groups.c.root_id),
+        )
+        capped = select(groups, taken.label("taken")).subquery("split_ranked")
+        groups = (
+            select(*(capped.c[col.name] for col in groups.c))
+            .where(capped.c.taken - capped.c.size < options.max_per_class)
+            .subquery("split_capped")
+        )
+
+    if options.ratios is None:
+        split = cast(null(), String)
+    elif options.stratify:
+        rank = func.row_number().over(
+            partition_by=groups.c.stratum,
+            order_by=(groups.c.fraction, groups.c.root_id),
+        )
+        total = func.count().over(partition_by=groups.c.stratum)
+        ranked = select(
+            groups.c.root_id,
+            # середина ранга: 3 группы при 0.8/0.1/0.1 -> train, train, test
+            ((cast(rank, Numeric) - 0.5) / total).label("position"),
+        ).subquery("split_strata")
+        groups = ranked
+        split = _pick_split_sql(ranked.c.position, options.ratios)
+    else:
+        split = _pick_split_sql(groups.c.fraction, options.ratios)
+
+    return (
+        select(members.c.image_id, split.label("split"))
+        .join(groups, groups.c.root_id == members.c.root_id)
+        .subquery("split_assignment")
+    )
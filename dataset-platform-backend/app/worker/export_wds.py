@@ -0,0 +1,259 @@
+"""
+layout=webdataset: tar shards в формате WebDataset с байтами images внутри.
+
+    requests/{id}/exports/wds_{ts}_{export_id}/
+        shard-000000.tar
+        shard-000001.tar
+        index.parquet
+
+sample = два члена tar с общим ключом (WebDataset группирует по нему):
+    000000001234.jpg   — исходные байты объекта из storage_path
+    000000001234.json  — метки, sha256, QC (строка экспорта без storage_path)
+
+Картинки читаются ImageStream(decode=None): ограниченный thread pool GET'ов
+в порядке строк экспорта и бюджет байт в полёте. Shard пишется потоково
+(tarfile "w|") в S3MultipartWriter; UploadPart уходят через общий
+S3UploadPool, пока набирается следующий part/shard. Shard закрывается, когда
+дорос до shard_bytes (sample не делится между shards).
+
+index.parquet — строка на sample: shard и смещения данных обоих членов в нём;
+читатель берёт картинку Range GET'ом bytes=offset..offset+size-1, не листая tar.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+import os
+import tarfile
+import time
+from collections import deque
+from collections.abc import Iterator
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from botocore.exceptions import BotoCoreError, ClientError
+
+from app.core.config import settings
+from app.core.s3 import S3Client, S3UploadPool
+from app.worker.cancel import CancelToken
+from app.worker.export_engine import PARQUET_CONTENT_TYPE
+from app.worker.image_source import ImageStream
+
+TAR_CONTENT_TYPE = "application/x-tar"
+
+INDEX_SCHEMA = pa.schema(
+    [
+        ("key", pa.string()),
+        ("image_id", pa.int64()),
+        ("shard", pa.string()),
+        ("image_member", pa.string()),
+        ("image_offset", pa.int64()),
+        ("image_size", pa.int64()),
+        ("json_offset", pa.int64()),
+        ("json_size", pa.int64()),
+    ]
+)
+
+
+def sample_key(image_id: int) -> str:
+    # фиксированная ширина: лексикографический порядок = порядок image_id
+    return f"{image_id:012d}"
+
+
+def image_ext(file_name: str | None) -> str:
+    ext = os.path.splitext(file_name or "")[1].lower().lstrip(".")
+    # "." в расширении WebDataset трактует как составной ключ
+    return ext if ext and ext.isalnum() else "img"
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _sample_json(row: dict) -> bytes:
+    # путь в storage читателю shard не нужен; map -> dict
+    meta = {k: v for k, v in row.items() if k != "storage_path"}
+    if meta.get("quality_scores") is not None:
+        meta["quality_scores"] = dict(meta["quality_scores"])
+    return json.dumps(meta, ensure_ascii=False, default=_json_default).encode()
+
+
+class _Shard:
+    def __init__(self, out, name: str) -> None:
+        self.out = out
+        self.name = name
+        self.tar = tarfile.open(fileobj=out, mode="w|", format=tarfile.PAX_FORMAT)
+        self.samples = 0
+
+    def add(self, member: str, data: bytes, mtime: float) -> int:
+        """Добавить файл; -> смещение его данных в shard."""
+        info = tarfile.TarInfo(member)
+        info.size = len(data)
+        info.mtime = mtime
+        self.tar.addfile(info, io.BytesIO(data))
+        # после addfile offset стоит за данными, выровненными на блок 512
+        blocks = -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        return self.tar.offset - blocks
+
+    @property
+    def size(self) -> int:
+        return self.tar.offset
+
+
+class ShardWriter:
+    """Samples -> tar shards под prefix (оканчивается на "/") + index.parquet."""
+
+    def __init__(
+        self,
+        s3: S3Client,
+        bucket: str,
+        prefix: str,
+        *,
+        shard_bytes: int | None = None,
+        part_size: int | None = None,
+        pool: S3UploadPool | None = None,
+    ) -> None:
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.shard_bytes = shard_bytes or settings.export_shard_bytes
+        self.part_size = part_size or settings.export_part_bytes
+        self.pool = pool
+        self.files: list[dict] = []
+        self.samples = 0
+        self._shard: _Shard | None = None
+        self._index_rows: list[dict] = []
+        self._index_out = s3.open_multipart(
+            bucket=bucket,
+            key=f"{prefix}index.parquet",
+            content_type=PARQUET_CONTENT_TYPE,
+            part_size=self.part_size,
+        )
+        self._index = pq.ParquetWriter(
+            pa.PythonFile(self._index_out, mode="w"), INDEX_SCHEMA
+        )
+        self._mtime = time.time()
+
+    def _open_shard(self) -> _Shard:
+        name = f"shard-{len(self.files):06d}.tar"
+        out = self.s3.open_multipart(
+            bucket=self.bucket,
+            key=f"{self.prefix}{name}",
+            content_type=TAR_CONTENT_TYPE,
+            part_size=self.part_size,
+            pool=self.pool,
+        )
+        # запись в files сразу: abort удалит и недописанный shard
+        self.files.append({"path": name, "rows": 0, "bytes": 0})
+        return _Shard(out, name)
+
+    def add(self, row: dict, data: bytes) -> None:
+        if self._shard is None:
+            self._shard = self._open_shard()
+        shard = self._shard
+        key = sample_key(int(row["image_id"]))
+        member = f"{key}.{image_ext(row.get('file_name'))}"
+        meta = _sample_json(row)
+        image_offset = shard.add(member, data, self._mtime)
+        json_offset = shard.add(f"{key}.json", meta, self._mtime)
+        shard.samples += 1
+        self.samples += 1
+        self._index_rows.append(
+            {
+                "key": key,
+                "image_id": int(row["image_id"]),
+                "shard": shard.name,
+                "image_member": member,
+                "image_offset": image_offset,
+                "image_size": len(data),
+                "json_offset": json_offset,
+                "json_size": len(meta),
+            }
+        )
+        if shard.size >= self.shard_bytes:
+            self._close_shard()
+
+    def _close_shard(self) -> None:
+        shard, self._shard = self._shard, None
+        shard.tar.close()  # блоки конца архива; fileobj не закрывает
+        shard.out.close()
+        self.files[-1].update(rows=shard.samples, bytes=shard.out.bytes_written)
+        if self._index_rows:
+            self._index.write_table(
+                pa.Table.from_pylist(self._index_rows, schema=INDEX_SCHEMA)
+            )
+            self._index_rows = []
+
+    def close(self) -> None:
+        if self._shard is not None:
+            self._close_shard()
+        self._index.close()
+        self._index_out.close()
+
+    def abort(self) -> None:
+        """Открытые uploads — abort, готовые shards — удалить."""
+        if self._shard is not None:
+            self._shard.out.abort()
+            self._shard = None
+            self.files.pop()
+        # footer уйдёт в буфер отменяемого upload; не закрыть — его допишет
+        # ParquetWriter.__del__ уже в закрытый writer
+        with contextlib.suppress(Exception):
+            self._index.close()
+        self._index_out.abort()
+        keys = [f"{self.prefix}{f['path']}" for f in self.files]
+        if keys:
+            self.s3.delete_objects(bucket=self.bucket, keys=keys)
+
+
+def write_shards(
+    batches: Iterator[pa.RecordBatch],
+    writer: ShardWriter,
+    token: CancelToken | None = None,
+) -> int:
+    """Строки экспорта + байты их images -> shards; ошибка/отмена -> всё удаляется."""
+    rows: deque[dict] = deque()
+
+    def refs():
+        for batch in batches:
+            for row in batch.to_pylist():
+                rows.append(row)
+                yield row["image_id"], row["storage_path"]
+
+    def images(stream: ImageStream):
+        items = iter(stream)
+        while True:
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            except (OSError, ClientError, BotoCoreError) as e:
+                # не прочиталась первая ещё не записанная строка
+                row = rows[0]
+                raise RuntimeError(
+                    f"image_id={row['image_id']}: cannot read {row['storage_path']}: {e}"
+                ) from e
+            yield item
+
+    try:
+        with ImageStream(
+            refs(),
+            concurrency=settings.export_fetch_concurrency,
+            max_bytes_in_flight=settings.export_fetch_max_bytes_in_flight,
+            decode=None,
+        ) as stream:
+            # ImageStream отдаёт items в порядке refs — row слева тот же
+            for item in images(stream):
+                writer.add(rows.popleft(), item.data)
+        if token is not None:
+            token.check(force=True)
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.samples
@@ -0,0 +1,168 @@
+"""
+Ingest метаданных картинок: width/height/format/EXIF orientation из заголовка.
+
+Качаем не объект целиком, а первые image_meta_head_bytes (S3 Range GET /
+read(n) локального файла). Если заголовок не поместился (большой EXIF/ICC
+перед SOF у JPEG) — повторяем с удвоенным окном до image_meta_max_bytes.
+
+Задача images.extract_metadata ставится из upload confirm / multipart upload
+с небольшим countdown и забирает ожидающие images батчами через
+SELECT ... FOR UPDATE SKIP LOCKED — параллельные задачи не делают работу дважды.
+
+Догнать старые images:
+    python -m app.worker.image_meta backfill [--request-id N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from PIL import Image as PILImage
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import get_s3_client, settings
+from app.core.s3 import parse_s3_uri
+from app.models.image import Image
+
+EXIF_ORIENTATION = 0x0112
+
+
+@dataclass
+class ImageMeta:
+    width: int | None = None
+    height: int | None = None
+    image_format: str | None = None
+    orientation: int | None = None
+
+
+def _read_range(storage_path: str, start: int, length: int) -> bytes:
+    if storage_path.startswith("s3://"):
+        bucket, key = parse_s3_uri(storage_path)
+        return get_s3_client().get_range(
+            bucket=bucket, key=key, start=start, length=length
+        )
+    with open(storage_path, "rb") as f:
+        f.seek(start)
+        return f.read(length)
+
+
+def parse_header(data: bytes) -> ImageMeta | None:
+    """
+    Разбор заголовка без декодирования пикселей (PIL.Image.open ленивый).
+    None — данных не хватило или формат не распознан.
+    """
+    try:
+        with PILImage.open(io.BytesIO(data)) as pil:
+            meta = ImageMeta(
+                width=int(pil.width),
+                height=int(pil.height),
+                image_format=(pil.format or "").lower() or None,
+            )
+            try:
+                orientation = pil.getexif().get(EXIF_ORIENTATION)
+            except (OSError, ValueError, SyntaxError):
+                orientation = None
+            if isinstance(orientation, int) and 1 <= orientation <= 8:
+                meta.orientation = orientation
+            return meta
+    except (OSError, ValueError, SyntaxError, PILImage.DecompressionBombError):
+        return None
+
+
+def read_meta(storage_path: str) -> ImageMeta:
+    """
+    Range GET с растущим окном (докачиваем только хвост);
+    не разобрался и на max — пустые метаданные.
+    """
+    length = max(1024, settings.image_meta_head_bytes)
+    data = b""
+    while True:
+        data += _read_range(storage_path, len(data), length - len(data))
+        meta = parse_header(data)
+        if meta is not None:
+            return meta
+        # объект кончился раньше окна — больше читать нечего
+        if len(data) < length or length >= settings.image_meta_max_bytes:
+            return ImageMeta()
+        length = min(length * 2, settings.image_meta_max_bytes)
+
+
+def _claim_batch(
+    db: Session, request_id: int | None, limit: int, skip: set[int]
+) -> list[Image]:
+    stmt = (
+        select(Image)
+        .where(Image.meta_extracted_at.is_(None))
+        .order_by(Image.id.asc())
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    if request_id is not None:
+        stmt = stmt.where(Image.request_id == request_id)
+    if skip:
+        stmt = stmt.where(Image.id.not_in(skip))
+    return list(db.execute(stmt).scalars())
+
+
+def extract_pending(db: Session, request_id: int | None = None) -> dict:
+    """
+    Обработать все images без метаданных (заявки или все). Коммит на каждый батч.
+    Не картинка / битый заголовок -> meta_extracted_at проставлен, width = None.
+    Ошибка чтения (S3/FS) не валит батч: image остаётся в очереди
+    (подберёт следующая задача по заявке или ручной backfill).
+    """
+    done = unparsed = errors = 0
+    skip: set[int] = set()
+    batch_size = max(1, settings.image_meta_batch_size)
+
+    def _safe(path: str) -> ImageMeta | Exception:
+        try:
+            return read_meta(path)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, settings.qc_read_concurrency)) as pool:
+        while batch := _claim_batch(db, request_id, batch_size, skip):
+            metas = list(pool.map(_safe, [img.storage_path for img in batch]))
+            now = datetime.now(timezone.utc)
+            for img, meta in zip(batch, metas, strict=True):
+                if isinstance(meta, Exception):
+                    errors += 1
+                    skip.add(img.id)
+                    continue
+                if meta.width is None:
+                    unparsed += 1
+                else:
+                    done += 1
+                img.width = meta.width
+                img.height = meta.height
+                img.image_format = meta.image_format
+                img.orientation = meta.orientation
+                img.meta_extracted_at = now
+            db.commit()
+    return {"ok": True, "extracted": done, "unparsed": unparsed, "errors": errors}
+
+
+def main() -> None:
+    import app.models  # noqa: F401  (регистрация всех моделей для FK)
+    from app.db.session import SessionLocal
+
+    ap = argparse.ArgumentParser(description="Image metadata ingest")
+    ap.add_argument("command", choices=["backfill"])
+    ap.add_argument("--request-id", type=int, default=None)
+    args = ap.parse_args()
+
+    db = SessionLocal()
+    try:
+        print(extract_pending(db, args.request_id))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Streaming чтение картинок для QC по Image.storage_path (s3://... или локальный путь).
+
+- GET'ы идут параллельно в thread pool (prefetch), порядок выдачи = порядок входа;
+- prefetch ограничен max_bytes_in_flight (скачанное + decoded, ещё не отданное
+  потребителю): поток ждёт бюджет до чтения тела, так что память фиксирована
+  при любом размере заявки (~ max_bytes_in_flight + concurrency decoded
+  images сверх лимита + один батч у потребителя);
+- декодирование тоже в потоках, наружу — батчи decoded PIL images.
+  Картинки предыдущего батча закрываются, когда потребитель запрашивает
+  следующий батч.
+
+    with ImageStream((img.id, img.storage_path) for img in images) as stream:
+        for batch in stream.batches(64):
+            for item in batch:
+                if item.image is not None:
+                    ...
+
+decode=None — без декодирования: item.data = байты объекта как есть
+(экспорт с картинками), бюджет считается по ним.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+from PIL import Image as PILImage
+
+from app.core.config import get_s3_client, settings
+from app.core.s3 import parse_s3_uri
+
+_READ_CHUNK = 1024 * 1024
+
+DECODE_ERRORS = (OSError, ValueError, PILImage.DecompressionBombError)
+
+
+def decode_image(data: bytes | bytearray) -> PILImage.Image:
+    """bytes -> полностью загруженный PIL image (bytes после этого не нужны)."""
+    pil = PILImage.open(io.BytesIO(data))
+    pil.load()
+    return pil
+
+
+@dataclass
+class StreamItem:
+    image_id: int
+    storage_path: str
+    # None — файл не декодируется как изображение (см. error)
+    image: PILImage.Image | None
+    error: str | None
+    # размер объекта в storage
+    nbytes: int
+    # исходные байты (только ImageStream(decode=None))
+    data: bytes | None = None
+
+
+@dataclass
+class _Fetched:
+    item: StreamItem
+    # сколько бюджета держит item (decoded size или nbytes)
+    budget: int
+
+
+class _ByteBudget:
+    """
+    Семафор по байтам с FIFO-очередью билетов: бюджет выдаётся строго в порядке
+    входа, иначе поздние объекты могли бы занять его раньше того, которого ждёт
+    потребитель (deadlock). Объект больше лимита проходит, когда всё освобождено.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = max(1, int(limit))
+        self.in_flight = 0
+        self.peak = 0
+        self._next = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def acquire(self, ticket: int, n: int) -> None:
+        with self._cond:
+            self._cond.wait_for(
+                lambda: (
+                    self._closed
+                    or (
+                        ticket == self._next
+                        and (self.in_flight == 0 or self.in_flight + n <= self.limit)
+                    )
+                )
+            )
+            if self._closed:
+                raise RuntimeError("image stream closed")
+            self._next += 1
+            self._grow(n)
+            self._cond.notify_all()
+
+    def skip(self, ticket: int) -> None:
+        """Билет без бюджета (ошибка до acquire) — пропустить очередь дальше."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._closed or ticket == self._next)
+            self._next += 1
+            self._cond.notify_all()
+
+    def adjust(self, delta: int) -> None:
+        """Поправка после декодирования (без ожидания, может превысить limit)."""
+        with self._cond:
+            self._grow(delta)
+            self._cond.notify_all()
+
+    def release(self, n: int) -> None:
+        self.adjust(-n)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _grow(self, n: int) -> None:
+        self.in_flight += n
+        self.peak = max(self.peak, self.in_flight)
+
+
+class ImageStream:
+    """
+    refs: (image_id, storage_path), читаются лениво (можно передать генератор).
+    Ошибки чтения (S3/FS) пробрасываются потребителю, ошибки декодирования —
+    нет: item.image = None, item.error = текст.
+    """
+
+    def __init__(
+        self,
+        refs: Iterable[tuple[int, str]],
+        *,
+        concurrency: int | None = None,
+        max_bytes_in_flight: int | None = None,
+        decode: Callable[[bytearray], PILImage.Image] | None = decode_image,
+    ) -> None:
+        self._refs = iter(refs)
+        self._concurrency = max(1, concurrency or settings.qc_read_concurrency)
+        self._budget = _ByteBudget(
+            max_bytes_in_flight or settings.qc_read_max_bytes_in_flight
+        )
+        self._decode = decode
+        self._pool = ThreadPoolExecutor(
+            max_workers=self._concurrency, thread_name_prefix="image-source"
+        )
+        self._pending: deque[Future[_Fetched]] = deque()
+        self._tickets = 0
+        self._held: list[StreamItem] = []
+        self._t0 = time.perf_counter()
+        self.stats = {"objects": 0, "bytes": 0, "decode_errors": 0}
+
+    # ---------- context ----------
+    def __enter__(self) -> ImageStream:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._release_held()
+        self._budget.close()
+        for f in self._pending:
+            f.cancel()
+        self._pool.shutdown(wait=True)
+        for f in self._pending:
+            if f.done() and not f.cancelled() and f.exception() is None:
+                item = f.result().item
+                if item.image is not None:
+                    item.image.close()
+        self._pending.clear()
+
+    # ---------- stats ----------
+    @property
+    def peak_bytes_in_flight(self) -> int:
+        return self._budget.peak
+
+    def throughput(self) -> dict[str, float]:
+        dt = max(time.perf_counter() - self._t0, 1e-9)
+        return {
+            "objects_per_s": self.stats["objects"] / dt,
+            "mb_per_s": self.stats["bytes"] / dt / 1e6,
+        }
+
+    # ---------- reading ----------
+    def _open(self, storage_path: str):
+        """-> (file-like, size). Сам GET/open до захвата бюджета: тело ещё не читали."""
+        if storage_path.startswith("s3://"):
+            bucket, key = parse_s3_uri(storage_path)
+            return get_s3_client().get_stream(bucket=bucket, key=key)
+        f = open(storage_path, "rb")
+        return f, os.fstat(f.fileno()).st_size
+
+    def _fetch(self, ticket: int, image_id: int, storage_path: str) -> _Fetched:
+        try:
+            body, size = self._open(storage_path)
+        except BaseException:
+            self._budget.skip(ticket)
+            raise
+
+        acquired = False
+        try:
+            self._budget.acquire(ticket, size)
+            acquired = True
+            buf = bytearray()
+            while chunk := body.read(_READ_CHUNK):
+                buf += chunk
+        except BaseException:
+            if acquired:
+                self._budget.release(size)
+            raise
+        finally:
+            body.close()
+
+        # ContentLength мог соврать — учитываем фактический размер
+        self._budget.adjust(len(buf) - size)
+        nbytes = len(buf)
+        if self._decode is None:
+            item = StreamItem(image_id, storage_path, None, None, nbytes, bytes(buf))
+            return _Fetched(item, nbytes)
+        try:
+            image = self._decode(buf)
+        except DECODE_ERRORS as e:
+            item = StreamItem(image_id, storage_path, None, str(e), nbytes)
+            return _Fetched(item, nbytes)
+        finally:
+            del buf
+
+        # дальше в памяти живёт decoded image, а не исходные байты
+        decoded = _decoded_size(image)
+        self._budget.adjust(decoded - nbytes)
+        item = StreamItem(image_id, storage_path, image, None, nbytes)
+        return _Fetched(item, decoded)
+
+    def _fill(self) -> None:
+        # окно prefetch: потоки, ждущие бюджет, не держат памяти, но держат
+        # S3-соединение — больше 2x concurrency в очереди не ставим
+        while len(self._pending) < 2 * self._concurrency:
+            ref = next(self._refs, None)
+            if ref is None:
+                return
+            image_id, storage_path = ref
+            self._pending.append(
+                self._pool.submit(self._fetch, self._tickets, image_id, storage_path)
+            )
+            self._tickets += 1
+
+    def _release_held(self) -> None:
+        for item in self._held:
+            if item.image is not None:
+                item.image.close()
+        self._held = []
+
+    def __iter__(self) -> Iterator[StreamItem]:
+        for batch in self.batches(1):
+            yield from batch
+
+    def batches(self, batch_size: int | None = None) -> Iterator[list[StreamItem]]:
+        batch_size = max(1, batch_size or settings.qc_read_batch_size)
+        self._fill()
+        while self._pending:
+            self._release_held()
+            batch: list[StreamItem] = []
+            while self._pending and len(batch) < batch_size:
+                fetched = self._pending.popleft().result()
+                # отданное потребителю в бюджет не входит: иначе батч, съевший
+                # весь бюджет, заблокировал бы prefetch следующего item
+                self._budget.release(fetched.budget)
+                item = fetched.item
+                self._fill()
+                self.stats["objects"] += 1
+                self.stats["bytes"] += item.nbytes
+                if item.error is not None:
+                    self.stats["decode_errors"] += 1
+                batch.append(item)
+            self._held = batch
+            yield batch
+        self._release_held()
+
+
+def _decoded_size(image: PILImage.Image) -> int:
+    return image.width * image.height * max(1, len(image.getbands()))
@@ -1,25 +1,63 @@
 from __future__ import annotations
 
+from collections import defaultdict
+from dataclasses import dataclass
 from datetime import datetime, timezone
-import json
-import io
+import time
 
-from celery import shared_task
+from celery import chain, chord, group, shared_task
+from sqlalchemy import func, select, update
 from sqlalchemy.orm import Session
 
 from app.db.session import SessionLocal
 from app.core.config import get_s3_client, settings
+from app.core.s3 import S3UploadPool
+from app.worker.ai_scorer import get_scorer, resolve_scorer_name
+from app.worker.content_index import get_content_index, sync_phashes
+from app.worker.detectors import (
+    DETECTORS,
+    make_batch,
+    needs_measure,
+    resolve_detectors,
+)
+from app.worker import qc_cache
+from app.worker.cancel import CANCELLED, CancelToken, JobCancelled
+from app.worker.export_delta import (
+    delta_base_ok,
+    export_chain,
+    iter_compacted_batches,
+    same_format,
+)
+from app.worker.export_dataset import DatasetWriter, write_dataset
+from app.worker.export_retention import apply_retention
+from app.worker.export_split import SplitOptions
+from app.worker.export_wds import ShardWriter, write_shards
+from app.worker.export_engine import (
+    EXPORT_FORMAT_VERSION,
+    PARQUET_CONTENT_TYPE,
+    PARQUET_PARAM_KEYS,
+    ParquetOptions,
+    check_labeled,
+    iter_export_batches,
+    take_snapshot,
+    write_parquet,
+)
+from app.worker.image_meta import extract_pending
+from app.worker.image_source import ImageStream
+from app.worker.qc_fingerprint import config_digest, images_fingerprint
+from app.worker.qc_store import (
+    copy_qc_results,
+    replace_qc_results,
+    reused_qc_image_ids,
+)
+from app.worker.phash import HammingIndex, dhash, hash_to_hex, hex_to_hash, similarity
 
 from app.models.request import Request
 from app.models.image import Image
-from app.models.qc import QCRun, QCResult
+from app.models.qc import QCRun
 from app.models.task import Task, TaskImage
 from app.models.user import User
 from app.models.export import Export
-from app.models.annotation import Annotation
-
-import pyarrow as pa
-import pyarrow.parquet as pq
 
 
 def _now():
@@ -45,6 +83,124 @@ def _calc_duplicates_by_sha(images: list[Image]) -> dict[int, int | None]:
     return dup_of
 
 
+def _calc_near_duplicates(
+    images: list[Image],
+    exact_dup_of: dict[int, int | None],
+    max_distance: int,
+    reused: set[int] | frozenset[int] = frozenset(),
+) -> tuple[dict[int, tuple[int, int]], set[int]]:
+    """
+    Near-duplicate по dHash (resize/перекодирование/лёгкий crop).
+    Возвращает:
+      - image_id -> (duplicate_of_image_id, hamming distance) для найденных
+      - множество image_id, которые не удалось декодировать
+    Ищем ближайший *более ранний* image через HammingIndex (без pairwise-скана).
+    images должны быть отсортированы по id.
+    phash должен быть посчитан заранее (_process_images), тут ничего не скачиваем.
+    reused — image_id, чьи результаты берём из прошлого run (incremental):
+    они только попадают в индекс, сами не переоцениваются.
+    """
+    index = HammingIndex()
+    near: dict[int, tuple[int, int]] = {}
+    unreadable: set[int] = set()
+
+    for img in images:
+        if img.id in reused:
+            if img.phash:
+                index.add(hex_to_hash(img.phash), img.id)
+            continue
+
+        if exact_dup_of.get(img.id) is not None:
+            # точный дубль — уже найден по sha256, в индекс не добавляем
+            continue
+
+        # phash считается заранее (_process_images); нет phash — не декодировался
+        h = hex_to_hash(img.phash) if img.phash else None
+        if h is None:
+            unreadable.add(img.id)
+            continue
+
+        hit = index.nearest(h, max_distance)
+        if hit is not None:
+            dist, other_id = hit
+            near[img.id] = (other_id, dist)
+        index.add(h, img.id)
+
+    return near, unreadable
+
+
+def _calc_cross_request_duplicates(
+    db: Session,
+    request_id: int,
+    images: list[Image],
+    exact_dup_of: dict[int, int | None],
+    reused: set[int],
+) -> dict[int, dict]:
+    """
+    Дубли из *других* заявок через глобальный content_index (sha256, затем exact phash).
+    image_id -> {"image_id", "request_id", "match"} более раннего image.
+    Внутризаявочные точные дубли не проверяем — флаг будет у их оригинала.
+    """
+    index = get_content_index()
+    index.refresh(db)
+
+    candidates = [
+        img
+        for img in images
+        if img.id not in reused and exact_dup_of.get(img.id) is None
+    ]
+    out: dict[int, dict] = {}
+
+    def _take(img: Image, hit: tuple[int, int] | None, match: str) -> bool:
+        if not hit:
+            return False
+        other_image_id, other_request_id = hit
+        if other_request_id == request_id or other_image_id >= img.id:
+            return False
+        out[img.id] = {
+            "image_id": other_image_id,
+            "request_id": other_request_id,
+            "match": match,
+        }
+        return True
+
+    by_sha = index.lookup_sha256(db, (img.sha256 for img in candidates))
+    rest = [
+        img
+        for img in candidates
+        if not _take(img, by_sha.get(img.sha256), "sha256") and img.phash
+    ]
+    by_phash = index.lookup_phash(db, (img.phash for img in rest))
+    for img in rest:
+        _take(img, by_phash.get(img.phash), "phash")
+    return out
+
+
+def _find_base_run(db: Session, run: QCRun, ai_version: str | None) -> QCRun | None:
+    """
+    Последний done run той же заявки с той же конфигурацией QC — его результаты
+    можно переиспользовать в incremental режиме. config_digest покрывает
+    детекторы с порогами и версиями, phash, поиск дублей и скорер (у onnx — только
+    путь модели), поэтому версия скорера (у onnx — digest файла модели)
+    сравнивается отдельно: params["ai_version"] base run.
+    """
+    base = (
+        db.query(QCRun)
+        .filter(
+            QCRun.request_id == run.request_id,
+            QCRun.status == "done",
+            QCRun.id < run.id,
+        )
+        .order_by(QCRun.id.desc())
+        .first()
+    )
+    if not base or base.config_digest != run.config_digest:
+        return None
+    if (base.params or {}).get("ai_version") != ai_version:
+        return None
+    return base
+
+
 def _assign_labeler(db: Session) -> int:
     labeler = (
         db.query(User)
@@ -83,13 +239,431 @@ def _ensure_task_for_request(db: Session, request_id: int) -> int:
     return int(task.id)
 
 
+def _fail_qc_run(db: Session, qc_run_id: int, error: str) -> None:
+    db.rollback()
+    try:
+        run = db.get(QCRun, qc_run_id)
+        # отменённый run не перетираем: ошибка — следствие отмены
+        if run and run.status != CANCELLED:
+            run.status = "failed"
+            run.error = error[:500]
+            run.finished_at = _now()
+            db.commit()
+    except Exception:
+        pass
+
+
+def _load_images(db: Session, request_id: int) -> list[Image]:
+    return (
+        db.query(Image)
+        .filter(Image.request_id == request_id)
+        .order_by(Image.id.asc())
+        .all()
+    )
+
+
+def _add_run_stats(
+    db: Session,
+    qc_run_id: int,
+    timings: dict[str, float],
+    counters: dict[str, int],
+    info: dict | None = None,
+) -> None:
+    """
+    Прибавить timings/счётчики к QCRun.stats и пересчитать throughput.
+    Чанки пишут параллельно — read-modify-write под SELECT ... FOR UPDATE.
+    Время суммируется по воркерам, так что images/s — на один воркер
+    (по нему и считаем размер пула).
+    """
+    stats = (
+        db.execute(
+            select(QCRun.stats).where(QCRun.id == qc_run_id).with_for_update()
+        ).scalar()
+        or {}
+    )
+    stats = dict(stats)
+    acc = dict(stats.get("timings") or {})
+    for key, seconds in timings.items():
+        acc[key] = round(acc.get(key, 0.0) + seconds, 4)
+    stats["timings"] = acc
+    for key, n in counters.items():
+        stats[key] = stats.get(key, 0) + n
+    if info:
+        stats.update(info)
+
+    def _rate(n: int, seconds: float) -> float | None:
+        return round(n / seconds, 2) if n and seconds > 0 else None
+
+    stats["throughput"] = {
+        "scan_images_per_s": _rate(stats.get("images_scanned", 0), acc.get("total", 0)),
+        "ai_images_per_s": _rate(
+            stats.get("ai_images", 0),
+            acc.get("ai_preprocess", 0) + acc.get("ai_infer", 0),
+        ),
+    }
+    db.execute(
+        update(QCRun)
+        .where(QCRun.id == qc_run_id)
+        .values(stats=stats)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _set_phase(db: Session, qc_run_id: int, phase: str) -> None:
+    db.execute(
+        update(QCRun)
+        .where(QCRun.id == qc_run_id)
+        .values(phase=phase, progress_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _bump_progress(db: Session, qc_run_id: int, n: int) -> None:
+    """
+    images_done += n одним UPDATE (атомарно при параллельных чанках, без блокировок
+    на чтение) + скорость scan: (done - skipped) / секунд с started_at.
+    """
+    elapsed = func.greatest(func.extract("epoch", func.now() - QCRun.started_at), 0.001)
+    db.execute(
+        update(QCRun)
+        .where(QCRun.id == qc_run_id)
+        .values(
+            images_done=QCRun.images_done + n,
+            images_per_s=(QCRun.images_done + n - QCRun.images_skipped) / elapsed,
+            progress_at=func.now(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _needs_ai(quality: dict | None, ai_version: str | None) -> bool:
+    if ai_version is None:
+        return False
+    return ((quality or {}).get("ai") or {}).get("v") != ai_version
+
+
+@dataclass(slots=True)
+class _ScanImage:
+    """Снимок колонок Image для content stage (phash/quality пишутся UPDATE)."""
+
+    id: int
+    storage_path: str
+    sha256: str | None
+    phash: str | None
+    quality: dict | None
+
+
+def _needs_scan(
+    img: Image | _ScanImage, want_phash: bool, names: list[str], ai_version: str | None
+) -> bool:
+    """Нужно ли качать картинку: нет phash / метрик детекторов / ai score."""
+    return (
+        (want_phash and not img.phash)
+        or bool(needs_measure(img.quality, names))
+        or _needs_ai(img.quality, ai_version)
+    )
+
+
+def _process_images(db: Session, run: QCRun, image_ids: list[int]) -> None:
+    """
+    Content stage: скачать картинки и посчитать всё, что смотрит на пиксели:
+    - dHash (кэш в images.phash), если включены near_duplicates;
+    - метрики детекторов качества (кэш в images.quality[name] вместе с version);
+    - ai_generated_score скорером (кэш в images.quality["ai"] с версией модели).
+    Картинки читаются через ImageStream (параллельный prefetch, фиксированная память),
+    детекторы и скорер работают на батче целиком. Время по стадиям ->
+    QCRun.stats["timings"].
+    Не декодируется — phash/метрик нет (UNREADABLE в merge).
+    Ошибки S3 не глотаем: пусть run упадёт, а не пометит всё UNREADABLE.
+    """
+    params = run.params or {}
+    want_phash = params.get("near_duplicates", True)
+    names = list(resolve_detectors(params.get("detectors")))
+    scorer_name = resolve_scorer_name(params.get("ai_scorer"))
+    scorer = get_scorer(scorer_name) if scorer_name else None
+    ai_version = scorer.version if scorer else None
+    versions = qc_cache.current_versions(want_phash, names, ai_version)
+
+    # колонки, а не ORM-объекты: commit после каждого батча экспайрит Image,
+    # и каждое img.storage_path / img.quality после него — свой SELECT (N+1)
+    rows = db.execute(
+        select(Image.id, Image.storage_path, Image.sha256, Image.phash, Image.quality)
+        .where(Image.id.in_(image_ids))
+        .order_by(Image.id.asc())
+    ).all()
+    todo = {
+        row.id: _ScanImage(*row)
+        for row in rows
+        if _needs_scan(row, want_phash, names, ai_version)
+    }
+
+    timings: dict[str, float] = defaultdict(float)
+    ai_images = 0
+    token = CancelToken(db, QCRun, run.id)
+    started = time.perf_counter()
+    with ImageStream((img.id, img.storage_path) for img in todo.values()) as stream:
+        for batch in stream.batches(settings.qc_read_batch_size):
+            # отмена между батчами: выход из with останавливает prefetch
+            token.check()
+            items = [item for item in batch if item.image is not None]
+            if not items:
+                _bump_progress(db, run.id, len(batch))
+                db.commit()
+                continue
+            quality = {
+                item.image_id: dict(todo[item.image_id].quality or {}) for item in items
+            }
+
+            if want_phash:
+                t0 = time.perf_counter()
+                for item in items:
+                    img = todo[item.image_id]
+                    if not img.phash:
+                        img.phash = hash_to_hex(dhash(item.image))
+                timings["phash"] += time.perf_counter() - t0
+
+            # детектор гоняем на весь батч, если хоть одной картинке нужны метрики
+            pending = {
+                name
+                for item in items
+                for name in needs_measure(quality[item.image_id], names)
+            }
+            if pending:
+                t0 = time.perf_counter()
+                arrays = make_batch([item.image for item in items])
+                timings["prepare"] += time.perf_counter() - t0
+
+                for name in sorted(pending):
+                    detector = DETECTORS[name]
+                    t0 = time.perf_counter()
+                    metrics = detector.measure(arrays)
+                    timings[name] += time.perf_counter() - t0
+                    for item, m in zip(items, metrics, strict=True):
+                        quality[item.image_id][name] = {"v": detector.version, **m}
+
+            ai_items = [
+                item for item in items if _needs_ai(quality[item.image_id], ai_version)
+            ]
+            if scorer and ai_items:
+                t0 = time.perf_counter()
+                x = scorer.preprocess([item.image for item in ai_items])
+                t1 = time.perf_counter()
+                ai_scores = scorer.score(x)
+                t2 = time.perf_counter()
+                timings["ai_preprocess"] += t1 - t0
+                timings["ai_infer"] += t2 - t1
+                ai_images += len(ai_items)
+                for item, score in zip(ai_items, ai_scores, strict=True):
+                    quality[item.image_id]["ai"] = {
+                        "v": ai_version,
+                        "score": round(float(score), 4),
+                    }
+
+            for image_id, q in quality.items():
+                todo[image_id].quality = q
+            db.execute(
+                update(Image),
+                [
+                    {"id": img.id, "phash": img.phash, "quality": img.quality}
+                    for img in (todo[item.image_id] for item in items)
+                ],
+            )
+            qc_cache.store(
+                db,
+                [
+                    entry
+                    for item in items
+                    for entry in qc_cache.entries_for_image(
+                        todo[item.image_id], versions
+                    )
+                ],
+            )
+
+            # коммит по батчам: прогресс виден сразу, а при ретрае
+            # посчитанные phash/метрики не пересчитываются
+            _bump_progress(db, run.id, len(batch))
+            db.commit()
+
+    timings["total"] = time.perf_counter() - started
+    info = None
+    if scorer:
+        info = {
+            "ai_scorer": {
+                "name": scorer.name,
+                "version": scorer.version,
+                "batch_size": scorer.batch_size,
+                "threads": getattr(scorer, "threads", None),
+            }
+        }
+    counters = {"images_scanned": len(todo), "ai_images": ai_images}
+    _add_run_stats(db, run.id, timings, counters, info)
+    db.commit()
+
+
+def _quality_scores(
+    img: Image, detectors: dict[str, dict]
+) -> tuple[dict[str, float], dict[str, object], bool]:
+    """
+    images.quality -> (scores, flags, complete) по выбранным детекторам.
+    complete=False — метрик нет (картинка не декодировалась).
+    """
+    quality = img.quality or {}
+    scores: dict[str, float] = {}
+    flags: dict[str, object] = {}
+    complete = True
+    for name, options in detectors.items():
+        metrics = quality.get(name)
+        if not metrics:
+            complete = False
+            continue
+        detector = DETECTORS[name]
+        score, flag = detector.judge(metrics, options)
+        scores[name] = round(score, 4)
+        if flag is not None:
+            flags[detector.flag] = flag
+    return scores, flags, complete
+
+
+def _split_chunks(
+    ids: list[int], chunk_size: int, parallelism: int
+) -> list[list[list[int]]]:
+    """
+    ids -> lanes (<= parallelism) -> chunks (<= chunk_size).
+    Каждая lane выполняется последовательно (chain), lanes — параллельно (group).
+    """
+    chunks = [ids[i : i + chunk_size] for i in range(0, len(ids), chunk_size)]
+    lanes = max(1, min(parallelism, len(chunks)))
+    return [chunks[i::lanes] for i in range(lanes)]
+
+
+def _merge_qc_run(db: Session, run: QCRun) -> dict:
+    """
+    Merge stage: все phash уже посчитаны (inline или чанками), тут только
+    дедупликация по всей заявке (в т.ч. между чанками) + запись результатов.
+    """
+    params = run.params or {}
+    token = CancelToken(db, QCRun, run.id)
+    _set_phase(db, run.id, "merge")
+    db.commit()
+    images = _load_images(db, run.request_id)
+    by_id = {img.id: img for img in images}
+    detectors = resolve_detectors(params.get("detectors"))
+    scorer_name = resolve_scorer_name(params.get("ai_scorer"))
+    ai_version = get_scorer(scorer_name).version if scorer_name else None
+
+    reused: set[int] = set()
+    base_id = params.get("base_qc_run_id")
+    if base_id:
+        reused = reused_qc_image_ids(db, int(base_id), run.request_id)
+
+    dup_of = _calc_duplicates_by_sha(images)
+    near: dict[int, tuple[int, int]] = {}
+    unreadable: set[int] = set()
+    if params.get("near_duplicates", True):
+        max_distance = int(
+            params.get("phash_max_distance", settings.qc_phash_max_distance)
+        )
+        near, unreadable = _calc_near_duplicates(images, dup_of, max_distance, reused)
+
+    token.check()
+    cross: dict[int, dict] = {}
+    if params.get("cross_request", True):
+        # phash этой заявки -> в глобальный индекс (для будущих заявок)
+        sync_phashes(db, run.request_id)
+        cross = _calc_cross_request_duplicates(
+            db, run.request_id, images, dup_of, reused
+        )
+
+    created_at = _now()
+    rows = []
+    for img in images:
+        if img.id in reused:
+            continue
+        d_of = dup_of.get(img.id)
+        duplicate_score = 1.0 if d_of is not None else 0.0
+        flags = {}
+        if d_of is not None:
+            flags["DUPLICATE"] = True
+        elif img.id in near:
+            d_of, dist = near[img.id]
+            duplicate_score = similarity(dist)
+            flags["NEAR_DUPLICATE"] = True
+            flags["phash_distance"] = dist
+        # точный дубль не скачивался — метрики те же, что у оригинала
+        source = by_id.get(dup_of.get(img.id)) or img
+        scores, quality_flags, complete = _quality_scores(source, detectors)
+        flags.update(quality_flags)
+        ai_score = 0.0
+        if ai_version is not None:
+            ai = (source.quality or {}).get("ai") or {}
+            if ai.get("v") == ai_version:
+                ai_score = float(ai["score"])
+            else:
+                complete = False
+        if img.id in unreadable or not complete:
+            flags["UNREADABLE"] = True
+        if img.id in cross:
+            # "duplicate of image X in request Y"; duplicate_of_image_id — только внутри заявки
+            flags["CROSS_REQUEST_DUPLICATE"] = cross[img.id]
+            duplicate_score = 1.0
+
+        # порядок — QC_RESULT_COLUMNS
+        rows.append(
+            (
+                run.id,
+                run.request_id,
+                img.id,
+                duplicate_score,
+                d_of,
+                ai_score,
+                flags,
+                scores,
+                created_at,
+            )
+        )
+
+    token.check()
+    # идемпотентность: если ретрай — пересоздадим результаты (DELETE + COPY)
+    replace_qc_results(db, run.id, rows)
+    if base_id:
+        copy_qc_results(db, int(base_id), run.id, run.request_id, created_at)
+    _ensure_task_for_request(db, run.request_id)
+
+    # строка под FOR UPDATE до коммита: отмена либо успела, либо увидит done
+    token.check(lock=True)
+    run.status = "done"
+    run.phase = "done"
+    run.images_done = run.total_images
+    run.finished_at = _now()
+    run.progress_at = run.finished_at
+    db.commit()
+
+    return {
+        "ok": True,
+        "qc_run_id": run.id,
+        "status": run.status,
+        "processed": len(rows),
+        "reused": len(reused),
+    }
+
+
 @shared_task(name="qc.run_qc")
 def qc_run_job(qc_run_id: int) -> dict:
+    """
+    Оркестратор QC.
+    Мелкие заявки (<= 1 чанка на хэширование) считаются прямо тут.
+    Крупные — chord: group(lanes of chain(qc.run_chunk)) -> qc.merge.
+    params: chunk_size, parallelism (иначе settings.qc_chunk_size / qc_parallelism).
+    """
     db = SessionLocal()
     try:
-        run = db.get(QCRun, qc_run_id)
+        # FOR UPDATE: отмена queued run не потеряется между чтением и "running"
+        run = db.get(QCRun, qc_run_id, with_for_update=True)
         if not run:
             raise RuntimeError("QCRun not found")
+        if run.status == CANCELLED:
+            db.commit()
+            return {"ok": False, "qc_run_id": run.id, "status": run.status}
 
         req = db.get(Request, run.request_id)
         if not req:
@@ -98,9 +672,15 @@ def qc_run_job(qc_run_id: int) -> dict:
         run.status = "running"
         run.started_at = _now()
         run.error = None
+        run.phase = "prepare"
+        run.total_images = 0
+        run.images_done = 0
+        run.images_skipped = 0
+        run.images_per_s = None
+        run.progress_at = run.started_at
         db.commit()
 
-        images = db.query(Image).filter(Image.request_id == run.request_id).all()
+        images = _load_images(db, run.request_id)
         if not images:
             run.status = "failed"
             run.error = "No uploads for this request"
@@ -108,65 +688,346 @@ def qc_run_job(qc_run_id: int) -> dict:
             db.commit()
             return {"ok": False, "error": run.error}
 
-        # идемпотентность: если ретрай — пересоздадим результаты
-        db.query(QCResult).filter(QCResult.qc_run_id == run.id).delete()
-        db.commit()
+        params = dict(run.params or {})
+        params["detectors"] = resolve_detectors(params.get("detectors"))
+        # "none" явно: None в chunk/merge означал бы settings.qc_ai_scorer
+        scorer_name = resolve_scorer_name(params.get("ai_scorer"))
+        params["ai_scorer"] = scorer_name or "none"
+        ai_version = get_scorer(scorer_name).version if scorer_name else None
+        params["ai_version"] = ai_version
+        run.stats = None
+        images_fingerprint(images).apply(run)
+        run.config_digest = config_digest(params)
 
-        dup_of = _calc_duplicates_by_sha(images)
+        # incremental: результаты прошлого done run берём как есть (images не меняются
+        # после upload), заново считаем только новые images — против всех, включая старые
+        reused: set[int] = set()
+        params.pop("base_qc_run_id", None)
+        if params.get("mode") == "incremental":
+            base = _find_base_run(db, run, ai_version)
+            if base:
+                reused = reused_qc_image_ids(db, base.id, run.request_id)
+                params["base_qc_run_id"] = base.id
+                params["reused"] = len(reused)
 
-        for img in images:
-            d_of = dup_of.get(img.id)
-            duplicate_score = 1.0 if d_of is not None else 0.0
-            flags = {}
-            if d_of is not None:
-                flags["DUPLICATE"] = True
-
-            r = QCResult(
-                qc_run_id=run.id,
-                request_id=run.request_id,
-                image_id=img.id,
-                duplicate_score=duplicate_score,
-                duplicate_of_image_id=d_of,
-                ai_generated_score=0.0,
-                flags=flags,
-            )
-            db.add(r)
+        # что надо скачать: новые, не точные дубли, без phash / метрик / ai score
+        want_phash = params.get("near_duplicates", True)
+        names = list(params["detectors"])
+        dup_of = _calc_duplicates_by_sha(images)
+        candidates = [
+            img
+            for img in images
+            if img.id not in reused
+            and dup_of.get(img.id) is None
+            and _needs_scan(img, want_phash, names, ai_version)
+        ]
 
-        _ensure_task_for_request(db, run.request_id)
+        # content cache по sha256: те же байты уже проверялись (в т.ч. в других заявках)
+        versions = qc_cache.current_versions(want_phash, names, ai_version)
+        cached = qc_cache.lookup(db, (img.sha256 for img in candidates), versions)
+        for img in candidates:
+            if img.sha256 in cached:
+                qc_cache.apply_to_image(img, cached[img.sha256], versions)
+        to_scan = [
+            img.id
+            for img in candidates
+            if _needs_scan(img, want_phash, names, ai_version)
+        ]
+        _add_run_stats(
+            db,
+            run.id,
+            {},
+            {
+                "cache_hits": len(candidates) - len(to_scan),
+                "cache_misses": len(to_scan),
+            },
+        )
 
-        run.status = "done"
-        run.finished_at = _now()
+        CancelToken(db, QCRun, run.id).check(force=True)
+        chunk_size = max(1, int(params.get("chunk_size", settings.qc_chunk_size)))
+        parallelism = max(1, int(params.get("parallelism", settings.qc_parallelism)))
+        lanes = _split_chunks(to_scan, chunk_size, parallelism)
+        params["chunks"] = sum(len(lane) for lane in lanes)
+        run.params = params
+        # всё, что не надо качать, сразу считается готовым
+        run.total_images = len(images)
+        run.images_skipped = len(images) - len(to_scan)
+        run.images_done = run.images_skipped
+        run.phase = "scan" if to_scan else "merge"
+        run.progress_at = _now()
         db.commit()
 
-        return {"ok": True, "qc_run_id": run.id, "status": run.status}
+        if params["chunks"] <= 1:
+            if to_scan:
+                _process_images(db, run, to_scan)
+            return _merge_qc_run(db, run)
 
+        header = group(
+            chain(*(qc_chunk_job.si(run.id, chunk) for chunk in lane)) for lane in lanes
+        )
+        async_res = chord(header)(qc_merge_job.si(run.id))
+        return {
+            "ok": True,
+            "qc_run_id": run.id,
+            "status": run.status,
+            "chunks": params["chunks"],
+            "lanes": len(lanes),
+            "merge_task_id": async_res.id,
+        }
+
+    except JobCancelled:
+        db.rollback()
+        return {"ok": False, "qc_run_id": qc_run_id, "status": CANCELLED}
     except Exception as e:
+        _fail_qc_run(db, qc_run_id, str(e))
+        return {"ok": False, "error": str(e)}
+    finally:
+        db.close()
+
+
+@shared_task(name="qc.run_chunk")
+def qc_chunk_job(qc_run_id: int, image_ids: list[int]) -> dict:
+    """Content stage для одного чанка image_id."""
+    db = SessionLocal()
+    try:
+        run = db.get(QCRun, qc_run_id)
+        if not run or run.status != "running":
+            # run упал в соседнем чанке — не тратим время
+            return {"ok": False, "skipped": True}
+
+        _process_images(db, run, image_ids)
+        return {"ok": True, "qc_run_id": qc_run_id, "images": len(image_ids)}
+
+    except JobCancelled:
         db.rollback()
-        try:
-            run = db.get(QCRun, qc_run_id)
-            if run:
-                run.status = "failed"
-                run.error = str(e)
-                run.finished_at = _now()
-                db.commit()
-        except Exception:
-            pass
+        return {"ok": False, "qc_run_id": qc_run_id, "status": CANCELLED}
+    except Exception as e:
+        _fail_qc_run(db, qc_run_id, f"chunk failed: {e}")
         return {"ok": False, "error": str(e)}
     finally:
         db.close()
 
 
-@shared_task(name="export.build_parquet")
-def export_job(export_id: int) -> dict:
-    """
-    Асинхронная сборка parquet в S3/MinIO.
-    Пишет storage_path в формате: s3://<bucket>/<key>
-    """
+@shared_task(name="qc.merge")
+def qc_merge_job(qc_run_id: int) -> dict:
+    db = SessionLocal()
+    try:
+        run = db.get(QCRun, qc_run_id)
+        if not run:
+            raise RuntimeError("QCRun not found")
+        if run.status != "running":
+            return {"ok": False, "qc_run_id": run.id, "status": run.status}
+
+        return _merge_qc_run(db, run)
+
+    except JobCancelled:
+        db.rollback()
+        return {"ok": False, "qc_run_id": qc_run_id, "status": CANCELLED}
+    except Exception as e:
+        _fail_qc_run(db, qc_run_id, str(e))
+        return {"ok": False, "error": str(e)}
+    finally:
+        db.close()
+
+
+@shared_task(name="images.extract_metadata")
+def extract_image_metadata_job(request_id: int | None = None) -> dict:
+    """Ingest width/height/format/orientation по Range GET (см. image_meta)."""
+    db = SessionLocal()
+    try:
+        return extract_pending(db, request_id)
+    except Exception as e:
+        db.rollback()
+        return {"ok": False, "error": str(e)}
+    finally:
+        db.close()
+
+
+class _ExportFailed(Exception):
+    """Ожидаемый отказ экспорта: status=failed с этим текстом, без traceback."""
+
+
+def _export_key(exp: Export, name: str) -> str:
+    ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return f"requests/{exp.request_id}/exports/{name}_{ts}_{exp.id}"
+
+
+def _write_export(
+    db: Session,
+    exp: Export,
+    token: CancelToken,
+    name: str,
+    batches,
+    options: ParquetOptions,
+) -> None:
+    """батчи -> row groups -> parts multipart upload; storage_path/rows в exp."""
+    s3 = get_s3_client()
+    bucket = settings.s3_bucket_exports
+    key = f"{_export_key(exp, name)}.parquet"
+    with s3.open_multipart(
+        bucket=bucket,
+        key=key,
+        content_type=PARQUET_CONTENT_TYPE,
+        part_size=settings.export_part_bytes,
+    ) as out:
+        exp.rows = write_parquet(batches, out, options)
+        # отмена до CompleteMultipartUpload -> abort, объект не появится
+        token.check(force=True)
+    exp.storage_path = f"s3://{bucket}/{key}"
+
+
+def _build_export(db: Session, exp: Export, token: CancelToken) -> None:
+    error = check_labeled(db, exp.request_id)
+    if error:
+        raise _ExportFailed(error)
+
+    try:
+        options = ParquetOptions.from_params(exp.params)
+        split = SplitOptions.from_params(exp.params)
+    except ValueError as e:
+        raise _ExportFailed(str(e))
+    if split is not None and exp.kind != "full":
+        raise _ExportFailed("split / sampling options support only full exports")
+
+    snapshot = take_snapshot(db, exp.request_id)
+    exp.format_version = EXPORT_FORMAT_VERSION
+    since = None
+    if exp.layout in ("dataset", "webdataset"):
+        if exp.kind != "full":
+            raise _ExportFailed(f"layout={exp.layout} supports only full exports")
+        snapshot.apply(exp)
+        exp.input_digest = snapshot.digest(exp.kind, exp.layout, exp.params)
+        if exp.layout == "dataset":
+            _write_dataset_export(db, exp, token, snapshot, options, split)
+        else:
+            _write_wds_export(db, exp, token, snapshot, split)
+        return
+    if exp.kind == "delta":
+        since = db.get(Export, exp.base_export_id)
+        if not delta_base_ok(db, exp.request_id, since):
+            # images удаляли/меняли после base (или base в старом формате):
+            # delta без удалений не выразить
+            exp.kind, exp.base_export_id, since = "full", None, None
+    snapshot.apply(exp)
+    # по снимку воркера, а не POST: между ними вход мог измениться
+    exp.input_digest = snapshot.digest(
+        exp.kind, exp.layout, exp.params, exp.base_export_id
+    )
+
+    batches = iter_export_batches(
+        db,
+        exp.request_id,
+        batch_rows=options.row_group_rows,
+        token=token,
+        snapshot=snapshot,
+        since=since,
+        split=split,
+    )
+    _write_export(db, exp, token, "delta" if since else "export", batches, options)
+
+
+def _write_dataset_export(
+    db: Session,
+    exp: Export,
+    token: CancelToken,
+    snapshot,
+    options: ParquetOptions,
+    split: SplitOptions | None,
+) -> None:
+    params = exp.params or {}
+    s3 = get_s3_client()
+    bucket = settings.s3_bucket_exports
+    prefix = f"{_export_key(exp, 'dataset')}/"
+    writer = DatasetWriter(
+        s3,
+        bucket,
+        prefix,
+        params.get("partition_by", "label"),
+        target_file_bytes=params.get("target_file_bytes"),
+        parquet=options,
+    )
+    batches = iter_export_batches(
+        db,
+        exp.request_id,
+        batch_rows=options.row_group_rows,
+        token=token,
+        snapshot=snapshot,
+        split=split,
+    )
+    exp.rows = write_dataset(batches, writer, token)
+    exp.files = writer.files
+    exp.storage_path = f"s3://{bucket}/{prefix}"
+
+
+def _write_wds_export(
+    db: Session,
+    exp: Export,
+    token: CancelToken,
+    snapshot,
+    split: SplitOptions | None,
+) -> None:
+    params = exp.params or {}
+    s3 = get_s3_client()
+    bucket = settings.s3_bucket_exports
+    prefix = f"{_export_key(exp, 'wds')}/"
+    # память uploads: part в сборке + max_in_flight parts в полёте
+    with S3UploadPool(
+        settings.export_upload_concurrency,
+        max_in_flight=2 * settings.export_upload_concurrency,
+    ) as pool:
+        writer = ShardWriter(
+            s3, bucket, prefix, shard_bytes=params.get("shard_bytes"), pool=pool
+        )
+        batches = iter_export_batches(
+            db, exp.request_id, token=token, snapshot=snapshot, split=split
+        )
+        exp.rows = write_shards(batches, writer, token)
+    exp.files = writer.files
+    exp.storage_path = f"s3://{bucket}/{prefix}"
+
+
+def _build_compact(db: Session, exp: Export, token: CancelToken) -> None:
+    head = db.get(Export, exp.base_export_id)
+    if head is None or head.status != "done":
+        raise _ExportFailed("Nothing to compact: base export is not done")
+    chain = export_chain(db, head)
+    if not all(same_format(ex) for ex in chain):
+        raise _ExportFailed(
+            "Export chain was written in an older format: build a full export"
+        )
+    # кодирование — как у head (его опции parquet), остальные опции не нужны
+    exp.params = {
+        k: v for k, v in (head.params or {}).items() if k in PARQUET_PARAM_KEYS
+    }
+    options = ParquetOptions.from_params(exp.params)
+    exp.format_version = EXPORT_FORMAT_VERSION
+    # input_digest не ставим: digest head (delta) с содержимым compact не совпадает
+    # содержимое = состояние head: следующая delta считается от его снимка
+    for col in (
+        "images_count",
+        "images_max_id",
+        "images_sha_sum",
+        "annotations_watermark",
+        "qc_run_id",
+    ):
+        setattr(exp, col, getattr(head, col))
+
+    batches = iter_compacted_batches(
+        get_s3_client(), chain, batch_rows=options.row_group_rows, token=token
+    )
+    _write_export(db, exp, token, "export", batches, options)
+
+
+def _run_export(export_id: int, build) -> dict:
+    """Общий цикл задачи экспорта: running -> build -> done/failed/cancelled."""
     db = SessionLocal()
     try:
-        exp = db.get(Export, export_id)
+        exp = db.get(Export, export_id, with_for_update=True)
         if not exp:
             raise RuntimeError("Export not found")
+        if exp.status == CANCELLED:
+            db.commit()
+            return {"ok": False, "export_id": exp.id, "status": exp.status}
 
         req = db.get(Request, exp.request_id)
         if not req:
@@ -176,126 +1037,45 @@ def export_job(export_id: int) -> dict:
         exp.started_at = _now()
         exp.error = None
         db.commit()
+        token = CancelToken(db, Export, exp.id)
 
-        images = (
-            db.query(Image)
-            .filter(Image.request_id == exp.request_id)
-            .order_by(Image.id.asc())
-            .all()
-        )
-        if not images:
-            exp.status = "failed"
-            exp.error = "No images"
-            exp.finished_at = _now()
-            db.commit()
-            return {"ok": False, "error": exp.error}
-
-        # проверка: все изображения размечены (хотя бы 1 annotation на image_id)
-        image_ids = [img.id for img in images]
-        labeled_ids = {
-            r[0]
-            for r in db.query(Annotation.image_id)
-            .filter(Annotation.image_id.in_(image_ids))
-            .distinct()
-            .all()
-        }
-        if len(labeled_ids) != len(image_ids):
-            missing = sorted(set(image_ids) - labeled_ids)
+        try:
+            build(db, exp, token)
+        except _ExportFailed as e:
             exp.status = "failed"
-            exp.error = f"Not all images labeled. Missing image_ids: {missing[:20]}" + (
-                " ..." if len(missing) > 20 else ""
-            )
+            exp.error = str(e)
             exp.finished_at = _now()
             db.commit()
             return {"ok": False, "error": exp.error}
 
-        # qc_map по последнему QC run
-        last_run = (
-            db.query(QCRun)
-            .filter(QCRun.request_id == exp.request_id)
-            .order_by(QCRun.id.desc())
-            .first()
-        )
-        qc_map: dict[int, QCResult] = {}
-        if last_run:
-            qc_rows = db.query(QCResult).filter(QCResult.qc_run_id == last_run.id).all()
-            for r in qc_rows:
-                qc_map[int(r.image_id)] = r
-
-        # ann_map: берём самую свежую annotation на image_id
-        ann_rows = (
-            db.query(Annotation)
-            .filter(Annotation.image_id.in_(image_ids))
-            .order_by(Annotation.image_id.asc(), Annotation.updated_at.desc())
-            .all()
-        )
-        ann_map: dict[int, Annotation] = {}
-        for a in ann_rows:
-            iid = int(a.image_id)
-            if iid not in ann_map:
-                ann_map[iid] = a
-
-        out_rows = []
-        for img in images:
-            ann = ann_map.get(int(img.id))
-            labels = ann.labels if ann else None
-            ann_updated = ann.updated_at.isoformat() if ann and ann.updated_at else None
-
-            qc = qc_map.get(int(img.id))
-            qc_flags = qc.flags if qc else None
-
-            out_rows.append(
-                {
-                    "request_id": int(exp.request_id),
-                    "image_id": int(img.id),
-                    "file_name": img.file_name,
-                    "storage_path": img.storage_path,
-                    "sha256": img.sha256,
-                    "labels": labels,
-                    "labels_json": json.dumps(labels) if labels is not None else None,
-                    "annotation_updated_at": ann_updated,
-                    "duplicate_score": float(qc.duplicate_score) if qc else None,
-                    "ai_generated_score": float(qc.ai_generated_score) if qc else None,
-                    "qc_flags": qc_flags,
-                    "qc_flags_json": json.dumps(qc_flags)
-                    if qc_flags is not None
-                    else None,
-                }
-            )
-
-        table = pa.Table.from_pylist(out_rows)
-
-        buf = io.BytesIO()
-        pq.write_table(table, buf)
-        data = buf.getvalue()
-
-        # кладём parquet в exports bucket
-        s3 = get_s3_client()
-        bucket = settings.s3_bucket_exports
-        ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
-        key = f"requests/{exp.request_id}/exports/export_{ts}_{exp.id}.parquet"
-
-        s3.put_bytes(
-            bucket=bucket, key=key, data=data, content_type="application/octet-stream"
-        )
-
+        token.check(lock=True)
         exp.status = "done"
-        exp.storage_path = f"s3://{bucket}/{key}"
         exp.finished_at = _now()
         db.commit()
 
+        try:
+            apply_retention(db, get_s3_client(), exp.request_id)
+        except Exception:
+            # export готов; не удалённое сейчас удалит следующий проход
+            db.rollback()
+
         return {
             "ok": True,
             "export_id": exp.id,
+            "kind": exp.kind,
             "status": exp.status,
             "storage_path": exp.storage_path,
+            "rows": exp.rows,
         }
 
+    except JobCancelled:
+        db.rollback()
+        return {"ok": False, "export_id": export_id, "status": CANCELLED}
     except Exception as e:
         db.rollback()
         try:
             exp = db.get(Export, export_id)
-            if exp:
+            if exp and exp.status != CANCELLED:
                 exp.status = "failed"
                 exp.error = str(e)
                 exp.finished_at = _now()
@@ -305,3 +1085,29 @@ def export_job(export_id: int) -> dict:
         return {"ok": False, "error": str(e)}
     finally:
         db.close()
+
+
+@shared_task(name="export.build_parquet")
+def export_job(export_id: int) -> dict:
+    """
+    Сборка parquet в S3/MinIO: full или delta (kind экспорта).
+    Пишет storage_path в формате: s3://<bucket>/<key>
+    """
+    return _run_export(export_id, _build_export)
+
+
+@shared_task(name="export.compact")
+def compact_export_job(export_id: int) -> dict:
+    """Свернуть цепочку base + deltas (до base_export_id) в новый полный parquet."""
+    return _run_export(export_id, _build_compact)
+
+
+@shared_task(name="export.retention")
+def export_retention_job(request_id: int | None = None) -> dict:
+    """Retention бакета exports (см. export_retention); без request_id — все заявки."""
+    db = SessionLocal()
+    try:
+        expired = apply_retention(db, get_s3_client(), request_id)
+        return {"ok": True, "expired": expired}
+    finally:
+        db.close()
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from itertools import combinations
+
+from PIL import Image as PILImage
+
+HASH_BITS = 64
+# версия алгоритма для qc_content_cache (поменять при изменении dhash())
+PHASH_VERSION = "dhash8:1"
+
+
+def dhash(img: PILImage.Image, size: int = 8) -> int:
+    """
+    Difference hash: картинка -> grayscale (size+1)x(size), сравниваем соседние пиксели.
+    Устойчив к resize/перекодированию/небольшим правкам яркости.
+    """
+    gray = img.convert("L").resize((size + 1, size), PILImage.Resampling.LANCZOS)
+    px = gray.tobytes()
+
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (px[offset + col] > px[offset + col + 1])
+    return bits
+
+
+def hash_to_hex(h: int) -> str:
+    return f"{h:0{HASH_BITS // 4}x}"
+
+
+def hex_to_hash(s: str) -> int:
+    return int(s, 16)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def similarity(distance: int) -> float:
+    """1.0 = хэши совпадают, 0.0 = все биты разные."""
+    return 1.0 - distance / HASH_BITS
+
+
+class HammingIndex:
+    """
+    Multi-index hashing для поиска ближайшего хэша по расстоянию Хэмминга.
+
+    64-битный хэш режется на `bands` кусков, для каждого куска свой dict.
+    По принципу Дирихле: если distance(a, b) <= r, то хотя бы в одном куске
+    расстояние <= r // bands, поэтому достаточно перебрать соседей куска
+    в этом радиусе. Pairwise-скана нет, кандидатов ~ N / 2**band_bits на пробу.
+    """
+
+    def __init__(self, bands: int = 4, bits: int = HASH_BITS) -> None:
+        if bits % bands:
+            raise ValueError("bits must be divisible by bands")
+        self.bands = bands
+        self.band_bits = bits // bands
+        self._band_mask = (1 << self.band_bits) - 1
+        self._tables: list[dict[int, list[tuple[int, int]]]] = [
+            {} for _ in range(bands)
+        ]
+        self._probe_cache: dict[int, list[int]] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _band_keys(self, h: int) -> list[int]:
+        return [
+            (h >> (i * self.band_bits)) & self._band_mask for i in range(self.bands)
+        ]
+
+    def _probes(self, radius: int) -> list[int]:
+        # все XOR-маски куска с <= radius выставленными битами
+        masks = self._probe_cache.get(radius)
+        if masks is None:
+            masks = [0]
+            for r in range(1, radius + 1):
+                for bits in combinations(range(self.band_bits), r):
+                    m = 0
+                    for b in bits:
+                        m |= 1 << b
+                    masks.append(m)
+            self._probe_cache[radius] = masks
+        return masks
+
+    def add(self, h: int, item_id: int) -> None:
+        for table, key in zip(self._tables, self._band_keys(h), strict=True):
+            table.setdefault(key, []).append((h, item_id))
+        self._size += 1
+
+    def nearest(self, h: int, max_distance: int) -> tuple[int, int] | None:
+        """
+        (distance, item_id) ближайшего хэша с distance <= max_distance или None.
+        При равном расстоянии выигрывает меньший item_id (т.е. более ранний image).
+        """
+        best_d = max_distance + 1
+        best_id = -1
+        probes = self._probes(max_distance // self.bands)
+
+        for table, key in zip(self._tables, self._band_keys(h), strict=True):
+            for bucket in map(table.get, [key ^ m for m in probes]):
+                if bucket is None:
+                    continue
+                for other, item_id in bucket:
+                    d = (h ^ other).bit_count()
+                    if d < best_d or (d == best_d and item_id < best_id):
+                        best_d = d
+                        best_id = item_id
+
+        if best_id < 0:
+            return None
+        return best_d, best_id
@@ -0,0 +1,180 @@
+"""
+Content-addressed кэш QC (qc_content_cache): sha256 + component + version -> value.
+
+- component "phash": {"phash": hex}, version = phash.PHASH_VERSION;
+- component <detector>: сырые метрики (в т.ч. resolution: width/height),
+  version = str(detector.version);
+- component "ai": {"score": ...}, version = scorer.version (с digest модели).
+
+qc_run_job сначала заполняет images.phash / images.quality из кэша и качает
+только то, чего там нет; content stage дописывает новые значения обратно.
+Устаревшие версии просто не находятся; физически их удаляет invalidate:
+    python -m app.worker.qc_cache invalidate              # всё, кроме текущих версий
+    python -m app.worker.qc_cache invalidate --component blur
+    python -m app.worker.qc_cache invalidate --all        # полностью
+"""
+
+from __future__ import annotations
+
+import argparse
+from collections.abc import Iterable, Sequence
+
+from sqlalchemy import and_, delete, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models.image import Image
+from app.models.qc import QCContentCache
+from app.worker.detectors import DETECTORS
+from app.worker.phash import PHASH_VERSION
+
+_LOOKUP_BATCH = 1000
+
+
+def current_versions(
+    want_phash: bool, names: Sequence[str], ai_version: str | None
+) -> dict[str, str]:
+    """component -> version, нужные текущему run."""
+    out: dict[str, str] = {}
+    if want_phash:
+        out["phash"] = PHASH_VERSION
+    for name in names:
+        out[name] = str(DETECTORS[name].version)
+    if ai_version is not None:
+        out["ai"] = ai_version
+    return out
+
+
+def lookup(
+    db: Session, shas: Iterable[str], versions: dict[str, str]
+) -> dict[str, dict[str, dict]]:
+    """sha256 -> {component: value} для записей с нужными версиями."""
+    shas = sorted({s for s in shas if s})
+    if not shas or not versions:
+        return {}
+    pairs = list(versions.items())
+
+    found: dict[str, dict[str, dict]] = {}
+    for i in range(0, len(shas), _LOOKUP_BATCH):
+        batch = shas[i : i + _LOOKUP_BATCH]
+        rows = db.execute(
+            select(
+                QCContentCache.sha256, QCContentCache.component, QCContentCache.value
+            ).where(
+                QCContentCache.sha256.in_(batch),
+                tuple_(QCContentCache.component, QCContentCache.version).in_(pairs),
+            )
+        )
+        for sha, component, value in rows:
+            found.setdefault(sha, {})[component] = value or {}
+    return found
+
+
+def apply_to_image(
+    img: Image, cached: dict[str, dict], versions: dict[str, str]
+) -> None:
+    """Разложить значения кэша в images.phash / images.quality (формат content stage)."""
+    quality = dict(img.quality or {})
+    for component, value in cached.items():
+        if component == "phash":
+            if not img.phash and value.get("phash"):
+                img.phash = value["phash"]
+        elif component == "ai":
+            quality["ai"] = {"v": versions["ai"], **value}
+        else:
+            quality[component] = {"v": DETECTORS[component].version, **value}
+    if quality != (img.quality or {}):
+        img.quality = quality
+
+
+def entries_for_image(img: Image, versions: dict[str, str]) -> list[dict]:
+    """Строки кэша из посчитанных phash/quality картинки (только текущие версии)."""
+    if not img.sha256:
+        return []
+    out: list[dict] = []
+    if "phash" in versions and img.phash:
+        out.append(
+            {
+                "component": "phash",
+                "version": versions["phash"],
+                "value": {"phash": img.phash},
+            }
+        )
+    quality = img.quality or {}
+    for component, version in versions.items():
+        if component == "phash":
+            continue
+        metrics = dict(quality.get(component) or {})
+        v = metrics.pop("v", None)
+        if v is None or str(v) != version:
+            continue
+        out.append({"component": component, "version": version, "value": metrics})
+    for row in out:
+        row["sha256"] = img.sha256
+    return out
+
+
+def store(db: Session, entries: Sequence[dict]) -> int:
+    """INSERT ... ON CONFLICT DO NOTHING (параллельные чанки пишут одно и то же)."""
+    # одна строка на ключ: в одном INSERT конфликт сам с собой — ошибка
+    rows = {(e["sha256"], e["component"], e["version"]): e for e in entries}
+    if not rows:
+        return 0
+    stmt = pg_insert(QCContentCache).values(list(rows.values()))
+    res = db.execute(
+        stmt.on_conflict_do_nothing(index_elements=["sha256", "component", "version"])
+    )
+    return int(res.rowcount or 0)
+
+
+def invalidate(
+    db: Session,
+    component: str | None = None,
+    everything: bool = False,
+    ai_version: str | None = None,
+) -> int:
+    """
+    Удалить записи устаревших версий (или все, everything=True).
+    ai: текущая версия зависит от модели воркера — без ai_version
+    (--ai-version) записи "ai" не трогаем, если не everything.
+    """
+    stmt = delete(QCContentCache)
+    if component:
+        stmt = stmt.where(QCContentCache.component == component)
+    if not everything:
+        current = current_versions(True, list(DETECTORS), ai_version)
+        keep = [
+            and_(QCContentCache.component == c, QCContentCache.version == v)
+            for c, v in current.items()
+        ]
+        if ai_version is None:
+            keep.append(QCContentCache.component == "ai")
+        stmt = stmt.where(~or_(*keep))
+    res = db.execute(stmt.execution_options(synchronize_session=False))
+    return int(res.rowcount or 0)
+
+
+def main() -> None:
+    import app.models  # noqa: F401  (регистрация всех моделей для FK)
+    from app.db.session import SessionLocal
+
+    ap = argparse.ArgumentParser(description="QC content cache maintenance")
+    ap.add_argument("command", choices=["invalidate"])
+    ap.add_argument("--component", help="phash / имя детектора / ai")
+    ap.add_argument("--all", action="store_true", help="удалить и текущие версии")
+    ap.add_argument(
+        "--ai-version", help="текущая версия ai-скорера (остальные удалить)"
+    )
+    args = ap.parse_args()
+
+    db = SessionLocal()
+    try:
+        n = invalidate(db, args.component, args.all, args.ai_version)
+        db.commit()
+        print(f"qc_content_cache: deleted {n} entries")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Отпечаток набора images заявки + конфигурации QC.
+
+images: (count, max image id, sha_sum), sha_sum — сумма первых 60 бит sha256
+по всем images. Сумма не зависит от порядка и, в отличие от XOR, учитывает
+одинаковые sha256 (дубли в заявке — норма). Считается одним агрегатным
+запросом (POST /qc/run) или по уже загруженным images (qc_run_job) —
+результаты совпадают.
+
+config: sha256 от канонического JSON всего, что влияет на результаты QC:
+детекторы с порогами и версиями, phash, скорер, near_duplicates/distance.
+chunk_size/parallelism/mode не влияют на результат и в отпечаток не входят.
+
+Совпали оба с последним done run — повторный QC ничего не изменит
+(кроме cross-request дублей от заявок, загруженных позже; для них force).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from sqlalchemy import BigInteger, cast, func, literal, select
+from sqlalchemy.dialects.postgresql import BIT
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.image import Image
+from app.models.qc import QCRun
+from app.worker.ai_scorer import resolve_scorer_name
+from app.worker.detectors import DETECTORS, resolve_detectors
+from app.worker.phash import PHASH_VERSION
+
+# 15 hex = 60 бит: влезает в bigint со знаком
+_SHA_PREFIX = 15
+
+
+@dataclass(frozen=True)
+class ImageSetFingerprint:
+    count: int
+    max_image_id: int | None
+    sha_sum: str
+
+    # run — QCRun или Export: у обоих колонки images_count/max_id/sha_sum
+    def matches(self, run: QCRun) -> bool:
+        return (
+            run.images_count == self.count
+            and run.images_max_id == self.max_image_id
+            and run.images_sha_sum == self.sha_sum
+        )
+
+    def apply(self, run: QCRun) -> None:
+        run.images_count = self.count
+        run.images_max_id = self.max_image_id
+        run.images_sha_sum = self.sha_sum
+
+
+def image_set_fingerprint(
+    db: Session, request_id: int, up_to_id: int | None = None
+) -> ImageSetFingerprint:
+    """up_to_id — только images с id <= up_to_id (тот же набор, что был у снимка)."""
+    prefix = func.substr(Image.sha256, 1, _SHA_PREFIX)
+    value = cast(cast(literal("x") + prefix, BIT(_SHA_PREFIX * 4)), BigInteger)
+    stmt = select(func.count(Image.id), func.max(Image.id), func.sum(value)).where(
+        Image.request_id == request_id
+    )
+    if up_to_id is not None:
+        stmt = stmt.where(Image.id <= up_to_id)
+    count, max_id, sha_sum = db.execute(stmt).one()
+    return ImageSetFingerprint(
+        count=int(count), max_image_id=max_id, sha_sum=str(int(sha_sum or 0))
+    )
+
+
+def images_fingerprint(images: Iterable[Image]) -> ImageSetFingerprint:
+    count, max_id, sha_sum = 0, None, 0
+    for img in images:
+        count += 1
+        max_id = img.id if max_id is None else max(max_id, img.id)
+        if img.sha256:
+            sha_sum += int(img.sha256[:_SHA_PREFIX], 16)
+    return ImageSetFingerprint(count=count, max_image_id=max_id, sha_sum=str(sha_sum))
+
+
+def config_digest(params: dict) -> str:
+    """QCRun.params (до или после resolve в qc_run_job) -> sha256 hex."""
+    detectors = resolve_detectors(params.get("detectors"))
+    scorer = resolve_scorer_name(params.get("ai_scorer"))
+    near = bool(params.get("near_duplicates", True))
+    config = {
+        "detectors": {
+            name: {"v": DETECTORS[name].version, "options": opts}
+            for name, opts in sorted(detectors.items())
+        },
+        "near_duplicates": near,
+        "phash": PHASH_VERSION if near else None,
+        "phash_max_distance": int(
+            params.get("phash_max_distance", settings.qc_phash_max_distance)
+        ),
+        "cross_request": bool(params.get("cross_request", True)),
+        # версия onnx-модели известна только воркеру; путь — её прокси для API
+        "ai_scorer": scorer,
+        "ai_model": settings.qc_ai_model_path if scorer == "onnx" else None,
+    }
+    raw = json.dumps(config, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
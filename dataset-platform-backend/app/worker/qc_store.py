@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import json
+from collections.abc import Iterable, Sequence
+from itertools import islice
+
+from datetime import datetime
+
+from sqlalchemy import delete, insert, literal, select
+from sqlalchemy.orm import Session
+
+from app.models.image import Image
+from app.models.qc import QCResult
+
+# Порядок колонок для tuple-строк (COPY / multi-row INSERT)
+QC_RESULT_COLUMNS: tuple[str, ...] = (
+    "qc_run_id",
+    "request_id",
+    "image_id",
+    "duplicate_score",
+    "duplicate_of_image_id",
+    "ai_generated_score",
+    "flags",
+    "scores",
+    "created_at",
+)
+_JSON_COLUMNS = ("flags", "scores")
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def _chunks(rows: Iterable[Sequence], size: int):
+    it = iter(rows)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+def delete_qc_results(db: Session, qc_run_id: int) -> int:
+    """Set-based удаление результатов run (один DELETE, без загрузки ORM-объектов)."""
+    res = db.execute(
+        delete(QCResult)
+        .where(QCResult.qc_run_id == qc_run_id)
+        .execution_options(synchronize_session=False)
+    )
+    return int(res.rowcount or 0)
+
+
+def _copy_rows(db: Session, rows: Iterable[Sequence], chunk_size: int) -> int:
+    # psycopg3: COPY ... FROM STDIN через тот же connection/транзакцию, что и Session
+    raw = db.connection().connection.driver_connection
+    cols = ", ".join(QC_RESULT_COLUMNS)
+    json_idx = [QC_RESULT_COLUMNS.index(c) for c in _JSON_COLUMNS]
+
+    n = 0
+    with raw.cursor() as cur:
+        with cur.copy(f"COPY {QCResult.__tablename__} ({cols}) FROM STDIN") as copy:
+            for chunk in _chunks(rows, chunk_size):
+                for row in chunk:
+                    row = list(row)
+                    for i in json_idx:
+                        row[i] = json.dumps(row[i] or {})
+                    copy.write_row(row)
+                n += len(chunk)
+    return n
+
+
+def _insert_rows(db: Session, rows: Iterable[Sequence], chunk_size: int) -> int:
+    # fallback: executemany -> SQLAlchemy "insertmanyvalues" собирает
+    # multi-row INSERT ... VALUES (...), (...) пачками, без ORM-объектов
+    stmt = insert(QCResult.__table__)
+    n = 0
+    for chunk in _chunks(rows, chunk_size):
+        db.execute(stmt, [dict(zip(QC_RESULT_COLUMNS, r, strict=True)) for r in chunk])
+        n += len(chunk)
+    return n
+
+
+def bulk_insert_qc_results(
+    db: Session, rows: Iterable[Sequence], chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> int:
+    """
+    Массовая запись qc_results в обход ORM unit-of-work.
+    rows — tuple в порядке QC_RESULT_COLUMNS (flags, scores — dict).
+    Postgres + psycopg3 -> COPY, иначе multi-row INSERT пачками по chunk_size.
+    Коммит — на вызывающей стороне.
+    """
+    bind = db.get_bind()
+    if bind.dialect.name == "postgresql" and bind.dialect.driver == "psycopg":
+        return _copy_rows(db, rows, chunk_size)
+    return _insert_rows(db, rows, chunk_size)
+
+
+def replace_qc_results(
+    db: Session,
+    qc_run_id: int,
+    rows: Iterable[Sequence],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """Идемпотентная перезапись результатов run: DELETE + bulk insert в одной транзакции."""
+    delete_qc_results(db, qc_run_id)
+    return bulk_insert_qc_results(db, rows, chunk_size)
+
+
+def _reusable_filter(from_run_id: int, request_id: int):
+    # только images, которые всё ещё принадлежат заявке
+    return (
+        QCResult.qc_run_id == from_run_id,
+        QCResult.image_id.in_(select(Image.id).where(Image.request_id == request_id)),
+    )
+
+
+def reused_qc_image_ids(db: Session, from_run_id: int, request_id: int) -> set[int]:
+    """image_id, для которых есть результат в from_run (кандидаты на переиспользование)."""
+    return set(
+        db.execute(
+            select(QCResult.image_id).where(*_reusable_filter(from_run_id, request_id))
+        ).scalars()
+    )
+
+
+def copy_qc_results(
+    db: Session,
+    from_run_id: int,
+    to_run_id: int,
+    request_id: int,
+    created_at: datetime,
+) -> int:
+    """
+    Переносит результаты одного run в другой одним INSERT ... SELECT
+    (incremental QC: старые images не пересчитываем).
+    """
+    src = select(
+        literal(to_run_id),
+        QCResult.request_id,
+        QCResult.image_id,
+        QCResult.duplicate_score,
+        QCResult.duplicate_of_image_id,
+        QCResult.ai_generated_score,
+        QCResult.flags,
+        QCResult.scores,
+        literal(created_at, QCResult.created_at.type),
+    ).where(*_reusable_filter(from_run_id, request_id))
+
+    res = db.execute(
+        insert(QCResult).from_select(list(QC_RESULT_COLUMNS), src),
+        execution_options={"synchronize_session": False},
+    )
+    return int(res.rowcount or 0)
@@ -0,0 +1,298 @@
+"""
+Бенчмарк parquet-экспорта: пиковый RSS и время.
+
+legacy — прежний export_job: все images/annotations/qc_results в ORM, список dict,
+pa.Table.from_pylist, pq.write_table в BytesIO.
+stream — export_engine: server-side cursor батчами, row group на батч,
+S3MultipartWriter (или /dev/null-sink без S3, --sink null).
+
+Каждый режим — отдельный процесс, чтобы ru_maxrss не смешивались.
+Синтетическая заявка (images + 2 версии annotation + qc_results) коммитится
+перед замером и удаляется в конце. Нужен Postgres из .env (и MinIO для --sink s3).
+
+Запуск (из dataset-platform-backend):
+    python -m benchmarks.bench_export --rows 1000000 --sink null
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import app.models  # noqa: F401  (регистрация всех моделей для FK)
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.qc import QCRun
+from app.models.request import Request
+from app.models.task import Task
+from app.models.user import User
+
+
+class _NullSink:
+    """Считает байты и выбрасывает их: замер без сети и без буфера целиком."""
+
+    closed = False
+
+    def __init__(self) -> None:
+        self.bytes_written = 0
+
+    def write(self, data) -> int:
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _seed(db: Session, n: int) -> int:
+    user = User(
+        username=f"bench_export_{time.time_ns()}", password_hash="-", role="labeler"
+    )
+    db.add(user)
+    db.flush()
+    req = Request(customer_id=user.id, title="bench", description="", classes=[])
+    db.add(req)
+    db.flush()
+    task = Task(request_id=req.id, assigned_to=user.id, status="done")
+    run = QCRun(request_id=req.id, status="done", params={})
+    db.add_all([task, run])
+    db.flush()
+
+    params = {"rid": req.id, "n": n, "task_id": task.id, "uid": user.id}
+    db.execute(
+        text(
+            """
+            INSERT INTO images (request_id, file_name, content_type, storage_path,
+                                sha256, created_at)
+            SELECT :rid, 'img_' || g || '.jpg', 'image/jpeg',
+                   's3://images/bench/' || g || '.jpg', md5(g::text) || md5(g::text),
+                   now()
+            FROM generate_series(1, :n) AS g
+            """
+        ),
+        params,
+    )
+    # две версии разметки на image: экспорт должен взять более свежую
+    db.execute(
+        text(
+            """
+            INSERT INTO annotations (task_id, image_id, labeler_id, labels,
+                                     created_at, updated_at)
+            SELECT :task_id, i.id, :uid,
+                   json_build_array('class_' || ((i.id + v) % 5)),
+                   now(), now() - make_interval(secs => v)
+            FROM images i, generate_series(0, 1) AS v
+            WHERE i.request_id = :rid
+            """
+        ),
+        params,
+    )
+    db.execute(
+        text(
+            """
+            INSERT INTO qc_results (qc_run_id, request_id, image_id, duplicate_score,
+                                    duplicate_of_image_id, ai_generated_score,
+                                    flags, scores, created_at)
+            SELECT :run_id, :rid, i.id, random(), NULL, random(),
+                   CASE WHEN i.id % 7 = 0 THEN '{"BLURRY": true}'::json
+                        ELSE '{}'::json END,
+                   '{}'::json, now()
+            FROM images i WHERE i.request_id = :rid
+            """
+        ),
+        {**params, "run_id": run.id},
+    )
+    db.commit()
+    return req.id
+
+
+def _cleanup(db: Session, request_id: int) -> None:
+    params = {"rid": request_id}
+    for stmt in (
+        "DELETE FROM qc_results WHERE request_id = :rid",
+        "DELETE FROM qc_runs WHERE request_id = :rid",
+        (
+            "DELETE FROM annotations a USING tasks t"
+            " WHERE a.task_id = t.id AND t.request_id = :rid"
+        ),
+        "DELETE FROM tasks WHERE request_id = :rid",
+        "DELETE FROM images WHERE request_id = :rid",
+    ):
+        db.execute(text(stmt), params)
+    owner = db.execute(
+        text("DELETE FROM requests WHERE id = :rid RETURNING customer_id"), params
+    ).scalar()
+    db.execute(text("DELETE FROM users WHERE id = :uid"), {"uid": owner})
+    db.commit()
+
+
+def run_legacy(db: Session, request_id: int) -> tuple[int, int]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    from app.models.annotation import Annotation
+    from app.models.image import Image
+    from app.models.qc import QCResult
+
+    images = (
+        db.query(Image)
+        .filter(Image.request_id == request_id)
+        .order_by(Image.id.asc())
+        .all()
+    )
+    last_run = (
+        db.query(QCRun)
+        .filter(QCRun.request_id == request_id)
+        .order_by(QCRun.id.desc())
+        .first()
+    )
+    qc_map = {
+        r.image_id: r
+        for r in db.query(QCResult).filter(QCResult.qc_run_id == last_run.id)
+    }
+    # в оригинале Annotation.image_id.in_(image_ids): на >65535 images psycopg
+    # падает по лимиту параметров, поэтому здесь join — иначе сравнивать не с чем
+    ann_map: dict[int, Annotation] = {}
+    for a in (
+        db.query(Annotation)
+        .join(Image, Image.id == Annotation.image_id)
+        .filter(Image.request_id == request_id)
+        .order_by(Annotation.image_id.asc(), Annotation.updated_at.desc())
+    ):
+        ann_map.setdefault(a.image_id, a)
+
+    out_rows = []
+    for img in images:
+        ann = ann_map.get(img.id)
+        qc = qc_map.get(img.id)
+        out_rows.append(
+            {
+                "request_id": request_id,
+                "image_id": img.id,
+                "file_name": img.file_name,
+                "storage_path": img.storage_path,
+                "sha256": img.sha256,
+                "labels": ann.labels if ann else None,
+                "labels_json": json.dumps(ann.labels) if ann else None,
+                "annotation_updated_at": ann.updated_at.isoformat() if ann else None,
+                "duplicate_score": qc.duplicate_score if qc else None,
+                "ai_generated_score": qc.ai_generated_score if qc else None,
+                "qc_flags": qc.flags if qc else None,
+                "qc_flags_json": json.dumps(qc.flags) if qc else None,
+            }
+        )
+    buf = io.BytesIO()
+    pq.write_table(pa.Table.from_pylist(out_rows), buf)
+    return len(out_rows), len(buf.getvalue())
+
+
+def run_stream(db: Session, request_id: int, sink: str) -> tuple[int, int]:
+    from app.core.config import get_s3_client
+    from app.worker.export_engine import (
+        PARQUET_CONTENT_TYPE,
+        iter_export_batches,
+        write_parquet,
+    )
+
+    if sink == "s3":
+        s3 = get_s3_client()
+        key = f"bench/export_{request_id}.parquet"
+        out = s3.open_multipart(
+            bucket=settings.s3_bucket_exports,
+            key=key,
+            content_type=PARQUET_CONTENT_TYPE,
+            part_size=settings.export_part_bytes,
+        )
+    else:
+        out = _NullSink()
+    with out:
+        rows = write_parquet(iter_export_batches(db, request_id), out)
+    if sink == "s3":
+        s3._client_internal.delete_object(Bucket=settings.s3_bucket_exports, Key=key)
+    return rows, out.bytes_written
+
+
+def _child(mode: str, request_id: int, sink: str) -> None:
+    db = SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        if mode == "legacy":
+            rows, size = run_legacy(db, request_id)
+        else:
+            rows, size = run_stream(db, request_id, sink)
+        wall = time.perf_counter() - t0
+    finally:
+        db.close()
+    # ru_maxrss в Linux — KiB
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"rows": rows, "wall": wall, "rss_mb": rss_mb, "size": size}))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    ap.add_argument("--modes", nargs="+", default=["legacy", "stream"])
+    ap.add_argument("--sink", choices=("null", "s3"), default="null")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--request-id", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        _child(args.child, args.request_id, args.sink)
+        return
+
+    print(f"{'rows':>9} {'mode':<7} {'wall s':>8} {'peak RSS MB':>12} {'MB':>8}")
+    for n in args.rows:
+        db = SessionLocal()
+        request_id = _seed(db, n)
+        try:
+            for mode in args.modes:
+                proc = subprocess.run(
+                    [
+                        sys.executable,
+                        "-m",
+                        "benchmarks.bench_export",
+                        "--child",
+                        mode,
+                        "--request-id",
+                        str(request_id),
+                        "--sink",
+                        args.sink,
+                    ],
+                    check=False,
+                    stdout=subprocess.PIPE,
+                    text=True,
+                )
+                if proc.returncode:
+                    # legacy на больших заявках убивает OOM killer — тоже результат
+                    print(f"{n:>9} {mode:<7} failed (exit code {proc.returncode})")
+                    continue
+                res = json.loads(proc.stdout.strip().splitlines()[-1])
+                print(
+                    f"{res['rows']:>9} {mode:<7} {res['wall']:>8.2f}"
+                    f" {res['rss_mb']:>12.0f} {res['size'] / 1e6:>8.1f}"
+                )
+        finally:
+            _cleanup(db, request_id)
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Бенчмарк кодирования parquet экспорта: размер файла, запись и чтение.
+
+v1 — прежний формат (labels/qc_flags строками + дубли labels_json/qc_flags_json,
+annotation_updated_at строкой ISO, snappy). Остальные — EXPORT_SCHEMA
+(dictionary-метки, типизированные QC, timestamp) с разными ParquetOptions.
+
+Строки читаются из БД один раз (iter_export_batches) и держатся в памяти,
+замер — только кодирование/декодирование в BytesIO:
+    write    — ParquetWriter, все row groups;
+    read     — весь файл;
+    project  — image_id, labels, duplicate_score;
+    by id    — pq.read_table(filters=image_id ==) по 50 случайным id;
+    by sha   — то же по sha256 (min/max не отсекают: sha256 не упорядочен).
+pyarrow Bloom filters при чтении не использует — их читают Spark/Trino/DuckDB;
+здесь виден только их размер.
+
+Синтетическая заявка как в bench_export (+ разнообразные QC flags/scores).
+Запуск (из dataset-platform-backend):
+    python -m benchmarks.bench_export_encoding --rows 200000
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import random
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+from app.db.session import SessionLocal
+from app.worker.export_engine import (
+    EXPORT_SCHEMA,
+    ParquetOptions,
+    iter_export_batches,
+)
+from benchmarks.bench_export import _cleanup, _seed
+
+CONFIGS: dict[str, dict | None] = {
+    "v1 snappy": None,
+    "snappy": {"codec": "snappy"},
+    "zstd": {"codec": "zstd"},
+    "zstd 9": {"codec": "zstd", "compression_level": 9},
+    "zstd no-dict": {"codec": "zstd", "dictionary": False},
+    "zstd no-stats": {"codec": "zstd", "statistics": False},
+    "zstd bloom": {"codec": "zstd", "bloom_filter": True},
+    "gzip 6": {"codec": "gzip", "compression_level": 6},
+}
+
+V1_SCHEMA = pa.schema(
+    [
+        ("request_id", pa.int64()),
+        ("image_id", pa.int64()),
+        ("file_name", pa.string()),
+        ("storage_path", pa.string()),
+        ("sha256", pa.string()),
+        ("labels", pa.list_(pa.string())),
+        ("labels_json", pa.string()),
+        ("annotation_updated_at", pa.string()),
+        ("duplicate_score", pa.float64()),
+        ("ai_generated_score", pa.float64()),
+        ("qc_flags", pa.list_(pa.string())),
+        ("qc_flags_json", pa.string()),
+    ]
+)
+
+
+def _vary_qc(db, request_id: int) -> None:
+    """Флаги и scores как у реального QC: near-дубли, экспозиция, scores."""
+    db.execute(
+        text(
+            """
+            UPDATE qc_results SET
+              scores = json_build_object(
+                'blur', round(random()::numeric, 4),
+                'exposure', round(random()::numeric, 4),
+                'resolution', round(random()::numeric, 4)),
+              flags = CASE
+                WHEN image_id % 11 = 0 THEN json_build_object(
+                  'NEAR_DUPLICATE', true, 'phash_distance', image_id % 7)
+                WHEN image_id % 13 = 0 THEN '{"BAD_EXPOSURE": "overexposed"}'::json
+                ELSE flags END
+            WHERE request_id = :rid
+            """
+        ),
+        {"rid": request_id},
+    )
+    db.commit()
+    # статистика после seed/UPDATE: иначе planner берёт nested loop по images
+    for table in ("images", "annotations", "qc_results"):
+        db.execute(text(f"ANALYZE {table}"))
+    db.commit()
+
+
+def _to_v1(batch: pa.RecordBatch) -> pa.RecordBatch:
+    rows = batch.to_pylist()
+    cols: dict[str, list] = {name: [] for name in V1_SCHEMA.names}
+    for r in rows:
+        flags = dict.fromkeys(r["qc_flags"] or [], True)
+        if r["phash_distance"] is not None:
+            flags["phash_distance"] = r["phash_distance"]
+        if r["exposure_issue"]:
+            flags["BAD_EXPOSURE"] = r["exposure_issue"]
+        for name in ("request_id", "image_id", "file_name", "storage_path", "sha256"):
+            cols[name].append(r[name])
+        cols["labels"].append(r["labels"])
+        cols["labels_json"].append(json.dumps(r["labels"]))
+        cols["annotation_updated_at"].append(r["annotation_updated_at"].isoformat())
+        cols["duplicate_score"].append(r["duplicate_score"])
+        cols["ai_generated_score"].append(r["ai_generated_score"])
+        cols["qc_flags"].append(sorted(flags))
+        cols["qc_flags_json"].append(json.dumps(flags))
+    return pa.RecordBatch.from_pydict(cols, schema=V1_SCHEMA)
+
+
+def _write(batches: list[pa.RecordBatch], params: dict | None) -> tuple[bytes, float]:
+    buf = io.BytesIO()
+    t0 = time.perf_counter()
+    if params is None:
+        writer = pq.ParquetWriter(buf, V1_SCHEMA, compression="snappy")
+    else:
+        options = ParquetOptions.from_params(params)
+        writer = pq.ParquetWriter(buf, EXPORT_SCHEMA, **options.writer_kwargs())
+    with writer:
+        for batch in batches:
+            writer.write_batch(batch)
+    return buf.getvalue(), time.perf_counter() - t0
+
+
+def _timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _measure(data: bytes, ids: list[int], shas: list[str]) -> dict[str, float]:
+    def read_all():
+        pq.read_table(io.BytesIO(data))
+
+    def project():
+        pq.read_table(
+            io.BytesIO(data), columns=["image_id", "labels", "duplicate_score"]
+        )
+
+    def by(column: str, values: list):
+        def run():
+            for v in values:
+                pq.read_table(io.BytesIO(data), filters=[(column, "==", v)])
+
+        return run
+
+    return {
+        "read": _timed(read_all),
+        "project": _timed(project),
+        "by_id": _timed(by("image_id", ids), repeat=1) / len(ids),
+        "by_sha": _timed(by("sha256", shas), repeat=1) / len(shas),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--row-group-rows", type=int, default=50_000)
+    ap.add_argument("--configs", nargs="+", default=list(CONFIGS))
+    args = ap.parse_args()
+
+    db = SessionLocal()
+    request_id = _seed(db, args.rows)
+    try:
+        _vary_qc(db, request_id)
+        batches = list(
+            iter_export_batches(db, request_id, batch_rows=args.row_group_rows)
+        )
+    finally:
+        _cleanup(db, request_id)
+        db.close()
+
+    table = pa.Table.from_batches(batches)
+    rnd = random.Random(0)
+    picks = rnd.sample(range(table.num_rows), 50)
+    ids = pc.take(table["image_id"], pa.array(picks)).to_pylist()
+    shas = pc.take(table["sha256"], pa.array(picks)).to_pylist()
+    v1_batches = [_to_v1(b) for b in batches]
+
+    print(
+        f"{'config':<14} {'MB':>7} {'write s':>8} {'read s':>7}"
+        f" {'project s':>9} {'by id ms':>9} {'by sha ms':>9}"
+    )
+    for name in args.configs:
+        params = CONFIGS[name]
+        if params is not None:
+            params = {**params, "row_group_rows": args.row_group_rows}
+        data, write_s = _write(v1_batches if params is None else batches, params)
+        m = _measure(data, ids, shas)
+        print(
+            f"{name:<14} {len(data) / 1e6:>7.2f} {write_s:>8.2f} {m['read']:>7.3f}"
+            f" {m['project']:>9.3f} {m['by_id'] * 1e3:>9.1f}"
+            f" {m['by_sha'] * 1e3:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
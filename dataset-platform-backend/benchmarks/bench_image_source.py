@@ -0,0 +1,109 @@
+"""
+Бенчмарк чтения картинок: последовательный GET + decode vs ImageStream.
+
+Источник — s3://bucket/prefix (нужен MinIO из .env) или локальная директория.
+Печатает objects/s, MB/s, пик байт в prefetch и max RSS процесса.
+
+Запуск (из dataset-platform-backend):
+    python -m benchmarks.bench_image_source s3://images/requests/1/ --limit 2000
+    python -m benchmarks.bench_image_source ./storage --concurrency 32 --max-mb 128
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import resource
+import time
+
+from app.core.config import get_s3_client
+from app.core.s3 import parse_s3_uri
+from app.worker.image_source import DECODE_ERRORS, ImageStream, decode_image
+
+
+def _list_paths(source: str, limit: int) -> list[str]:
+    out: list[str] = []
+    if source.startswith("s3://"):
+        bucket, _, prefix = source[len("s3://") :].partition("/")
+        client = get_s3_client()._client_internal
+        for page in client.get_paginator("list_objects_v2").paginate(
+            Bucket=bucket, Prefix=prefix
+        ):
+            for obj in page.get("Contents", []):
+                out.append(f"s3://{bucket}/{obj['Key']}")
+                if len(out) >= limit:
+                    return out
+        return out
+
+    for root, _, files in os.walk(source):
+        for name in sorted(files):
+            out.append(os.path.join(root, name))
+            if len(out) >= limit:
+                return out
+    return out
+
+
+def _read(path: str) -> bytes:
+    if path.startswith("s3://"):
+        bucket, key = parse_s3_uri(path)
+        return get_s3_client().get_bytes(bucket=bucket, key=key)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_sequential(paths: list[str]) -> None:
+    t0 = time.perf_counter()
+    nbytes = 0
+    for path in paths:
+        data = _read(path)
+        nbytes += len(data)
+        try:
+            decode_image(data).close()
+        except DECODE_ERRORS:
+            pass
+    dt = time.perf_counter() - t0
+    print(
+        f"{'sequential':<12} {dt:>8.2f} s  {len(paths) / dt:>8.1f} obj/s"
+        f"  {nbytes / dt / 1e6:>8.1f} MB/s  rss={_max_rss_mb():.0f} MB"
+    )
+
+
+def bench_stream(paths: list[str], concurrency: int, max_bytes: int) -> None:
+    t0 = time.perf_counter()
+    with ImageStream(
+        enumerate(paths), concurrency=concurrency, max_bytes_in_flight=max_bytes
+    ) as stream:
+        for _batch in stream.batches(64):
+            pass
+        dt = time.perf_counter() - t0
+        print(
+            f"{'stream':<12} {dt:>8.2f} s  {len(paths) / dt:>8.1f} obj/s"
+            f"  {stream.stats['bytes'] / dt / 1e6:>8.1f} MB/s"
+            f"  rss={_max_rss_mb():.0f} MB"
+            f"  peak_in_flight={stream.peak_bytes_in_flight / 1e6:.1f} MB"
+        )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("source", help="s3://bucket/prefix или локальная директория")
+    ap.add_argument("--limit", type=int, default=1000)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--max-mb", type=int, default=256)
+    ap.add_argument("--skip-sequential", action="store_true")
+    args = ap.parse_args()
+
+    paths = _list_paths(args.source, args.limit)
+    print(f"objects={len(paths)} concurrency={args.concurrency} max_mb={args.max_mb}")
+    # stream первым: max RSS монотонный, так видно его собственный пик
+    bench_stream(paths, args.concurrency, args.max_mb * 1024 * 1024)
+    if not args.skip_sequential:
+        bench_sequential(paths)
+
+
+if __name__ == "__main__":
+    main()
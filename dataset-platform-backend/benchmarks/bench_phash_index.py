@@ -0,0 +1,91 @@
+"""
+Бенчмарк HammingIndex (near-duplicate поиск в qc_run_job).
+
+Сценарий как в job: для каждого хэша по порядку ищем ближайший ранний
+(nearest), потом добавляем его в индекс. ~5% хэшей — "почти копии"
+(1..max_distance flipped bits) уже добавленных.
+
+Запуск (из dataset-platform-backend):
+    python -m benchmarks.bench_phash_index
+    python -m benchmarks.bench_phash_index --sizes 10000 100000 --pairwise-max 10000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from app.worker.phash import HASH_BITS, HammingIndex
+
+
+def _make_hashes(n: int, max_distance: int, seed: int = 42) -> list[int]:
+    rnd = random.Random(seed)
+    out: list[int] = []
+    for _ in range(n):
+        if out and rnd.random() < 0.05:
+            h = out[rnd.randrange(len(out))]
+            for bit in rnd.sample(range(HASH_BITS), rnd.randint(1, max_distance)):
+                h ^= 1 << bit
+        else:
+            h = rnd.getrandbits(HASH_BITS)
+        out.append(h)
+    return out
+
+
+def bench_index(hashes: list[int], max_distance: int) -> tuple[float, int]:
+    index = HammingIndex()
+    found = 0
+    t0 = time.perf_counter()
+    for i, h in enumerate(hashes):
+        if index.nearest(h, max_distance) is not None:
+            found += 1
+        index.add(h, i)
+    return time.perf_counter() - t0, found
+
+
+def bench_pairwise(hashes: list[int], max_distance: int) -> tuple[float, int]:
+    found = 0
+    t0 = time.perf_counter()
+    for i, h in enumerate(hashes):
+        for j in range(i):
+            if (h ^ hashes[j]).bit_count() <= max_distance:
+                found += 1
+                break
+    return time.perf_counter() - t0, found
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    ap.add_argument("--max-distance", type=int, default=6)
+    ap.add_argument(
+        "--pairwise-max",
+        type=int,
+        default=10_000,
+        help="pairwise-скан только для N <= этого значения (он O(N^2))",
+    )
+    args = ap.parse_args()
+
+    print(
+        f"{'N':>10} {'index, s':>10} {'us/query':>10} {'found':>8} {'pairwise, s':>12}"
+    )
+    for n in args.sizes:
+        hashes = _make_hashes(n, args.max_distance)
+        t_idx, found = bench_index(hashes, args.max_distance)
+
+        pairwise = "-"
+        if n <= args.pairwise_max:
+            t_pw, found_pw = bench_pairwise(hashes, args.max_distance)
+            assert found_pw == found, (found_pw, found)
+            pairwise = f"{t_pw:.2f}"
+
+        print(
+            f"{n:>10} {t_idx:>10.2f} {t_idx / n * 1e6:>10.1f} {found:>8} {pairwise:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Бенчмарк выдачи /qc/results: JSON (ORM + jsonable_encoder) vs Arrow IPC / Parquet
+(column-projected SELECT + RecordBatch).
+
+Синтетические images/qc_results создаются в одной транзакции (generate_series)
+и в конце откатываются — БД не засоряется. Нужен Postgres из .env и pandas
+(клиентская сторона, как в UI).
+Меряется серверная часть (запрос + сериализация) и клиентская (байты -> pandas).
+
+Запуск (из dataset-platform-backend):
+    python -m benchmarks.bench_qc_results_transport --rows 100000 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+import app.models  # noqa: F401  (регистрация всех моделей для FK)
+from app.core.arrow_io import iter_encoded, rows_to_batch
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.qc import QCResult, QCRun
+from app.models.request import Request
+from app.models.user import User
+from app.routers.qc import _ARROW_COLUMNS, QC_RESULTS_ARROW_SCHEMA
+
+
+def _seed(db: Session, n: int) -> int:
+    user = User(
+        username=f"bench_qc_{time.time_ns()}", password_hash="-", role="customer"
+    )
+    db.add(user)
+    db.flush()
+    req = Request(customer_id=user.id, title="bench", description="", classes=[])
+    db.add(req)
+    db.flush()
+    run = QCRun(request_id=req.id, status="done", params={})
+    db.add(run)
+    db.flush()
+
+    db.execute(
+        text(
+            """
+            INSERT INTO images (request_id, file_name, content_type, storage_path,
+                                sha256, created_at)
+            SELECT :rid, 'img_' || g || '.jpg', 'image/jpeg',
+                   's3://images/bench/' || g || '.jpg', md5(g::text) || md5(g::text),
+                   now()
+            FROM generate_series(1, :n) AS g
+            """
+        ),
+        {"rid": req.id, "n": n},
+    )
+    db.execute(
+        text(
+            """
+            INSERT INTO qc_results (qc_run_id, request_id, image_id, duplicate_score,
+                                    duplicate_of_image_id, ai_generated_score,
+                                    flags, scores, created_at)
+            SELECT :run_id, :rid, i.id, random(), NULL, random(),
+                   CASE WHEN i.id % 7 = 0 THEN '{"BLURRY": true}'::json
+                        ELSE '{}'::json END,
+                   json_build_object('blur', random(), 'exposure', random()),
+                   now()
+            FROM images i WHERE i.request_id = :rid
+            """
+        ),
+        {"run_id": run.id, "rid": req.id},
+    )
+    db.flush()
+    return run.id
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def bench_json(db: Session, run_id: int) -> tuple[float, float, int]:
+    def server() -> bytes:
+        rows = db.execute(
+            select(QCResult)
+            .where(QCResult.qc_run_id == run_id)
+            .order_by(QCResult.id.asc())
+        ).scalars()
+        # то же, что делает FastAPI с возвращённым списком ORM-объектов
+        return json.dumps(jsonable_encoder(list(rows))).encode()
+
+    payload, t_server = _timed(server)
+    db.expunge_all()
+    _, t_client = _timed(lambda: pd.DataFrame(json.loads(payload)))
+    return t_server, t_client, len(payload)
+
+
+def bench_columnar(db: Session, run_id: int, fmt: str) -> tuple[float, float, int]:
+    stmt = (
+        select(*_ARROW_COLUMNS)
+        .where(QCResult.qc_run_id == run_id)
+        .order_by(QCResult.id.asc())
+        .execution_options(yield_per=settings.qc_results_arrow_batch_rows)
+    )
+
+    def server() -> bytes:
+        batches = (
+            rows_to_batch(part, QC_RESULTS_ARROW_SCHEMA)
+            for part in db.execute(stmt).partitions()
+        )
+        return b"".join(iter_encoded(batches, QC_RESULTS_ARROW_SCHEMA, fmt))
+
+    def client(data: bytes) -> pd.DataFrame:
+        if fmt == "arrow":
+            return pa.ipc.open_stream(data).read_all().to_pandas()
+        return pq.read_table(io.BytesIO(data)).to_pandas()
+
+    payload, t_server = _timed(server)
+    _, t_client = _timed(lambda: client(payload))
+    return t_server, t_client, len(payload)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = ap.parse_args()
+
+    print(f"{'rows':>9} {'format':<8} {'server s':>9} {'client s':>9} {'MB':>8}")
+    for n in args.rows:
+        db = SessionLocal()
+        try:
+            run_id = _seed(db, n)
+            for name, fn in (
+                ("json", lambda db=db, run_id=run_id: bench_json(db, run_id)),
+                (
+                    "arrow",
+                    lambda db=db, run_id=run_id: bench_columnar(db, run_id, "arrow"),
+                ),
+                (
+                    "parquet",
+                    lambda db=db, run_id=run_id: bench_columnar(db, run_id, "parquet"),
+                ),
+            ):
+                t_server, t_client, size = fn()
+                print(
+                    f"{n:>9} {name:<8} {t_server:>9.2f} {t_client:>9.2f}"
+                    f" {size / 1e6:>8.1f}"
+                )
+        finally:
+            db.rollback()
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Бенчмарк записи qc_results: ORM (db.add на строку) vs multi-row INSERT vs COPY.
+
+Нужен живой Postgres (DATABASE_URL). Скрипт создаёт временные
+user/request/images/qc_run, меряет каждый путь и удаляет за собой.
+
+Запуск (из dataset-platform-backend):
+    DATABASE_URL=postgresql+psycopg://... python -m benchmarks.bench_qc_results_write
+    python -m benchmarks.bench_qc_results_write --rows 100000 --chunk-size 5000
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import delete
+
+import app.main  # noqa: F401  (регистрирует все модели)
+from app.db.session import Base, SessionLocal, engine
+from app.models.image import Image
+from app.models.qc import QCResult, QCRun
+from app.models.request import Request
+from app.models.user import User
+from app.worker.qc_store import (
+    _insert_rows,
+    bulk_insert_qc_results,
+    delete_qc_results,
+)
+
+
+def _setup(n: int) -> tuple[int, int, int, list[int]]:
+    db = SessionLocal()
+    try:
+        user = User(
+            username=f"bench_{uuid.uuid4().hex[:8]}",
+            password_hash="x",
+            role="customer",
+        )
+        db.add(user)
+        db.flush()
+        req = Request(customer_id=user.id, title="bench", classes=[])
+        db.add(req)
+        db.flush()
+
+        raw = db.connection().connection.driver_connection
+        with raw.cursor() as cur:
+            with cur.copy(
+                "COPY images (request_id, file_name, content_type, storage_path,"
+                " sha256, created_at) FROM STDIN"
+            ) as copy:
+                now = datetime.now(timezone.utc)
+                for i in range(n):
+                    copy.write_row(
+                        (
+                            req.id,
+                            f"{i}.jpg",
+                            "image/jpeg",
+                            f"/tmp/{i}.jpg",
+                            f"{i:064x}",
+                            now,
+                        )
+                    )
+
+        run = QCRun(request_id=req.id, status="running", params={})
+        db.add(run)
+        db.commit()
+
+        image_ids = [
+            r[0]
+            for r in db.query(Image.id)
+            .filter(Image.request_id == req.id)
+            .order_by(Image.id)
+        ]
+        return user.id, req.id, run.id, image_ids
+    finally:
+        db.close()
+
+
+def _teardown(user_id: int, request_id: int, run_id: int) -> None:
+    db = SessionLocal()
+    try:
+        delete_qc_results(db, run_id)
+        db.execute(delete(QCRun).where(QCRun.id == run_id))
+        db.execute(delete(Image).where(Image.request_id == request_id))
+        db.execute(delete(Request).where(Request.id == request_id))
+        db.execute(delete(User).where(User.id == user_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _rows(run_id: int, request_id: int, image_ids: list[int]):
+    now = datetime.now(timezone.utc)
+    for i, image_id in enumerate(image_ids):
+        dup = image_ids[i - 1] if i % 10 == 0 and i else None
+        flags = {"DUPLICATE": True} if dup else {}
+        yield (
+            run_id,
+            request_id,
+            image_id,
+            1.0 if dup else 0.0,
+            dup,
+            0.0,
+            flags,
+            {},
+            now,
+        )
+
+
+def _timed(label: str, fn) -> None:
+    db = SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        fn(db)
+        db.commit()
+        dt = time.perf_counter() - t0
+    finally:
+        db.close()
+    print(f"{label:<28} {dt:>8.2f} s")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--chunk-size", type=int, default=5000)
+    args = ap.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    user_id, request_id, run_id, image_ids = _setup(args.rows)
+    try:
+
+        def orm_path(db):
+            # как было в qc_run_job: Query.delete + QCResult на строку + db.add
+            db.query(QCResult).filter(QCResult.qc_run_id == run_id).delete()
+            for r in _rows(run_id, request_id, image_ids):
+                db.add(
+                    QCResult(
+                        qc_run_id=r[0],
+                        request_id=r[1],
+                        image_id=r[2],
+                        duplicate_score=r[3],
+                        duplicate_of_image_id=r[4],
+                        ai_generated_score=r[5],
+                        flags=r[6],
+                        scores=r[7],
+                        created_at=r[8],
+                    )
+                )
+
+        def insert_path(db):
+            delete_qc_results(db, run_id)
+            _insert_rows(db, _rows(run_id, request_id, image_ids), args.chunk_size)
+
+        def copy_path(db):
+            delete_qc_results(db, run_id)
+            bulk_insert_qc_results(
+                db, _rows(run_id, request_id, image_ids), args.chunk_size
+            )
+
+        print(f"rows={args.rows} chunk_size={args.chunk_size}")
+        _timed("ORM db.add per row", orm_path)
+        _timed("multi-row INSERT (chunks)", insert_path)
+        _timed("COPY FROM STDIN", copy_path)
+    finally:
+        _teardown(user_id, request_id, run_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Тесты backend. Большинство — без внешних сервисов; тесты SQL (fixture db)
+идут в Postgres из TEST_DATABASE_URL (отдельная БД: схема пересоздаётся),
+без переменной — skip. Redis/S3 не нужны.
+
+Запуск (из dataset-platform-backend):
+    python -m pytest -q
+    TEST_DATABASE_URL=postgresql+psycopg://postgres@localhost/dp_test python -m pytest -q
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+# пакет app — из корня backend, без установки
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest.fixture(scope="session")
+def db_engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    import app.main  # noqa: F401  (все модели и роутеры)
+    from app.db.session import Base
+
+    engine = create_engine(TEST_DATABASE_URL)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(db_engine):
+    """Сессия в транзакции, откатываемой после теста (commit — savepoint)."""
+    conn = db_engine.connect()
+    outer = conn.begin()
+    session = Session(bind=conn, join_transaction_mode="create_savepoint")
+    try:
+        yield session
+    finally:
+        session.close()
+        outer.rollback()
+        conn.close()
+
+
+@pytest.fixture
+def customer(db):
+    from app.models.user import User
+
+    user = User(username="customer-test", password_hash="x", role="customer")
+    db.add(user)
+    db.flush()
+    return user
+
+
+@pytest.fixture
+def make_request(db, customer):
+    """make_request(n) -> Request с n images (sha256 по номеру)."""
+    from app.models.image import Image
+    from app.models.request import Request
+
+    def make(n: int = 3) -> Request:
+        req = Request(customer_id=customer.id, title="t", classes=["a", "b"])
+        db.add(req)
+        db.flush()
+        for i in range(n):
+            db.add(
+                Image(
+                    request_id=req.id,
+                    file_name=f"{i}.png",
+                    storage_path=f"s3://images/{req.id}/{i}.png",
+                    sha256=hashlib.sha256(f"{req.id}:{i}".encode()).hexdigest(),
+                )
+            )
+        db.flush()
+        return req
+
+    return make
+
+
+@pytest.fixture
+def api(db, customer):
+    """TestClient приложения на сессии db от имени customer."""
+    from fastapi.testclient import TestClient
+
+    from app.core.deps import get_current_user, get_db
+    from app.main import app
+
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: customer
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from app.core.bloom import BloomFilter
+
+
+def test_no_false_negatives():
+    bloom = BloomFilter(capacity=5000, error_rate=0.01)
+    keys = [f"sha-{i:08x}" for i in range(5000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    assert not bloom.is_full
+
+
+def test_false_positive_rate_near_target():
+    bloom = BloomFilter(capacity=5000, error_rate=0.01)
+    for i in range(5000):
+        bloom.add(f"in-{i}")
+    hits = sum(f"out-{i}" in bloom for i in range(20000))
+    # ожидание ~1%; запас на разброс
+    assert hits / 20000 < 0.03
+
+
+def test_is_full_after_capacity():
+    bloom = BloomFilter(capacity=3)
+    for key in "abcd":
+        bloom.add(key)
+    assert bloom.is_full
+    assert all(key in bloom for key in "abcd")
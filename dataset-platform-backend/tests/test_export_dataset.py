@@ -0,0 +1,71 @@
+import io
+
+import pyarrow as pa
+import pytest
+
+from app.worker.export_dataset import DatasetWriter, write_dataset
+from app.worker.export_engine import EXPORT_SCHEMA
+
+
+class _Upload(io.BytesIO):
+    def __init__(self, s3, key):
+        super().__init__()
+        self.s3, self.key = s3, key
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return super().write(data)
+
+    def close(self):
+        # ParquetWriter закрывает PythonFile сам, writer — ещё раз
+        if not self.closed:
+            self.s3.objects[self.key] = self.getvalue()
+        super().close()
+
+    def abort(self):
+        super().close()
+
+
+class _S3:
+    def __init__(self, fail_key=None):
+        self.objects = {}
+        self.fail_key = fail_key
+
+    def open_multipart(self, *, bucket, key, content_type, part_size):
+        return _Upload(self, key)
+
+    def put_bytes(self, *, bucket, key, data, content_type):
+        self.objects[key] = data
+        if key == self.fail_key:
+            raise RuntimeError("put failed")
+
+    def delete_objects(self, *, bucket, keys):
+        for k in keys:
+            self.objects.pop(k, None)
+
+
+def _batch(labels):
+    rows = [
+        {"request_id": 1, "image_id": i, "sha256": f"{i:064x}", "labels": lab}
+        for i, lab in enumerate(labels, 1)
+    ]
+    return pa.RecordBatch.from_pylist(rows, schema=EXPORT_SCHEMA)
+
+
+def test_rows_count_images_not_label_copies():
+    s3 = _S3()
+    writer = DatasetWriter(s3, "b", "p/", "label")
+    rows = write_dataset(iter([_batch([["cat", "dog"], ["cat"], []])]), writer)
+    assert rows == 3
+    assert sum(f["rows"] for f in writer.files) == 4
+    assert {"p/_metadata", "p/_common_metadata"} <= set(s3.objects)
+
+
+@pytest.mark.parametrize("fail_key", ["p/_common_metadata", "p/_metadata"])
+def test_abort_removes_metadata(fail_key):
+    s3 = _S3(fail_key)
+    writer = DatasetWriter(s3, "b", "p/", "label")
+    with pytest.raises(RuntimeError, match="put failed"):
+        write_dataset(iter([_batch([["cat"], ["dog"]])]), writer)
+    assert s3.objects == {}
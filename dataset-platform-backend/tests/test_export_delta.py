@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from app.worker.export_delta import iter_compacted_batches
+from app.worker.export_engine import EXPORT_SCHEMA
+
+
+class _Body:
+    def __init__(self, data: bytes) -> None:
+        self._buf = io.BytesIO(data)
+
+    def iter_chunks(self, chunk_size: int):
+        while chunk := self._buf.read(chunk_size):
+            yield chunk
+
+    def close(self) -> None:
+        pass
+
+
+class _FakeS3:
+    def __init__(self) -> None:
+        self.objects: dict[str, bytes] = {}
+
+    def put_rows(self, key: str, rows: list[dict], row_group_size: int = 2) -> str:
+        buf = io.BytesIO()
+        table = pa.Table.from_pylist(rows, schema=EXPORT_SCHEMA)
+        pq.write_table(table, buf, row_group_size=row_group_size)
+        self.objects[key] = buf.getvalue()
+        return f"s3://exports/{key}"
+
+    def get_stream(self, *, bucket: str, key: str):
+        data = self.objects[key]
+        return _Body(data), len(data)
+
+
+def _row(image_id: int, tag: str) -> dict:
+    return {"request_id": 1, "image_id": image_id, "file_name": tag}
+
+
+def _chain(s3: _FakeS3, files: list[list[dict]]):
+    return [
+        type("Ex", (), {"storage_path": s3.put_rows(f"e{i}.parquet", rows)})()
+        for i, rows in enumerate(files)
+    ]
+
+
+def _compact(s3, chain, batch_rows=2):
+    batches = list(iter_compacted_batches(s3, chain, batch_rows=batch_rows))
+    for batch in batches:
+        assert batch.schema == EXPORT_SCHEMA
+    rows = pa.Table.from_batches(batches, EXPORT_SCHEMA).to_pylist()
+    return [(r["image_id"], r["file_name"]) for r in rows]
+
+
+@pytest.mark.parametrize("batch_rows", [1, 2, 3, 100])
+def test_last_file_wins_and_order_is_by_image_id(batch_rows):
+    s3 = _FakeS3()
+    chain = _chain(
+        s3,
+        [
+            [_row(i, "base") for i in (1, 2, 4, 5, 7)],
+            # новые image_id внутри, до и после диапазона base + замены
+            [_row(2, "d1"), _row(3, "d1"), _row(9, "d1")],
+            [_row(0, "d2"), _row(3, "d2"), _row(7, "d2")],
+        ],
+    )
+    assert _compact(s3, chain, batch_rows) == [
+        (0, "d2"),
+        (1, "base"),
+        (2, "d1"),
+        (3, "d2"),
+        (4, "base"),
+        (5, "base"),
+        (7, "d2"),
+        (9, "d1"),
+    ]
+
+
+def test_base_only_chain_is_copied():
+    s3 = _FakeS3()
+    chain = _chain(s3, [[_row(i, "base") for i in (1, 2, 3)]])
+    assert _compact(s3, chain) == [(1, "base"), (2, "base"), (3, "base")]
+
+
+def test_empty_base_yields_deltas():
+    s3 = _FakeS3()
+    chain = _chain(s3, [[], [_row(5, "d1"), _row(4, "d1")]])
+    assert _compact(s3, chain) == [(4, "d1"), (5, "d1")]
@@ -0,0 +1,69 @@
+import pytest
+
+from app.models.export import Export
+from app.routers import export as export_router
+
+
+class _S3:
+    def presign_get(self, bucket, key):
+        return f"https://s3/{bucket}/{key}"
+
+
+@pytest.fixture
+def client(api, monkeypatch):
+    monkeypatch.setattr(export_router, "get_s3_client", lambda: _S3())
+    return api
+
+
+def _export(db, req, status="done", layout="file", **kw) -> Export:
+    ex = Export(
+        request_id=req.id,
+        status=status,
+        layout=layout,
+        storage_path=f"s3://exports/{req.id}/{layout}-{status}"
+        + ("/" if layout != "file" else ".parquet"),
+        **kw,
+    )
+    db.add(ex)
+    db.flush()
+    return ex
+
+
+def _download(client, req, **params):
+    return client.get(
+        f"/requests/{req.id}/export/download", params=params, follow_redirects=False
+    )
+
+
+def test_default_skips_newer_dataset_and_failed_exports(client, db, make_request):
+    req = make_request()
+    _export(db, req)
+    _export(db, req, layout="dataset")
+    _export(db, req, status="failed")
+    _export(db, req, status="cancelled")
+    resp = _download(client, req)
+    assert resp.status_code == 307
+    assert resp.headers["location"] == f"https://s3/exports/{req.id}/file-done.parquet"
+
+
+def test_default_manifest_takes_latest_done_of_any_layout(client, db, make_request):
+    req = make_request()
+    _export(db, req)
+    dataset = _export(db, req, layout="dataset", files=[])
+    _export(db, req, status="failed")
+    body = _download(client, req, view="manifest").json()
+    assert body["export_id"] == dataset.id
+
+
+def test_explicit_export_id_still_reports_its_status(client, db, make_request):
+    req = make_request()
+    _export(db, req)
+    failed = _export(db, req, status="failed")
+    resp = _download(client, req, export_id=failed.id)
+    assert resp.status_code == 409
+
+
+def test_no_done_export(client, db, make_request):
+    req = make_request()
+    _export(db, req, status="running")
+    assert _download(client, req).status_code == 404
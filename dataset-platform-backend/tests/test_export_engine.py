@@ -0,0 +1,42 @@
+import pyarrow as pa
+import pytest
+
+from app.worker import export_engine
+from app.worker.export_engine import EXPORT_SCHEMA, ParquetOptions
+
+
+def test_defaults_come_from_settings():
+    options = ParquetOptions.from_params({})
+    assert options.codec == export_engine.settings.export_parquet_codec
+    assert options.row_group_rows == export_engine.settings.export_batch_rows
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"codec": "brotli9"},
+        {"codec": "snappy", "compression_level": 3},
+        {"codec": "zstd", "compression_level": 99},
+        {"row_group_rows": 0},
+    ],
+)
+def test_invalid_options(params):
+    with pytest.raises(ValueError):
+        ParquetOptions.from_params(params)
+
+
+def test_bloom_filter_rejected_without_pyarrow_support(monkeypatch):
+    monkeypatch.setattr(export_engine, "PARQUET_BLOOM_FILTERS", False)
+    with pytest.raises(ValueError, match="bloom_filter is not supported"):
+        ParquetOptions.from_params({"bloom_filter": True})
+    assert not ParquetOptions.from_params({"bloom_filter": False}).bloom_filter
+
+
+@pytest.mark.skipif(
+    not export_engine.PARQUET_BLOOM_FILTERS, reason="pyarrow without bloom filters"
+)
+def test_bloom_filter_writer_kwargs_accepted():
+    kwargs = ParquetOptions.from_params({"bloom_filter": True}).writer_kwargs()
+    sink = pa.BufferOutputStream()
+    with export_engine.pq.ParquetWriter(sink, EXPORT_SCHEMA, **kwargs) as writer:
+        writer.write_table(EXPORT_SCHEMA.empty_table())
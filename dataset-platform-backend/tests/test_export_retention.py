@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from app.worker.export_retention import plan_expired
+
+NOW = datetime(2026, 1, 10, tzinfo=timezone.utc)
+
+
+def _ex(ex_id, kind="full", base=None, digest=None, age_h=48):
+    return SimpleNamespace(
+        id=ex_id,
+        kind=kind,
+        base_export_id=base,
+        input_digest=digest if digest is not None else f"d{ex_id}",
+        created_at=NOW - timedelta(hours=age_h),
+    )
+
+
+def _expired_ids(exports, **kw):
+    kw.setdefault("min_age_s", 3600)
+    return [ex.id for ex in plan_expired(exports, now=NOW, **kw)]
+
+
+def test_keeps_newest_and_expires_rest_newest_first():
+    exports = [_ex(i) for i in range(1, 6)]
+    assert _expired_ids(exports, keep_last=2) == [3, 2, 1]
+
+
+def test_duplicate_digest_expires_older_copy():
+    exports = [_ex(1, digest="same"), _ex(2, digest="other"), _ex(3, digest="same")]
+    assert _expired_ids(exports, keep_last=5) == [1]
+
+
+def test_young_exports_are_kept():
+    exports = [_ex(1), _ex(2, age_h=0), _ex(3)]
+    assert _expired_ids(exports, keep_last=1) == [1]
+
+
+def test_kept_delta_pins_its_whole_chain():
+    exports = [
+        _ex(1),
+        _ex(2, kind="delta", base=1),
+        _ex(3, kind="delta", base=2),
+        _ex(4),
+        _ex(5, kind="delta", base=4),
+    ]
+    # keep_last=1 держит только 5, но с ним — base 4; 3 -> 2 -> 1 не нужны
+    assert _expired_ids(exports, keep_last=1) == [3, 2, 1]
+
+
+def test_pinned_delta_keeps_base_and_previous_deltas():
+    exports = [
+        _ex(1),
+        _ex(2, kind="delta", base=1),
+        _ex(3, kind="delta", base=2),
+        _ex(4),
+    ]
+    # 3 — base активного export (pinned): цепочка 3 -> 2 -> 1 остаётся
+    assert _expired_ids(exports, keep_last=1, pinned={3}) == []
+
+
+def test_pinned_unknown_id_is_ignored():
+    exports = [_ex(1), _ex(2)]
+    assert _expired_ids(exports, keep_last=1, pinned={99}) == [1]
+
+
+def test_keep_last_zero_keeps_all_distinct():
+    exports = [_ex(1), _ex(2), _ex(3, digest="d2")]
+    assert _expired_ids(exports, keep_last=0) == [2]
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import pytest
+
+from app.worker.export_split import (
+    SplitOptions,
+    hash_fraction,
+    hash_split,
+    normalize_ratios,
+    parse_ratios,
+    pick_split,
+    split_key,
+)
+
+RATIOS = {"train": 0.8, "val": 0.1, "test": 0.1}
+
+
+def test_normalize_keeps_order_drops_zero_and_sums_to_one():
+    ratios = normalize_ratios({"b": 2, "zero": 0, "a": 6})
+    assert list(ratios) == ["b", "a"]
+    assert ratios == pytest.approx({"b": 0.25, "a": 0.75})
+
+
+@pytest.mark.parametrize("bad", [{"a": -1, "b": 2}, {"a": 0.0, "b": 0.0}])
+def test_normalize_rejects_invalid(bad):
+    with pytest.raises(ValueError):
+        normalize_ratios(bad)
+
+
+def test_normalize_defaults_to_settings():
+    assert sum(normalize_ratios(None).values()) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize(
+    ("fraction", "expected"),
+    [(0.0, "train"), (0.79, "train"), (0.8, "val"), (0.89, "val"), (0.95, "test")],
+)
+def test_pick_split_boundaries(fraction, expected):
+    assert pick_split(fraction, RATIOS) == expected
+
+
+def test_pick_split_fraction_near_one_falls_into_last():
+    assert pick_split(0.9999999999999999, RATIOS) == "test"
+
+
+def test_hash_fraction_is_deterministic_and_seeded():
+    assert hash_fraction("abc") == hash_fraction("abc")
+    assert 0 <= hash_fraction("abc") < 1
+    assert hash_fraction("abc", "s1") != hash_fraction("abc", "s2")
+
+
+def test_hash_split_proportions():
+    ratios = normalize_ratios(RATIOS)
+    counts: dict[str, int] = {}
+    for i in range(20000):
+        name = hash_split(split_key(i, None), ratios)
+        counts[name] = counts.get(name, 0) + 1
+    assert counts["train"] / 20000 == pytest.approx(0.8, abs=0.02)
+    assert counts["val"] / 20000 == pytest.approx(0.1, abs=0.02)
+
+
+def test_split_key_prefers_sha256():
+    assert split_key(5, "ff") == "ff"
+    assert split_key(5, None) == "id:5"
+
+
+def test_parse_ratios():
+    assert parse_ratios("train=8, val=1,test=1") == pytest.approx(RATIOS)
+    with pytest.raises(ValueError):
+        parse_ratios("train:1")
+
+
+def test_split_options_from_params():
+    assert SplitOptions.from_params({}) is None
+    assert SplitOptions.from_params({"partition_by": "split"}).ratios
+    sampled = SplitOptions.from_params({"sample_fraction": 0.5})
+    assert sampled.ratios is None and sampled.sample_fraction == 0.5
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"stratify": True},
+        {"split": True, "split_key": "x"},
+        {"max_per_class": 0},
+        {"sample_fraction": 1.5},
+    ],
+)
+def test_split_options_rejects_invalid(params):
+    with pytest.raises(ValueError):
+        SplitOptions.from_params(params)
@@ -0,0 +1,150 @@
+"""split_assignment / _hash_fraction_sql в Postgres против Python-версии."""
+
+from collections import Counter
+
+import pytest
+from sqlalchemy import String, literal, select
+
+from app.models.annotation import Annotation
+from app.models.image import Image
+from app.models.qc import QCResult, QCRun
+from app.models.task import Task
+from app.worker.export_query import latest_annotations
+from app.worker.export_split import (
+    SplitOptions,
+    _hash_fraction_sql,
+    hash_fraction,
+    hash_split,
+    normalize_ratios,
+    split_assignment,
+)
+
+RATIOS = normalize_ratios({"train": 0.8, "val": 0.1, "test": 0.1})
+
+
+@pytest.mark.parametrize("seed", ["", "s1", "экспорт"])
+def test_sql_hash_fraction_matches_python(db, seed):
+    keys = ["", "a", "id:42", "0" * 64, "f" * 64, *(f"key-{i}" for i in range(50))]
+    for key in keys:
+        value = db.execute(select(_hash_fraction_sql(literal(key, String), seed)))
+        assert float(value.scalar()) == pytest.approx(
+            hash_fraction(key, seed), abs=1e-15
+        )
+
+
+def _images(db, req) -> list[Image]:
+    return list(
+        db.execute(
+            select(Image).where(Image.request_id == req.id).order_by(Image.id)
+        ).scalars()
+    )
+
+
+def _qc(db, req, dup_of: dict[int, int]) -> int:
+    """QC run, где image -> duplicate_of_image_id по dup_of."""
+    run = QCRun(request_id=req.id, status="done")
+    db.add(run)
+    db.flush()
+    for img in _images(db, req):
+        db.add(
+            QCResult(
+                qc_run_id=run.id,
+                request_id=req.id,
+                image_id=img.id,
+                duplicate_of_image_id=dup_of.get(img.id),
+            )
+        )
+    db.flush()
+    return run.id
+
+
+def _label(db, req, customer, labels: dict[int, list[str]]) -> None:
+    task = Task(request_id=req.id, assigned_to=customer.id)
+    db.add(task)
+    db.flush()
+    for image_id, value in labels.items():
+        db.add(
+            Annotation(
+                task_id=task.id,
+                image_id=image_id,
+                labeler_id=customer.id,
+                labels=value,
+            )
+        )
+    db.flush()
+
+
+def _assign(db, req, qc_run_id, options) -> dict[int, str | None]:
+    sub = split_assignment(req.id, qc_run_id, options, latest_annotations(req.id))
+    return dict(db.execute(select(sub.c.image_id, sub.c.split)).all())
+
+
+def test_plain_split_matches_python(db, make_request):
+    req = make_request(40)
+    qc_run_id = _qc(db, req, {})
+    options = SplitOptions(ratios=RATIOS, seed="s")
+    got = _assign(db, req, qc_run_id, options)
+    assert got == {
+        img.id: hash_split(img.sha256, RATIOS, "s") for img in _images(db, req)
+    }
+
+
+def test_duplicate_chain_shares_root_split(db, make_request):
+    req = make_request(30)
+    imgs = _images(db, req)
+    a, b, c, d = imgs[3], imgs[10], imgs[17], imgs[25]
+    # цепочка near-дублей b -> a, c -> b, d -> c: все в группе a
+    qc_run_id = _qc(db, req, {b.id: a.id, c.id: b.id, d.id: c.id})
+    for seed in (f"seed-{i}" for i in range(10)):
+        got = _assign(db, req, qc_run_id, SplitOptions(ratios=RATIOS, seed=seed))
+        assert len(got) == len(imgs)
+        root = hash_split(a.sha256, RATIOS, seed)
+        assert {got[x.id] for x in (a, b, c, d)} == {root}
+
+
+def test_duplicate_of_other_request_is_own_root(db, make_request):
+    other = _images(db, make_request(1))[0]
+    req = make_request(5)
+    img = _images(db, req)[2]
+    qc_run_id = _qc(db, req, {img.id: other.id})
+    got = _assign(db, req, qc_run_id, SplitOptions(ratios=RATIOS, seed="x"))
+    assert got[img.id] == hash_split(img.sha256, RATIOS, "x")
+
+
+def test_stratify_exact_shares_per_class(db, make_request, customer):
+    req = make_request(40)
+    imgs = _images(db, req)
+    _label(
+        db,
+        req,
+        customer,
+        {img.id: (["cat"] if i < 20 else ["dog", "cat"]) for i, img in enumerate(imgs)},
+    )
+    options = SplitOptions(ratios=RATIOS, stratify=True)
+    got = _assign(db, req, _qc(db, req, {}), options)
+    for part in (imgs[:20], imgs[20:]):
+        assert Counter(got[img.id] for img in part) == {
+            "train": 16,
+            "val": 2,
+            "test": 2,
+        }
+
+
+def test_max_per_class_and_sample_fraction(db, make_request, customer):
+    req = make_request(30)
+    imgs = _images(db, req)
+    # {} (default annotation) — свой класс "", а не ошибка json_array_elements_text
+    _label(
+        db,
+        req,
+        customer,
+        {img.id: (["a"] if i % 3 else {}) for i, img in enumerate(imgs)},
+    )
+    qc_run_id = _qc(db, req, {})
+    capped = _assign(db, req, qc_run_id, SplitOptions(ratios=None, max_per_class=4))
+    assert len(capped) == 8
+    assert set(capped.values()) == {None}
+
+    half = _assign(db, req, qc_run_id, SplitOptions(ratios=None, sample_fraction=0.5))
+    expected = {img.id for img in imgs if hash_fraction(img.sha256, ":sample") < 0.5}
+    assert set(half) == expected
@@ -0,0 +1,53 @@
+import pyarrow as pa
+import pytest
+
+from app.worker.export_wds import sample_key, write_shards
+
+
+class _Writer:
+    def __init__(self):
+        self.added = []
+        self.closed = self.aborted = False
+
+    @property
+    def samples(self):
+        return len(self.added)
+
+    def add(self, row, data):
+        self.added.append((row["image_id"], data))
+
+    def close(self):
+        self.closed = True
+
+    def abort(self):
+        self.aborted = True
+
+
+def _batches(paths):
+    rows = [{"image_id": i, "storage_path": str(p)} for i, p in enumerate(paths, 1)]
+    return iter([pa.RecordBatch.from_pylist(rows)])
+
+
+def test_samples_in_row_order(tmp_path):
+    paths = []
+    for i in range(5):
+        paths.append(tmp_path / f"{i}.jpg")
+        paths[-1].write_bytes(bytes([i]) * (i + 1))
+    writer = _Writer()
+    assert write_shards(_batches(paths), writer) == 5
+    assert writer.closed and not writer.aborted
+    assert writer.added == [(i + 1, bytes([i]) * (i + 1)) for i in range(5)]
+
+
+def test_missing_image_names_image_id(tmp_path):
+    paths = [tmp_path / "a.jpg", tmp_path / "missing.jpg", tmp_path / "c.jpg"]
+    paths[0].write_bytes(b"a")
+    paths[2].write_bytes(b"c")
+    writer = _Writer()
+    with pytest.raises(RuntimeError, match="image_id=2: cannot read .*missing.jpg"):
+        write_shards(_batches(paths), writer)
+    assert writer.aborted and not writer.closed
+
+
+def test_sample_key_sorts_like_image_id():
+    assert sample_key(9) < sample_key(10) < sample_key(123456)
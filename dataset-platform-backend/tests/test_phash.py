@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from app.worker.phash import HammingIndex, hamming, similarity
+
+
+def _flip(h: int, bits: int, rnd: random.Random) -> int:
+    for b in rnd.sample(range(64), bits):
+        h ^= 1 << b
+    return h
+
+
+def _brute_nearest(items: list[tuple[int, int]], h: int, max_distance: int):
+    best = None
+    for other, item_id in items:
+        d = hamming(h, other)
+        if d <= max_distance and (best is None or (d, item_id) < best):
+            best = (d, item_id)
+    return best
+
+
+@pytest.mark.parametrize("max_distance", [0, 3, 6, 10])
+def test_nearest_matches_brute_force(max_distance):
+    rnd = random.Random(max_distance)
+    items = []
+    for i in range(400):
+        if items and rnd.random() < 0.5:
+            # близкий к уже добавленному: кандидаты на границе радиуса
+            base = rnd.choice(items)[0]
+            h = _flip(base, rnd.randint(0, max_distance + 2), rnd)
+        else:
+            h = rnd.getrandbits(64)
+        items.append((h, i))
+    index = HammingIndex()
+    for h, i in items:
+        index.add(h, i)
+    assert len(index) == len(items)
+
+    queries = [_flip(rnd.choice(items)[0], rnd.randint(0, 12), rnd) for _ in range(300)]
+    queries += [rnd.getrandbits(64) for _ in range(50)]
+    for q in queries:
+        assert index.nearest(q, max_distance) == _brute_nearest(items, q, max_distance)
+
+
+def test_tie_prefers_earlier_item():
+    index = HammingIndex()
+    index.add(0b11, 7)
+    index.add(0b11, 3)
+    index.add(0b10, 1)
+    assert index.nearest(0b11, 4) == (0, 3)
+
+
+def test_empty_index_and_out_of_radius():
+    index = HammingIndex()
+    assert index.nearest(123, 8) is None
+    index.add(0, 1)
+    assert index.nearest((1 << 20) - 1, 8) is None
+
+
+def test_bands_must_divide_bits():
+    with pytest.raises(ValueError):
+        HammingIndex(bands=5)
+
+
+def test_similarity():
+    assert similarity(0) == 1.0
+    assert similarity(64) == 0.0
@@ -0,0 +1,56 @@
+import pytest
+
+from app.models.qc import QCRun
+from app.worker.detectors import DETECTORS
+from app.worker.jobs import _find_base_run
+from app.worker.qc_fingerprint import config_digest
+
+
+def _run(db, req, params: dict, status: str = "done", ai_version=None) -> QCRun:
+    run = QCRun(
+        request_id=req.id,
+        status=status,
+        params={**params, "ai_version": ai_version},
+        config_digest=config_digest(params),
+    )
+    db.add(run)
+    db.flush()
+    return run
+
+
+def test_same_config_shares_base(db, make_request):
+    req = make_request()
+    base = _run(db, req, {"detectors": ["blur"]})
+    run = _run(db, req, {"detectors": ["blur"]}, status="running")
+    assert _find_base_run(db, run, None) == base
+
+
+def test_cross_request_flag_splits_base(db, make_request):
+    req = make_request()
+    _run(db, req, {"cross_request": True})
+    run = _run(db, req, {"cross_request": False}, status="running")
+    assert _find_base_run(db, run, None) is None
+
+
+def test_detector_version_bump_splits_base(db, make_request, monkeypatch):
+    req = make_request()
+    _run(db, req, {"detectors": ["blur"]})
+    monkeypatch.setattr(DETECTORS["blur"], "version", DETECTORS["blur"].version + 1)
+    run = _run(db, req, {"detectors": ["blur"]}, status="running")
+    assert _find_base_run(db, run, None) is None
+
+
+@pytest.mark.parametrize("base_version", ["onnx:m.onnx:aaa", None])
+def test_model_swap_splits_base(db, make_request, base_version):
+    req = make_request()
+    _run(db, req, {"ai_scorer": "onnx"}, ai_version=base_version)
+    run = _run(db, req, {"ai_scorer": "onnx"}, status="running")
+    assert _find_base_run(db, run, "onnx:m.onnx:bbb") is None
+
+
+def test_only_latest_done_run_is_a_base(db, make_request):
+    req = make_request()
+    _run(db, req, {"detectors": ["blur"]})
+    _run(db, req, {"detectors": ["exposure"]})
+    run = _run(db, req, {"detectors": ["blur"]}, status="running")
+    assert _find_base_run(db, run, None) is None
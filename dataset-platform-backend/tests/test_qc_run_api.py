@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.models.qc import QCRun
+from app.routers import qc as qc_router
+from app.worker.qc_fingerprint import config_digest, image_set_fingerprint
+
+
+@pytest.fixture
+def client(api, monkeypatch):
+    monkeypatch.setattr(
+        qc_router.celery_app,
+        "send_task",
+        lambda name, **kw: SimpleNamespace(id=f"task-{kw['args'][0]}"),
+    )
+    return api
+
+
+def _run(db, req, status: str) -> QCRun:
+    run = QCRun(request_id=req.id, status=status, params={})
+    run.config_digest = config_digest({})
+    image_set_fingerprint(db, req.id).apply(run)
+    db.add(run)
+    db.flush()
+    return run
+
+
+def test_unchanged_inputs_skip_to_done_run(client, db, make_request):
+    req = make_request()
+    done = _run(db, req, "done")
+    body = client.post(f"/requests/{req.id}/qc/run").json()
+    assert body["skipped"] is True
+    assert body["qc_run_id"] == done.id
+
+
+@pytest.mark.parametrize("status", ["failed", "cancelled"])
+def test_no_skip_past_newer_failed_run(client, db, make_request, status):
+    req = make_request()
+    done = _run(db, req, "done")
+    _run(db, req, status)
+    body = client.post(f"/requests/{req.id}/qc/run").json()
+    assert "skipped" not in body
+    assert body["qc_run_id"] > done.id
+    assert body["status"] == "queued"
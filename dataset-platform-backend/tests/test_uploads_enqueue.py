@@ -0,0 +1,41 @@
+import pytest
+
+from app.routers import uploads
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.keys = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = ex
+        return True
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    calls = []
+    fake = _FakeRedis()
+    monkeypatch.setattr(uploads, "_redis", lambda: fake)
+    monkeypatch.setattr(
+        uploads.celery_app, "send_task", lambda name, **kw: calls.append(kw["args"])
+    )
+    return calls
+
+
+def test_one_task_per_request_within_countdown(sent):
+    for _ in range(5):
+        uploads._enqueue_metadata(1)
+    uploads._enqueue_metadata(2)
+    assert sent == [[1], [2]]
+
+
+def test_broker_error_is_logged_not_raised(monkeypatch, caplog):
+    def boom():
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(uploads, "_redis", boom)
+    uploads._enqueue_metadata(1)
+    assert "images.extract_metadata" in caplog.text
@@ -184,17 +184,39 @@ class ApiClient:
             )
 
     # ---------- QC ----------
-    def run_qc(self, request_id: str) -> dict[str, Any]:
-        return self._request("POST", f"/requests/{request_id}/qc/run")
+    def run_qc(
+        self, request_id: str, incremental: bool = False, force: bool = False
+    ) -> dict[str, Any]:
+        params = {}
+        if incremental:
+            params["incremental"] = "true"
+        if force:
+            params["force"] = "true"
+        return self._request("POST", f"/requests/{request_id}/qc/run", params=params or None)
+
+    def cancel_qc(self, request_id: str, qc_run_id: int | None = None) -> dict[str, Any]:
+        params = {"qc_run_id": qc_run_id} if qc_run_id is not None else None
+        return self._request("POST", f"/requests/{request_id}/qc/cancel", params=params)
 
     def qc_status(self, request_id: str) -> dict[str, Any]:
         data = self._request("GET", f"/requests/{request_id}/qc/status")
         return data if isinstance(data, dict) else {}
 
-    def qc_results(self, request_id: str) -> list[dict[str, Any]]:
-        data = self._request("GET", f"/requests/{request_id}/qc/results")
+    def qc_results(self, request_id: str, **params: Any) -> list[dict[str, Any]]:
+        """Фильтры/сортировка/limit считаются на бэкенде (dup_thr, only_flagged, sort, ...)."""
+        params = {k: v for k, v in params.items() if v is not None}
+        data = self._request("GET", f"/requests/{request_id}/qc/results", params=params or None)
         return data if isinstance(data, list) else []
 
+    def qc_summary(
+        self, request_id: str, dup_thr: float | None = None, ai_thr: float | None = None
+    ) -> dict[str, Any]:
+        params = {k: v for k, v in {"dup_thr": dup_thr, "ai_thr": ai_thr}.items() if v is not None}
+        data = self._request(
+            "GET", f"/requests/{request_id}/qc/results/summary", params=params or None
+        )
+        return data if isinstance(data, dict) else {}
+
     # ---------- Labeler: tasks ----------
     def list_tasks(self) -> list[dict[str, Any]]:
         data = self._request("GET", "/tasks")
@@ -268,13 +290,36 @@ class ApiClient:
         )
         # ---------- Export ----------
 
-    def export_build_parquet(self, request_id: str) -> dict[str, Any]:
-        return self._request("POST", f"/requests/{request_id}/export/parquet")
+    def export_build_parquet(
+        self, request_id: str, mode: str = "full", **options: Any
+    ) -> dict[str, Any]:
+        """
+        mode: full | delta (только изменения с последнего done export).
+        options: layout=dataset|webdataset, partition_by, target_file_mb, shard_mb,
+        split, split_ratios ("train=0.8,val=0.1,test=0.1"), split_key, split_seed,
+        stratify, max_per_class, sample_fraction, codec, compression_level,
+        row_group_rows, dictionary, statistics, bloom_filter,
+        force (собрать, даже если есть done export с тем же входом).
+        """
+        params = {"mode": mode, **{k: v for k, v in options.items() if v is not None}}
+        return self._request("POST", f"/requests/{request_id}/export/parquet", params=params)
+
+    def export_compact(self, request_id: str) -> dict[str, Any]:
+        return self._request("POST", f"/requests/{request_id}/export/compact")
+
+    def export_manifest(self, request_id: str) -> dict[str, Any]:
+        data = self._request(
+            "GET", f"/requests/{request_id}/export/download", params={"view": "manifest"}
+        )
+        return data if isinstance(data, dict) else {}
 
     def export_status(self, request_id: str) -> dict[str, Any]:
         data = self._request("GET", f"/requests/{request_id}/export/status")
         return data if isinstance(data, dict) else {}
 
+    def export_cancel(self, request_id: str) -> dict[str, Any]:
+        return self._request("POST", f"/requests/{request_id}/export/cancel")
+
     def export_download_parquet(self, request_id: str) -> bytes:
         url = self._url(f"/requests/{request_id}/export/download")
         timeout = httpx.Timeout(self.timeout_s, connect=10.0)
@@ -294,3 +339,24 @@ class ApiClient:
             raise ApiError(status_code=resp.status_code, message=msg)
 
         return resp.content
+
+    def export_stream_parquet(self, request_id: str) -> bytes:
+        """
+        Текущие строки экспорта сразу из API (GET /export/stream), без сборки в S3.
+        Только для небольших заявок: больше лимита сервера — ApiError 413.
+        """
+        url = self._url(f"/requests/{request_id}/export/stream")
+        # read timeout — на каждый кусок ответа, не на весь поток
+        timeout = httpx.Timeout(self.timeout_s, connect=10.0)
+
+        try:
+            with httpx.Client(timeout=timeout) as client:
+                with client.stream(
+                    "GET", url, headers=self._headers(), params={"format": "parquet"}
+                ) as resp:
+                    if not (200 <= resp.status_code < 300):
+                        resp.read()
+                        self._raise_for_status(resp)
+                    return b"".join(resp.iter_bytes())
+        except httpx.RequestError as e:
+            raise ApiError(status_code=0, message=f"Network error: {e!s}") from e
@@ -96,21 +96,64 @@ def mock_list_requests() -> list[dict[str, Any]]:
 
 
 # ---------- QC ----------
-def mock_qc_results(request_id: str) -> list[dict[str, Any]]:
+def _mock_qc_rows(request_id: str) -> list[dict[str, Any]]:
     _ensure_seed_data()
+    # свой seed на заявку: results и summary видят одни и те же строки
+    rnd = random.Random(str(request_id))
     rows: list[dict[str, Any]] = []
     for i in range(1, 26):
         rows.append(
             {
                 "request_id": request_id,
                 "image_id": f"{request_id}_img_{i:03d}",
-                "duplicate_score": round(_random.random(), 4),
-                "ai_generated_score": round(_random.random(), 4),
+                "duplicate_score": round(rnd.random(), 4),
+                "ai_generated_score": round(rnd.random(), 4),
             }
         )
     return rows
 
 
+def mock_qc_results(
+    request_id: str,
+    dup_thr: float = 0.85,
+    ai_thr: float = 0.8,
+    only_flagged: bool = False,
+    only_duplicates: bool = False,
+    only_ai: bool = False,
+    sort: str = "image_id",
+    order: str = "asc",
+    limit: int | None = None,
+    **_: Any,
+) -> list[dict[str, Any]]:
+    """Те же фильтры, что у GET /qc/results (считаются на бэкенде)."""
+    rows = _mock_qc_rows(request_id)
+    if only_flagged:
+        rows = [
+            r for r in rows if r["duplicate_score"] >= dup_thr or r["ai_generated_score"] >= ai_thr
+        ]
+    if only_duplicates:
+        rows = [r for r in rows if r["duplicate_score"] >= dup_thr]
+    if only_ai:
+        rows = [r for r in rows if r["ai_generated_score"] >= ai_thr]
+    if sort in ("duplicate_score", "ai_generated_score", "image_id"):
+        rows.sort(key=lambda r: r[sort], reverse=order == "desc")
+    return rows[:limit] if limit else rows
+
+
+def mock_qc_summary(request_id: str, dup_thr: float = 0.85, ai_thr: float = 0.8) -> dict[str, Any]:
+    rows = _mock_qc_rows(request_id)
+    dup = [r["duplicate_score"] >= dup_thr for r in rows]
+    ai = [r["ai_generated_score"] >= ai_thr for r in rows]
+    return {
+        "request_id": request_id,
+        "total": len(rows),
+        "flagged": sum(d or a for d, a in zip(dup, ai, strict=True)),
+        "duplicates": sum(dup),
+        "ai_generated": sum(ai),
+        "flags": {},
+    }
+
+
 # ---------- Tasks ----------
 def mock_list_tasks() -> list[dict[str, Any]]:
     _ensure_seed_data()
@@ -66,10 +66,49 @@ def fetch_status() -> dict:
     return client().qc_status(request_id)
 
 
+def results_params() -> dict:
+    """Пороги/фильтры/сортировка/top N -> query params /qc/results (считает бэкенд)."""
+    return {
+        "dup_thr": dup_thr,
+        "ai_thr": ai_thr,
+        "only_flagged": only_flagged,
+        "only_duplicates": only_duplicates,
+        "only_ai": only_ai,
+        "sort": sort_by,
+        "order": "desc" if sort_desc else "asc",
+        "limit": int(top_n) if top_n else None,
+    }
+
+
 def fetch_results() -> list[dict]:
     if settings.use_mock:
-        return mock_backend.mock_qc_results(request_id)
-    return client().qc_results(request_id)
+        return mock_backend.mock_qc_results(request_id, **results_params())
+    return client().qc_results(request_id, **results_params())
+
+
+def fetch_summary() -> dict:
+    if settings.use_mock:
+        return mock_backend.mock_qc_summary(request_id, dup_thr=dup_thr, ai_thr=ai_thr)
+    return client().qc_summary(request_id, dup_thr=dup_thr, ai_thr=ai_thr)
+
+
+def render_progress(st_data: dict) -> None:
+    """Прогресс-бар + phase/скорость/ETA из /qc/status (если бэкенд их отдаёт)."""
+    progress = st_data.get("progress")
+    if progress is None or st_data.get("status") not in ("queued", "running"):
+        return
+    done = st_data.get("processed_images", 0)
+    total = st_data.get("total_images", 0)
+    st.progress(min(max(float(progress), 0.0), 1.0), text=f"{done}/{total} images")
+
+    parts = [f"phase: {st_data.get('phase') or '-'}"]
+    if st_data.get("images_per_s"):
+        parts.append(f"{st_data['images_per_s']:.1f} img/s")
+    eta = st_data.get("eta_s")
+    if eta is not None:
+        m, sec = divmod(int(eta), 60)
+        parts.append(f"ETA {m}m {sec:02d}s" if m else f"ETA {sec}s")
+    st.caption(" · ".join(parts))
 
 
 status = {}
@@ -80,6 +119,7 @@ st.subheader("QC Status")
 if not request_id:
     st.info("Введите Request ID или выберите Request в Customer → Requests.")
 else:
+    render_progress(status)
     st.json(status)
 
 st.divider()
@@ -88,20 +128,49 @@ st.divider()
 run_col, poll_col = st.columns([1, 2])
 
 with run_col:
+    incremental = st.checkbox(
+        "Incremental",
+        value=True,
+        help="Переиспользовать результаты прошлого QC, считать только новые изображения.",
+    )
+    force = st.checkbox(
+        "Force",
+        value=False,
+        help="Запустить QC, даже если изображения и настройки не менялись с прошлого run.",
+    )
     if st.button("Run QC", type="primary", disabled=not request_id):
 
         def do_run_qc():
             if settings.use_mock:
                 return {"status": "mocked"}
-            return client().run_qc(request_id)
+            return client().run_qc(request_id, incremental=incremental, force=force)
 
         resp = api_call("Run QC", do_run_qc, spinner="Starting QC...", show_payload=True)
         if resp is not None:
             # запомним qc_run_id, чтобы UI понимал, что есть активный запуск
             if isinstance(resp, dict) and "qc_run_id" in resp:
                 st.session_state["last_qc_run_id"] = resp["qc_run_id"]
-            st.success("QC started.")
-            st.session_state["qc_autopoll"] = True
+            if isinstance(resp, dict) and resp.get("skipped"):
+                # ничего не менялось — бэкенд вернул прошлый done run
+                st.info("Nothing changed since the last QC run — showing its results.")
+            else:
+                st.success("QC started.")
+                st.session_state["qc_autopoll"] = True
+                safe_rerun()
+
+    qc_active = (status or {}).get("status") in ("queued", "running")
+    if st.button("Cancel QC", disabled=not request_id or not qc_active):
+
+        def do_cancel_qc():
+            if settings.use_mock:
+                return {"status": "cancelled"}
+            return client().cancel_qc(request_id)
+
+        resp = api_call("Cancel QC", do_cancel_qc, spinner="Cancelling QC...", show_payload=True)
+        if resp is not None:
+            st.session_state["qc_autopoll"] = False
+            st.session_state.pop("qc_poll_started_ts", None)
+            st.success("QC cancelled.")
             safe_rerun()
 
 with poll_col:
@@ -123,6 +192,7 @@ with poll_col:
 
         # обновим статус
         status2 = api_call("QC status", fetch_status, spinner=None, show_payload=False) or {}
+        render_progress(status2)
         st.json(status2)
 
         st_status = (status2 or {}).get("status")
@@ -157,50 +227,24 @@ if load_btn or auto_load:
     if rows is None:
         st.stop()
 
-    df = pd.DataFrame(rows)
-    if df.empty:
-        st.info("No results yet. If QC is still running — keep polling.")
-        st.stop()
-
-    # Normalize expected columns
-    if "image_id" not in df.columns:
-        df["image_id"] = df.index.astype(int)
-    if "duplicate_score" not in df.columns:
-        df["duplicate_score"] = 0.0
-    if "ai_generated_score" not in df.columns:
-        df["ai_generated_score"] = 0.0
-
-    df["is_duplicate"] = df["duplicate_score"] >= dup_thr
-    df["is_ai"] = df["ai_generated_score"] >= ai_thr
-    df["is_flagged"] = df["is_duplicate"] | df["is_ai"]
-
-    total = len(df)
-    flagged = int(df["is_flagged"].sum())
-    dup_cnt = int(df["is_duplicate"].sum())
-    ai_cnt = int(df["is_ai"].sum())
+    summary = api_call("QC summary", fetch_summary, spinner=None, show_payload=False) or {}
 
     m1, m2, m3, m4 = st.columns(4)
-    m1.metric("Total", total)
-    m2.metric("Flagged", flagged)
-    m3.metric("Duplicates", dup_cnt)
-    m4.metric("AI-generated", ai_cnt)
-
-    # Filters
-    out = df.copy()
-    if only_flagged:
-        out = out[out["is_flagged"]]
-    if only_duplicates:
-        out = out[out["is_duplicate"]]
-    if only_ai:
-        out = out[out["is_ai"]]
-
-    # Sort
-    if sort_by in out.columns:
-        out = out.sort_values(by=sort_by, ascending=not sort_desc)
-
-    # Top N
-    if top_n and top_n > 0:
-        out = out.head(int(top_n))
+    m1.metric("Total", summary.get("total", 0))
+    m2.metric("Flagged", summary.get("flagged", 0))
+    m3.metric("Duplicates", summary.get("duplicates", 0))
+    m4.metric("AI-generated", summary.get("ai_generated", 0))
+
+    # фильтры, сортировка и top N уже применены бэкендом
+    out = pd.DataFrame(rows)
+    if out.empty:
+        st.info("No results for current filters. If QC is still running — keep polling.")
+        st.stop()
+
+    if "duplicate_score" in out.columns:
+        out["is_duplicate"] = out["duplicate_score"] >= dup_thr
+    if "ai_generated_score" in out.columns:
+        out["is_ai"] = out["ai_generated_score"] >= ai_thr
 
     st.dataframe(out, use_container_width=True)
 
@@ -34,13 +34,143 @@ st.info(
 st.divider()
 
 # --- Actions ---
+export_mode = st.radio(
+    "Mode",
+    options=["full", "delta"],
+    horizontal=True,
+    key="export_mode",
+    help="delta — только изображения, изменившиеся с последнего готового export "
+    "(разметка, QC, новые). Base + deltas — через Manifest или Compact.",
+)
+
+layout = st.radio(
+    "Layout",
+    options=["file", "dataset", "webdataset"],
+    horizontal=True,
+    key="export_layout",
+    help="dataset — Hive-partitioned parquet файлы (по label или train/val/test split) "
+    "с _metadata; webdataset — tar shards с самими картинками и index.parquet. "
+    "Скачивание — через Manifest.",
+)
+dataset_options: dict = {}
+if layout == "dataset":
+    d1, d2 = st.columns(2)
+    with d1:
+        dataset_options["partition_by"] = st.selectbox(
+            "Partition by", ["label", "split"], key="export_partition_by"
+        )
+    with d2:
+        dataset_options["target_file_mb"] = st.number_input(
+            "Target file size, MB", min_value=1, value=256, step=64, key="export_target_mb"
+        )
+elif layout == "webdataset":
+    dataset_options["shard_mb"] = st.number_input(
+        "Shard size, MB", min_value=1, value=1024, step=256, key="export_shard_mb"
+    )
+
+if layout != "webdataset":
+    with st.expander("Parquet encoding"):
+        e1, e2, e3 = st.columns(3)
+        with e1:
+            codec = st.selectbox(
+                "Codec", ["zstd", "snappy", "lz4", "gzip", "none"], key="export_codec"
+            )
+            dataset_options["codec"] = codec
+            if codec in ("zstd", "gzip"):
+                level = st.number_input(
+                    "Compression level (0 — по умолчанию)",
+                    min_value=0,
+                    max_value=22 if codec == "zstd" else 9,
+                    value=0,
+                    key="export_compression_level",
+                )
+                dataset_options["compression_level"] = level or None
+        with e2:
+            dataset_options["row_group_rows"] = st.number_input(
+                "Row group, rows", min_value=1000, value=50000, step=10000, key="export_rg_rows"
+            )
+        with e3:
+            dataset_options["dictionary"] = st.checkbox(
+                "Dictionary encoding", value=True, key="export_dictionary"
+            )
+            dataset_options["statistics"] = st.checkbox(
+                "Column statistics", value=True, key="export_statistics"
+            )
+            dataset_options["bloom_filter"] = st.checkbox(
+                "Bloom filters (image_id, sha256)", value=False, key="export_bloom"
+            )
+
+if export_mode == "full":
+    with st.expander("Split & sampling"):
+        split_by_partition = dataset_options.get("partition_by") == "split"
+        s1, s2, s3 = st.columns(3)
+        with s1:
+            add_split = st.checkbox(
+                "Split column (train/val/test)",
+                value=False,
+                key="export_split",
+                help="Детерминированный hash: тот же файл — всегда тот же split; "
+                "дубли по QC — в одном split.",
+            )
+            stratify = st.checkbox(
+                "Stratify by labels",
+                value=False,
+                key="export_stratify",
+                help="Точные доли split в каждом классе (наборе меток).",
+            )
+        with s2:
+            ratios = st.text_input(
+                "Ratios", value="train=0.8,val=0.1,test=0.1", key="export_split_ratios"
+            )
+            split_key = st.selectbox("Split key", ["sha256", "image_id"], key="export_split_key")
+            split_seed = st.text_input("Split seed", value="", key="export_split_seed")
+        with s3:
+            max_per_class = st.number_input(
+                "Max images per class (0 — без лимита)",
+                min_value=0,
+                value=0,
+                key="export_max_per_class",
+            )
+            sample_fraction = st.number_input(
+                "Sample fraction",
+                min_value=0.01,
+                max_value=1.0,
+                value=1.0,
+                step=0.05,
+                key="export_sample_fraction",
+            )
+        if add_split or split_by_partition:
+            dataset_options.update(
+                split=add_split or None,
+                stratify=stratify or None,
+                split_ratios=ratios or None,
+                split_key=split_key if split_key != "sha256" else None,
+                split_seed=split_seed or None,
+            )
+        dataset_options["max_per_class"] = max_per_class or None
+        dataset_options["sample_fraction"] = sample_fraction if sample_fraction < 1 else None
+
+force_rebuild = st.checkbox(
+    "Force rebuild",
+    value=False,
+    key="export_force",
+    help="Без галочки: если данные и опции не менялись с готового export, "
+    "возвращается он, без новой сборки.",
+)
+
 c1, c2, c3 = st.columns(3)
 
 with c1:
     if st.button("Build parquet", type="primary", key="build_parquet"):
 
         def do_build():
-            return client().export_build_parquet(selected_request_id)
+            return client().export_build_parquet(
+                selected_request_id,
+                mode=export_mode,
+                layout=layout,
+                force=force_rebuild or None,
+                **dataset_options,
+            )
 
         resp = api_call(
             "Build parquet",
@@ -49,7 +179,23 @@ with c1:
             show_payload=True,
         )
         if resp is not None:
-            st.success("Export job started / parquet built.")
+            # большие заявки собираются в фоне: status queued -> Refresh status
+            st.session_state["export_status_cache"] = resp
+            if resp.get("reused"):
+                st.success(f"Inputs unchanged: reused export #{resp.get('export_id')}.")
+            elif resp.get("status") == "done":
+                st.success("Parquet built.")
+            else:
+                st.success("Export job queued. Use Refresh status to follow it.")
+
+    if st.button("Compact deltas", key="compact_export"):
+
+        def do_compact():
+            return client().export_compact(selected_request_id)
+
+        resp = api_call("Compact export", do_compact, spinner="Compacting...", show_payload=True)
+        if resp is not None:
+            st.session_state["export_status_cache"] = resp
 
 with c2:
     if st.button("Refresh status", key="refresh_status"):
@@ -66,6 +212,16 @@ with c2:
         if status is not None:
             st.session_state["export_status_cache"] = status
 
+    if st.button("Cancel export", key="cancel_export"):
+
+        def do_cancel():
+            return client().export_cancel(selected_request_id)
+
+        resp = api_call("Cancel export", do_cancel, spinner="Cancelling...", show_payload=True)
+        if resp is not None:
+            st.session_state.pop("export_status_cache", None)
+            st.success("Export cancelled.")
+
 with c3:
     # Скачивание — делаем отдельной кнопкой, чтобы не путать со статусом
     if st.button("Prepare download", key="prepare_download"):
@@ -83,6 +239,31 @@ with c3:
             st.session_state["export_download_bytes"] = content
             st.success("Parquet downloaded into UI memory. Use Download button below.")
 
+    # небольшие заявки: parquet прямо из API, без сборки export в S3
+    if st.button("Stream parquet", key="stream_parquet"):
+
+        def do_stream():
+            return client().export_stream_parquet(selected_request_id)
+
+        content = api_call(
+            "Stream parquet",
+            do_stream,
+            spinner="Streaming parquet...",
+            show_payload=False,
+        )
+        if content:
+            st.session_state["export_download_bytes"] = content
+            st.success("Parquet streamed into UI memory. Use Download button below.")
+
+    if st.button("Manifest", key="export_manifest"):
+
+        def do_manifest():
+            return client().export_manifest(selected_request_id)
+
+        manifest = api_call("Load manifest", do_manifest, spinner="Loading manifest...")
+        if manifest is not None:
+            st.session_state["export_manifest_cache"] = manifest
+
 st.divider()
 
 # --- Status view ---
@@ -93,6 +274,22 @@ if status:
 else:
     st.caption("Нажмите Refresh status, чтобы увидеть состояние экспорта.")
 
+manifest = st.session_state.get("export_manifest_cache")
+if manifest:
+    st.subheader("Export manifest")
+    st.caption(manifest.get("merge", ""))
+    st.dataframe(
+        [
+            {
+                k: f.get(k)
+                for k in ("export_id", "kind", "path", "rows", "bytes", "created_at", "url")
+                if k in f
+            }
+            for f in manifest.get("files", [])
+        ],
+        width="stretch",
+    )
+
 # --- Download button (actual file download in browser) ---
 data = st.session_state.get("export_download_bytes")
 if data:
@@ -107,5 +304,6 @@ if data:
     )
 else:
     st.caption(
-        "Нажмите Prepare download, чтобы загрузить parquet байты и активировать Download кнопку."
+        "Нажмите Prepare download (или Stream parquet для небольших заявок), "
+        "чтобы загрузить parquet байты и активировать Download кнопку."
     )